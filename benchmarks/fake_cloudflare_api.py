@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+
+#import libraries needed in this program
+#only the Python standard library is used, so the fake API can be run anywhere without installing anything
+import ast, gzip, json, os, random, sys, threading, time, argparse, http.server
+from datetime import datetime
+from urllib.parse import urlparse, parse_qs
+
+#the path of the downloader, where the log fields are read from
+downloader_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "cf_logs_downloader.py")
+
+#the placeholder of the timestamp in the template of a log record, replaced by the actual timestamp of each record
+TIMESTAMP_PLACEHOLDER = '"__TIMESTAMP__"'
+
+#the size of each chunk written to the connection while sending a response body
+WRITE_CHUNK_SIZE = 65536
+
+'''
+This method reads the list of HTTP and Cloudflare Access log fields (http_fields and access_fields) from the downloader, without running it.
+This keeps the schema of the synthetic logs the same as the one requested by the downloader.
+'''
+def read_log_fields(path=downloader_path):
+    with open(path, "r", encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+
+    log_fields = {}
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name) and node.targets[0].id in ("http_fields", "access_fields"):
+            log_fields[node.targets[0].id] = ast.literal_eval(node.value)
+    return log_fields.get("http_fields", []), log_fields.get("access_fields", [])
+
+'''
+This method generates a plausible value for a log field, based on the name of the field.
+Most of the values are picked from a small set of values, so that the logs compress about as well as real logs do.
+Timestamp fields are filled with a placeholder, which is replaced by the timestamp of each record later (see LogGenerator).
+'''
+def generate_field_value(field, rng):
+    if field.endswith("Timestamp") or field in ("created_at", "when"):
+        return "__TIMESTAMP__"
+    if field.endswith(("Bytes", "Time", "Count")):
+        return rng.randint(0, 65535)
+    if field.endswith(("Status", "ASN", "Port", "ColoID", "Score")):
+        return rng.choice([0, 1, 99, 200, 301, 404, 13335, 443])
+    if field in ("CacheTieredFill", "WorkerSubrequest", "allowed", "temporary_access_approvers"):
+        return rng.random() < 0.5
+    if field.startswith("FirewallMatches"):
+        return [format(rng.getrandbits(64), "x")] if rng.random() < 0.2 else []
+    if field == "RequestHeaders":
+        return {}
+    if field.endswith("IP") or field == "ip_address":
+        return "203.0.113." + str(rng.randint(1, 254))
+    if field in ("RayID", "ParentRayID", "ray_id"):
+        return format(rng.getrandbits(64), "016x")
+    if field in ("ClientRequestPath", "ClientRequestURI"):
+        return rng.choice(["/", "/index.html", "/api/v1/items", "/static/app.js", "/static/style.css", "/images/logo.png"])
+    if field == "ClientRequestUserAgent":
+        return "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/" + str(rng.randint(110, 120)) + ".0.0.0 Safari/537.36"
+    return rng.choice(["", "none", "unknown", "example.com", "www.example.com", "GET", "HTTP/2", "TLSv1.3", "US", "SG"])
+
+'''
+This class generates the synthetic logs returned by the fake API.
+The records are rendered from a fixed set of templates (JSON with a placeholder for the timestamp), so that generating the logs costs as little as possible and does not slow down the benchmark.
+The timestamps of the records are spread evenly across the requested log range.
+'''
+class LogGenerator:
+    def __init__(self, seed=0, templates=256):
+        self.rng = random.Random(seed)
+        self.num_templates = templates
+        self.templates = {}
+        self.lock = threading.Lock()
+
+    #render the templates of the given fields (once), split at the placeholder of the timestamp
+    def get_templates(self, fields):
+        key = tuple(fields)
+        with self.lock:
+            if key not in self.templates:
+                self.templates[key] = [json.dumps(self.generate_record(fields)).split(TIMESTAMP_PLACEHOLDER) for i in range(self.num_templates)]
+            return self.templates[key]
+
+    def generate_record(self, fields):
+        if fields == ("audit",):
+            #Cloudflare Audit logs are nested objects instead of flat records
+            return {"id": format(self.rng.getrandbits(128), "032x"), "when": "__TIMESTAMP__", "action": {"type": self.rng.choice(["login", "token_create", "rec_set"]), "result": True}, "actor": {"email": "user@example.com", "id": format(self.rng.getrandbits(128), "032x"), "ip": generate_field_value("ip_address", self.rng), "type": "user"}, "interface": "UI", "metadata": {}, "newValue": "", "oldValue": "", "owner": {"id": format(self.rng.getrandbits(128), "032x")}, "resource": {"id": format(self.rng.getrandbits(128), "032x"), "type": "account"}}
+        return {field: generate_field_value(field, self.rng) for field in fields}
+
+    #render the records from first to last (exclusive) of a log range with the given number of records, as lines of JSON
+    def render(self, fields, start, end, num_records, first=0, last=None, timestamps="rfc3339"):
+        templates = self.get_templates(fields)
+        last = num_records if last is None else min(last, num_records)
+        step = (end - start) / max(num_records, 1)
+        lines = []
+        for i in range(first, last):
+            timestamp = start + step * i
+            if timestamps == "unix":
+                timestamp = str(int(timestamp.timestamp()))
+            elif timestamps == "unixnano":
+                timestamp = str(int(timestamp.timestamp() * 1000000000))
+            else:
+                timestamp = '"' + timestamp.strftime("%Y-%m-%dT%H:%M:%S") + "Z" + '"'
+            lines.append(timestamp.join(templates[i % len(templates)]))
+        return lines
+
+'''
+This class is a local stand-in for the Cloudflare API, which answers the Logpull API (HTTP logs), Cloudflare Access logs and Audit logs endpoints with synthetic logs.
+The size of the logs, the latency of each response and the rate of errors and HTTP 429 responses can be configured, and the requests are counted in stats.
+'''
+class FakeCloudflareAPI(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address=("127.0.0.1", 0), http_records=10000, access_records=1000, audit_records=1000, latency=0.0, error_rate=0.0, rate_limit_rate=0.0, retry_after=1, seed=0):
+        super().__init__(address, FakeCloudflareAPIHandler)
+        self.http_fields, self.access_fields = read_log_fields()
+        self.http_records = http_records
+        self.access_records = access_records
+        self.audit_records = audit_records
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.generator = LogGenerator(seed)
+        self.rng = random.Random(seed)
+        self.stats_lock = threading.Lock()
+        self.stats = {'requests': 0, 'errors': 0, 'rate_limited': 0, 'bytes_sent': 0}
+
+    #the base URL to be configured as api_url of the downloader
+    @property
+    def api_url(self):
+        return "http://" + self.server_address[0] + ":" + str(self.server_address[1]) + "/client/v4"
+
+    def count(self, key, value=1):
+        with self.stats_lock:
+            self.stats[key] += value
+
+    #decide whether a request should fail (error | rate_limited), or None if it should succeed
+    def draw_failure(self):
+        with self.stats_lock:
+            value = self.rng.random()
+        if value < self.rate_limit_rate:
+            return "rate_limited"
+        if value < self.rate_limit_rate + self.error_rate:
+            return "error"
+        return None
+
+    #start the fake API in a separate thread, and return the thread
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+'''
+This class handles each request to the fake API. Every response is sent with Content-Length, so that the connection can be kept alive and reused by the downloader.
+'''
+class FakeCloudflareAPIHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        server.count('requests')
+        url = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        parts = url.path.strip("/").split("/")
+
+        if server.latency > 0:
+            time.sleep(server.latency)
+
+        #the same paths as Cloudflare API, after the /client/v4 prefix
+        if len(parts) == 6 and parts[2] == "zones" and parts[4:] == ["logs", "received"]:
+            handler = self.send_http_logs
+        elif len(parts) == 7 and parts[2] == "accounts" and parts[4:] == ["access", "logs", "access_requests"]:
+            handler = self.send_access_logs
+        elif len(parts) == 5 and parts[2] == "accounts" and parts[4] == "audit_logs":
+            handler = self.send_audit_logs
+        else:
+            return self.send_json(404, {"success": False, "errors": [{"code": 7003, "message": "No route for the URI"}], "messages": [], "result": None})
+
+        #the credential check of the downloader does not specify a log range, and is never failed on purpose
+        if "start" not in query and "since" not in query:
+            return handler(query)
+
+        failure = server.draw_failure()
+        if failure == "rate_limited":
+            server.count('rate_limited')
+            return self.send_json(429, {"success": False, "errors": [{"code": 10000, "message": "Rate limited"}], "messages": [], "result": None}, {"Retry-After": str(server.retry_after)})
+        if failure == "error":
+            server.count('errors')
+            return self.send_json(500, {"success": False, "errors": [{"code": 10001, "message": "Injected error"}], "messages": [], "result": None})
+        return handler(query)
+
+    def send_body(self, status, body, headers=None):
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        #send the body chunk by chunk, like a real server streaming a large response
+        view = memoryview(body)
+        for i in range(0, len(body), WRITE_CHUNK_SIZE):
+            self.wfile.write(view[i:i + WRITE_CHUNK_SIZE])
+        self.server.count('bytes_sent', len(body))
+
+    def send_json(self, status, response, headers=None):
+        self.send_body(status, json.dumps(response).encode(), dict(headers or {}, **{"Content-Type": "application/json"}))
+
+    def send_http_logs(self, query):
+        if "start" not in query:
+            #Cloudflare Logpull API returns a plain text error for a request without a log range, which the downloader treats as a valid credential
+            return self.send_body(400, b"bad query: error parsing time: missing start", {"Content-Type": "text/plain"})
+        start, end = parse_time(query["start"]), parse_time(query["end"])
+        fields = tuple((query.get("fields") or ",".join(self.server.http_fields)).split(","))
+        #the number of records scales with the length of the log range (http_records per minute) and the sample rate
+        num_records = int(self.server.http_records * (end - start).total_seconds() / 60 * float(query.get("sample", 1)))
+        lines = self.server.generator.render(fields, start, end, num_records, timestamps=query.get("timestamps", "rfc3339"))
+        body = gzip.compress(("\n".join(lines) + "\n").encode() if lines else b"", compresslevel=1)
+        self.send_body(200, body, {"Content-Type": "application/json", "Content-Encoding": "gzip"})
+
+    def send_access_logs(self, query):
+        self.send_log_page(query, tuple(self.server.access_fields), self.server.access_records, "until")
+
+    def send_audit_logs(self, query):
+        self.send_log_page(query, ("audit",), self.server.audit_records, "before")
+
+    #send one page of Cloudflare Access or Audit logs, with the total number of records so that the rest of the pages can be requested concurrently
+    def send_log_page(self, query, fields, records_per_minute, end_key):
+        per_page = int(query.get("per_page", 25))
+        page = int(query.get("page", 1))
+        if "since" not in query:
+            return self.send_json(200, {"success": True, "errors": [], "messages": [], "result": [], "result_info": {"page": 1, "per_page": per_page, "count": 0, "total_count": 0}})
+        start, end = parse_time(query["since"]), parse_time(query[end_key])
+        #Cloudflare Access and Audit logs include the end time, thus 1 second is added back
+        num_records = int(records_per_minute * ((end - start).total_seconds() + 1) / 60)
+        lines = self.server.generator.render(fields, start, end, num_records, (page - 1) * per_page, page * per_page)
+        body = ('{"success": true, "errors": [], "messages": [], "result": [' + ",".join(lines) + '], "result_info": ' + json.dumps({"page": page, "per_page": per_page, "count": len(lines), "total_count": num_records}) + "}").encode()
+        self.send_body(200, body, {"Content-Type": "application/json"})
+
+    #do not print every request on the terminal
+    def log_message(self, format, *args):
+        pass
+
+'''
+This method converts the time in the request (RFC 3339 format, in UTC timezone) into a datetime object.
+'''
+def parse_time(value):
+    return datetime.strptime(value.replace("Z", "")[:19], "%Y-%m-%dT%H:%M:%S")
+
+#run the fake API on its own, e.g. to try the downloader against it by hand
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="A local fake Cloudflare API serving synthetic HTTP, Cloudflare Access and Audit logs, for benchmarking cf-logs-downloader.")
+    parser.add_argument("--address", default="127.0.0.1", help="Specify the address to listen on. Default is 127.0.0.1.")
+    parser.add_argument("--port", default=8080, type=int, help="Specify the port to listen on. Default is 8080.")
+    parser.add_argument("--http-records", default=10000, type=int, help="Specify the number of HTTP log records per minute of log range. Default is 10000.")
+    parser.add_argument("--access-records", default=1000, type=int, help="Specify the number of Cloudflare Access log records per minute of log range. Default is 1000.")
+    parser.add_argument("--audit-records", default=1000, type=int, help="Specify the number of Audit log records per minute of log range. Default is 1000.")
+    parser.add_argument("--latency", default=0.0, type=float, help="Specify the delay (in seconds) before each response. Default is 0.")
+    parser.add_argument("--error-rate", default=0.0, type=float, help="Specify the fraction of logpull requests answered with HTTP 500. Default is 0.")
+    parser.add_argument("--rate-limit-rate", default=0.0, type=float, help="Specify the fraction of logpull requests answered with HTTP 429. Default is 0.")
+    parser.add_argument("--retry-after", default=1, type=int, help="Specify the Retry-After header (in seconds) of HTTP 429 responses. Default is 1.")
+    args = parser.parse_args()
+
+    server = FakeCloudflareAPI((args.address, args.port), args.http_records, args.access_records, args.audit_records, args.latency, args.error_rate, args.rate_limit_rate, args.retry_after)
+    print("Fake Cloudflare API listening. Set api_url to " + server.api_url + " in the configuration file.")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("")
+        print(json.dumps(server.stats))
+        sys.exit(0)
@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+
+#import libraries needed in this program
+#the downloader is run as a separate process, against the fake Cloudflare API running in this process
+import json, os, sys, time, signal, shutil, tempfile, argparse, subprocess
+from datetime import datetime, timedelta
+from fake_cloudflare_api import FakeCloudflareAPI
+
+#the path of the downloader to benchmark
+downloader_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "cf_logs_downloader.py")
+
+#the scenarios which can be run, in the order they are run by default
+SCENARIOS = ("backfill", "queue", "scheduler")
+
+#the results compared against a baseline, and whether a higher value is better
+COMPARED_RESULTS = {'windows_per_second': True, 'mb_per_second': True, 'peak_rss_mb': False, 'p99_window_seconds': False}
+
+'''
+This method writes the configuration file of the downloader for a scenario, pointing the downloader to the fake API and storing the logs in the working folder of the scenario.
+The configuration file is written as JSON, which can be read as YAML as well.
+'''
+def write_config(workdir, server, args, extra_config=None):
+    config = {
+        "type": args.log_type,
+        "cf_zone_id": "0123456789abcdef0123456789abcdef",
+        "cf_account_id": "0123456789abcdef0123456789abcdef",
+        "cf_token": "benchmark",
+        "api_url": server.api_url,
+        "workers": args.workers,
+        "pool_size": max(args.workers, 10),
+        "backfill_parallelism": args.workers,
+        "queue_concurrency": args.workers,
+        "api_rate_limit": args.api_rate_limit,
+        "api_rate_burst": max(int(args.api_rate_limit), 1),
+        "retry_backoff_base": 1,
+        "retry_backoff_max": 5,
+        "log_dest": [{"name": "benchmark" + (str(i + 1) if i else ""), "path": os.path.join(workdir, "logs" + (str(i + 1) if i else "")), "prefix": "cf_logs", "no_organize": False, "no_gzip": args.no_gzip} for i in range(args.log_dests)]
+    }
+    config.update(extra_config or {})
+    config_path = os.path.join(workdir, "config.yml")
+    with open(config_path, "w") as f:
+        json.dump(config, f, indent=2)
+    return config_path
+
+'''
+This method starts the downloader with the given parameters, with a state folder of its own so that the queue and the activity logs of the running service will not be touched.
+The output of the downloader is written to console.log in the working folder.
+'''
+def start_downloader(workdir, config_path, extra_args=None):
+    env = dict(os.environ, CF_LOGS_DOWNLOADER_STATE_DIR=os.path.join(workdir, "state"))
+    console = open(os.path.join(workdir, "console.log"), "wb")
+    return subprocess.Popen([sys.executable, downloader_path, "--config", config_path] + (extra_args or []), stdout=console, stderr=subprocess.STDOUT, env=env)
+
+'''
+This method returns the peak memory usage (resident set size, in MB) of a running process so far, or None if it's not available (e.g. not on Linux).
+Unlike ru_maxrss, VmHWM is reset when the downloader is started, so the memory of this process (copied while starting the downloader) is never counted.
+'''
+def get_peak_rss_mb(pid):
+    try:
+        with open("/proc/" + str(pid) + "/status", "r") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+'''
+This method waits for the downloader to exit, and returns the exit code and the peak memory usage (resident set size, in MB) of the downloader.
+If timeout (in seconds) is given, the downloader will be killed once the timeout is reached.
+'''
+def wait_downloader(process, timeout=None):
+    deadline = time.time() + timeout if timeout is not None else None
+    peak_rss_mb = None
+    while True:
+        #os.wait4() returns the resource usage of the process itself, instead of all the child processes of this process
+        pid, status, rusage = os.wait4(process.pid, os.WNOHANG)
+        if pid != 0:
+            process.returncode = os.waitstatus_to_exitcode(status)
+            #ru_maxrss (in kilobytes on Linux) is only used if VmHWM is not available
+            return process.returncode, peak_rss_mb if peak_rss_mb is not None else rusage.ru_maxrss / 1024
+        peak_rss_mb = get_peak_rss_mb(process.pid) or peak_rss_mb
+        if deadline is not None and time.time() > deadline:
+            process.kill()
+            deadline = None
+        time.sleep(0.05)
+
+'''
+This method stops a downloader running in the background gracefully (SIGTERM), and kills it if it takes longer than grace_period seconds to exit.
+'''
+def stop_downloader(process, grace_period=60):
+    if process.poll() is None:
+        process.send_signal(signal.SIGTERM)
+    return wait_downloader(process, grace_period)
+
+'''
+This method reads the records of the logpull windows written by the downloader (windows.log in the state folder).
+'''
+def read_window_records(workdir):
+    records = []
+    path = os.path.join(workdir, "state", "windows.log")
+    if not os.path.exists(path):
+        return records
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                #the last line may be written partially if the downloader was killed
+                pass
+    return records
+
+'''
+This method waits until the downloader has written at least count records that match the condition, or until the timeout (in seconds) is reached.
+'''
+def wait_window_records(workdir, process, count, condition, timeout):
+    deadline = time.time() + timeout
+    while time.time() < deadline and process.poll() is None:
+        if len([r for r in read_window_records(workdir) if condition(r)]) >= count:
+            return True
+        time.sleep(0.5)
+    return False
+
+'''
+This method returns the value at the given percentile (0 to 100) of a list of values, using the nearest-rank method.
+'''
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[max(0, min(len(values) - 1, int(round(p / 100 * len(values) + 0.5)) - 1))]
+
+'''
+This method summarizes the records of the logpull windows of a scenario.
+The throughput is calculated over the time between the start of the first window and the end of the last window, so that the start-up time of the downloader is excluded.
+'''
+def summarize(scenario, args, records, peak_rss_mb, exit_code, server_stats):
+    pulled = [r for r in records if r['result'] == "pulled"]
+    failed = [r for r in records if r['result'] == "failed"]
+    if records:
+        #the time of each record is when the window ended, and total is how long the window took
+        ended = [datetime.fromisoformat(r['time']).timestamp() for r in records]
+        started = [end - r['timings']['total'] for end, r in zip(ended, records)]
+        elapsed = max(max(ended) - min(started), 0.001)
+    else:
+        elapsed = None
+    bytes_downloaded = sum(r.get('bytes_downloaded') or 0 for r in pulled)
+    window_seconds = [r['timings']['total'] for r in pulled]
+
+    return {
+        'scenario': scenario,
+        'log_type': args.log_type,
+        'engine': args.engine if scenario == "scheduler" else "thread",
+        'exit_code': exit_code,
+        'windows_pulled': len(pulled),
+        'windows_failed': len(failed),
+        'elapsed_seconds': round(elapsed, 3) if elapsed else None,
+        'windows_per_second': round(len(pulled) / elapsed, 2) if elapsed else None,
+        'mb_per_second': round(bytes_downloaded / 1048576 / elapsed, 2) if elapsed else None,
+        'records': sum(r.get('records') or 0 for r in pulled),
+        'peak_rss_mb': round(peak_rss_mb, 1),
+        'p50_window_seconds': round(percentile(window_seconds, 50), 3) if window_seconds else None,
+        'p99_window_seconds': round(percentile(window_seconds, 99), 3) if window_seconds else None,
+        'requests': server_stats['requests'],
+        'errors_injected': server_stats['errors'],
+        'rate_limited_injected': server_stats['rate_limited']
+    }
+
+'''
+This scenario pulls a range of logs for one time (--one-time), split into windows of window_seconds each.
+It drives logs_thread() through backfill(), with up to workers windows pulled concurrently.
+'''
+def run_backfill(workdir, server, args):
+    config_path = write_config(workdir, server, args, {"backfill_chunk": args.window_seconds})
+    #the log range must end at least 1 minute earlier than now for HTTP logs
+    end = datetime.utcnow().replace(second=0, microsecond=0) - timedelta(minutes=5)
+    start = end - timedelta(seconds=args.window_seconds * args.windows)
+    process = start_downloader(workdir, config_path, ["--one-time", "--start-time", start.strftime("%Y-%m-%dT%H:%M:%SZ"), "--end-time", end.strftime("%Y-%m-%dT%H:%M:%SZ")])
+    exit_code, peak_rss_mb = wait_downloader(process, args.timeout)
+    return read_window_records(workdir), peak_rss_mb, exit_code
+
+'''
+This scenario fills the queue with windows failed before, then lets the downloader retry them.
+It drives queue_thread() with up to workers tasks retried concurrently. The interval is set to 1 hour, so that the scheduler only pulls one window, which is not counted.
+Filling the queue requires persistqueue library, same as the downloader.
+'''
+def run_queue(workdir, server, args):
+    import persistqueue
+
+    config_path = write_config(workdir, server, args, {"interval": 3600})
+    queue = persistqueue.SQLiteQueue(os.path.join(workdir, "state", "queue") + "/", auto_commit=True, multithreading=True)
+    end = datetime.utcnow().replace(second=0, microsecond=0) - timedelta(minutes=5)
+    for i in range(args.windows, 0, -1):
+        log_start_time_utc = end - timedelta(seconds=args.window_seconds * i)
+        #Cloudflare Access & Audit logs do not exclude the end time, thus 1 second is subtracted (same as the scheduler)
+        log_end_time_utc = log_start_time_utc + timedelta(seconds=args.window_seconds - (0 if args.log_type == "http" else 1))
+        queue.put({'folder_time': log_start_time_utc, 'log_start_time_utc': log_start_time_utc, 'log_end_time_utc': log_end_time_utc, 'log_type': args.log_type, 'reason': 'Benchmark', 'attempts': 0, 'next_attempt_utc': datetime.utcnow()})
+    del queue
+
+    process = start_downloader(workdir, config_path)
+    wait_window_records(workdir, process, args.windows, lambda r: r['retry'] is True and r['result'] == "pulled", args.timeout)
+    exit_code, peak_rss_mb = stop_downloader(process)
+    return [r for r in read_window_records(workdir) if r['retry'] is True], peak_rss_mb, exit_code
+
+'''
+This scenario runs the downloader as a service for duration seconds, with the given number of jobs, each pulling a window every interval seconds.
+It drives the scheduler and the workers (or the asyncio engine) with jobs / interval windows per second.
+'''
+def run_scheduler(workdir, server, args):
+    job_config = [{"name": "job" + str(i), "type": args.log_type, "cf_zone_id": "0123456789abcdef0123456789abcdef", "cf_account_id": "0123456789abcdef0123456789abcdef", "interval": args.interval} for i in range(args.jobs)]
+    config_path = write_config(workdir, server, args, {"jobs": job_config, "interval": args.interval, "engine": args.engine, "max_pending_windows": max(args.jobs * 2, 10)})
+    process = start_downloader(workdir, config_path)
+    #wait for the duration, unless the downloader exits by itself
+    deadline = time.time() + args.duration
+    while time.time() < deadline and process.poll() is None:
+        time.sleep(0.5)
+    exit_code, peak_rss_mb = stop_downloader(process)
+    return [r for r in read_window_records(workdir) if r['retry'] is False], peak_rss_mb, exit_code
+
+'''
+This method compares the results with a baseline saved before (--save), and returns the list of results which became worse by more than the tolerance (a fraction).
+Only the results of the same scenario, log type and engine are compared.
+'''
+def compare_results(results, baseline, tolerance):
+    regressions = []
+    baseline = {(r['scenario'], r.get('log_type'), r.get('engine')): r for r in baseline}
+    for result in results:
+        before = baseline.get((result['scenario'], result['log_type'], result['engine']))
+        if not before:
+            continue
+        for key, higher_is_better in COMPARED_RESULTS.items():
+            if not before.get(key) or result.get(key) is None:
+                continue
+            change = (result[key] - before[key]) / before[key]
+            if (change < -tolerance) if higher_is_better else (change > tolerance):
+                regressions.append(result['scenario'] + ": " + key + " " + str(before[key]) + " -> " + str(result[key]) + " (" + format(change * 100, "+.1f") + "%)")
+    return regressions
+
+'''
+This method prints the results as a table.
+'''
+def print_results(results):
+    columns = ["scenario", "windows_pulled", "windows_failed", "windows_per_second", "mb_per_second", "peak_rss_mb", "p50_window_seconds", "p99_window_seconds", "requests", "rate_limited_injected", "exit_code"]
+    widths = [max(len(c), max(len(str(r.get(c))) for r in results)) for c in columns]
+    print("  ".join(c.ljust(w) for c, w in zip(columns, widths)))
+    for r in results:
+        print("  ".join(str(r.get(c)).ljust(w) for c, w in zip(columns, widths)))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark cf-logs-downloader against a local fake Cloudflare API, and report windows/s, MB/s, peak RSS and p99 window latency of each scenario.")
+    parser.add_argument("--scenario", choices=SCENARIOS + ("all",), default="all", help="Specify the scenario to run. Default is all.")
+    parser.add_argument("--log-type", choices=("http", "access", "audit"), default="http", help="Specify the log type to pull. Default is http.")
+    parser.add_argument("--engine", choices=("thread", "asyncio"), default="thread", help="Specify the engine of the downloader for the scheduler scenario. Default is thread.")
+    parser.add_argument("--workers", type=int, default=4, help="Specify the number of windows pulled concurrently (workers, backfill_parallelism and queue_concurrency). Default is 4.")
+    parser.add_argument("--windows", type=int, default=60, help="Specify the number of windows of the backfill and queue scenarios. Default is 60.")
+    parser.add_argument("--window-seconds", type=int, default=60, help="Specify the length of each window (in seconds) of the backfill and queue scenarios. Default is 60.")
+    parser.add_argument("--jobs", type=int, default=10, help="Specify the number of jobs of the scheduler scenario. Default is 10.")
+    parser.add_argument("--interval", type=int, default=1, help="Specify the interval (in seconds) of each job of the scheduler scenario. Default is 1.")
+    parser.add_argument("--duration", type=int, default=30, help="Specify how long (in seconds) the scheduler scenario runs. Default is 30.")
+    parser.add_argument("--records", type=int, default=10000, help="Specify the number of log records per minute of log range returned by the fake API. Default is 10000.")
+    parser.add_argument("--latency", type=float, default=0.05, help="Specify the delay (in seconds) of each response of the fake API. Default is 0.05.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Specify the fraction of logpull requests answered with HTTP 500. Default is 0.")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Specify the fraction of logpull requests answered with HTTP 429. Default is 0.")
+    parser.add_argument("--api-rate-limit", type=float, default=1000, help="Specify api_rate_limit of the downloader. Default is 1000 requests per second.")
+    parser.add_argument("--no-gzip", action="store_true", help="Write the logs without gzip compression, which requires decompressing them.")
+    parser.add_argument("--log-dests", type=int, default=1, help="Specify the number of log destinations, all with the same settings in their own folder. Default is 1.")
+    parser.add_argument("--timeout", type=int, default=600, help="Specify the maximum time (in seconds) of the backfill and queue scenarios. Default is 600.")
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON instead of a table.")
+    parser.add_argument("--save", metavar="results.json", help="Save the results to a file, to be used as the baseline of --compare.")
+    parser.add_argument("--compare", metavar="results.json", help="Compare the results with a baseline, and exit with code 1 if any of them became worse by more than the tolerance.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Specify the tolerance of --compare as a fraction. Default is 0.2 (20%%).")
+    parser.add_argument("--keep", action="store_true", help="Keep the working folder of each scenario (logs, state and console output) for inspection.")
+    args = parser.parse_args()
+
+    results = []
+    for scenario in (SCENARIOS if args.scenario == "all" else (args.scenario,)):
+        workdir = tempfile.mkdtemp(prefix="cf_logs_benchmark_" + scenario + "_")
+        server = FakeCloudflareAPI(http_records=args.records, access_records=args.records, audit_records=args.records, latency=args.latency, error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate)
+        server.start()
+        try:
+            records, peak_rss_mb, exit_code = {"backfill": run_backfill, "queue": run_queue, "scheduler": run_scheduler}[scenario](workdir, server, args)
+            results.append(summarize(scenario, args, records, peak_rss_mb, exit_code, server.stats))
+        finally:
+            server.shutdown()
+            server.server_close()
+            if args.keep:
+                print("Working folder of scenario '" + scenario + "': " + workdir, file=sys.stderr)
+            else:
+                shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_results(results)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare, "r") as f:
+            regressions = compare_results(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print("Regression: " + regression, file=sys.stderr)
+        sys.exit(1 if regressions else 0)
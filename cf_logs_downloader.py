@@ -2,11 +2,44 @@
 
 #import libraries needed in this program
 #'requests' library needs to be installed first
-import requests, time, threading, os, json, logging, sys, argparse, logging.handlers, yaml, yschema, tempfile, signal, persistqueue
-from datetime import datetime, timedelta
+import requests, urllib3, time, threading, os, json, logging, sys, argparse, logging.handlers, yaml, yschema, tempfile, signal, persistqueue, zlib, random, heapq, asyncio, http.server, sqlite3, hashlib, re, hmac, operator, errno, socket, struct, fcntl, termios
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
 from pathlib import Path
-from shutil import copy2
-from gzip import decompress, compress
+from shutil import copy2, copyfile
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait as futures_wait, FIRST_COMPLETED
+from collections import deque
+from bisect import bisect_right
+
+#aiohttp is only required by the asyncio engine (engine: asyncio)
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+#zstandard is only required by the log destinations compressed with zstd (compression: zstd)
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+#orjson is optional. If it is installed, it is used to parse and serialize the log records (see record_loads() and record_dumps()), which is much faster than the json library
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+#pyarrow is only required by the log destinations which write Parquet files (format: parquet)
+try:
+    import pyarrow, pyarrow.parquet, pyarrow.compute
+except ImportError:
+    pyarrow = None
+
+#boto3 is only required by the log destinations in S3-compatible object storage (path: s3://bucket/prefix)
+try:
+    import boto3, botocore.config, botocore.exceptions
+except ImportError:
+    boto3 = None
 
 #specify version number of the program
 ver_num = "2.8.2"
@@ -14,8 +47,12 @@ ver_num = "2.8.2"
 #a flag to determine whether the user wants to exit the program, so can handle the program exit gracefully
 is_exit = False
 
-#determine how many logpull process are running
+#determine how many logpull process are running, and a lock to update it safely from multiple threads
 num_of_running_thread = 0
+thread_lock = threading.Lock()
+
+#determine how many bytes have been downloaded from Cloudflare API by all logpull process
+bytes_downloaded = 0
 
 #define the timestamp format that we supply to Cloudflare API
 timestamp_format = "rfc3339"
@@ -29,6 +66,181 @@ log_type = zone_id = account_id = api_token = start_time = end_time = fields = f
 #the default value for the interval between each logpull process
 interval = 60
 
+#the default number of records per page, and the maximum number of pages to request concurrently for Cloudflare Access and Audit logs
+page_size = 1000
+page_concurrency = 4
+
+#the default number of tasks in the queue to retry concurrently, which task to retry first (oldest | newest), and the base and maximum delay (in seconds) before retrying a failed task
+queue_concurrency = 2
+queue_order = "oldest"
+retry_backoff_base = 3
+retry_backoff_max = 3600
+
+#whether to coalesce the tasks in the queue with adjacent or overlapping log ranges into one request, the maximum number of log ranges to coalesce,
+#and whether to write the coalesced logs back to the logfile of each original log range (split) or to one combined logfile (combined)
+queue_coalesce = False
+coalesce_max_windows = 60
+coalesce_output = "split"
+
+#the field of the log records which tells the time of the record, used to split coalesced logs back to their original log ranges
+TIMESTAMP_FIELDS = {"access": "created_at", "audit": "when"}
+
+#how many tasks in the queue are retried per second recently, used to estimate the time to clear the queue
+queue_drain_rate = 0
+
+#how often (seconds) the queues are checked for the tasks put by another process (e.g. --find-gaps with --fill-gaps queue), see merge_due_heap(). Tasks are put into the queues and the heaps together under queue_lock.
+QUEUE_RESCAN_INTERVAL = 60
+queue_lock = threading.Lock()
+
+#the default number of logpull workers, the maximum number of logpull windows waiting for a worker, and what to do when there are too many windows waiting (block | merge | spill)
+workers = 4
+max_pending_windows = 10
+backlog_policy = "block"
+
+#the logpull windows waiting for a worker, and a condition to notify the workers when new windows arrive
+pending_windows = deque()
+pending_condition = threading.Condition()
+
+#the default length (in seconds) of each chunk of a one-time logpull (backfill), and how many chunks to pull concurrently
+backfill_chunk = 3600
+backfill_parallelism = 4
+
+#whether to pull the log range missed while the program was not running (e.g. restarted or crashed) when it starts, from the checkpoint of each job.
+#the missed log range is pulled in chunks of backfill_chunk seconds, backfill_parallelism chunks at a time, while the logpull windows of the current time carry on.
+catch_up = True
+
+#how far back (in seconds) the logs can still be pulled from Cloudflare API: 7 days for HTTP logs
+HTTP_LOG_RETENTION = 604800
+
+#whether to keep the manifest of the logfiles which have been written (see Manifest), which replaces checking whether the logfiles exist in local storage.
+#the manifest created by initialize_manifest()
+use_manifest = True
+manifest = None
+
+#the log range to look for gaps in the archive (--find-gaps), and how to fill the gaps found (queue | backfill), if specified by the user
+find_gaps_range = None
+fill_gaps_mode = None
+
+#the period (hour | day) of the logfiles to be merged into one logfile per log destination (--compact), if specified by the user.
+#the windows of each compacted logfile are listed in the index next to it (with this suffix), the files being compacted have the temporary suffix, and an hour or day is only compacted this long (in seconds) after it is over.
+compact_period = None
+COMPACTION_INDEX_SUFFIX = ".index.json"
+COMPACTION_TEMP_SUFFIX = ".compacting"
+COMPACTION_GRACE = 900
+
+#the compression codecs of the logfiles (compression option of each log destination), and the file extension of the logfiles of each codec
+COMPRESSION_EXTENSIONS = {"gzip": ".json.gz", "zstd": ".json.zst", "none": ".json"}
+
+#the default compression level of gzip and zstd, and the size of the blocks (in bytes) compressed concurrently by multi-threaded gzip (compression_threads)
+GZIP_DEFAULT_LEVEL = 9
+ZSTD_DEFAULT_LEVEL = 3
+PARALLEL_GZIP_BLOCK_SIZE = 1048576
+
+#the threads which compress the blocks of multi-threaded gzip for all the logpull windows, created by get_compression_executor(). There are as many threads as the largest compression_threads of the log destinations (see initialize_compression()).
+compression_executor = None
+compression_pool_size = 1
+compression_lock = threading.Lock()
+
+#the type of each HTTP and Cloudflare Access log field in the Parquet files (format: parquet). The fields which are not listed are strings.
+PARQUET_FIELD_TYPES = {
+    "BotScore": "int64", "CacheResponseBytes": "int64", "CacheResponseStatus": "int64", "CacheTieredFill": "bool", "ClientASN": "int64", "ClientRequestBytes": "int64", "ClientSrcPort": "int64",
+    "EdgeColoID": "int64", "EdgeEndTimestamp": "timestamp", "EdgeRateLimitID": "int64", "EdgeResponseBytes": "int64", "EdgeResponseCompressionRatio": "float64", "EdgeResponseStatus": "int64",
+    "EdgeStartTimestamp": "timestamp", "FirewallMatchesActions": "list", "FirewallMatchesRuleIDs": "list", "FirewallMatchesSources": "list", "OriginResponseStatus": "int64", "OriginResponseTime": "int64",
+    "RequestHeaders": "map", "WorkerCPUTime": "int64", "WorkerSubrequest": "bool", "WorkerSubrequestCount": "int64", "ZoneID": "int64",
+    "allowed": "bool", "created_at": "timestamp", "temporary_access_approvers": "list", "temporary_access_duration": "int64"
+}
+
+#the low-cardinality fields which are dictionary encoded in the Parquet files, unless parquet_dictionary_fields is specified
+PARQUET_DICTIONARY_FIELDS = ("BotScoreSrc", "CacheCacheStatus", "CacheResponseStatus", "ClientASN", "ClientCountry", "ClientDeviceType", "ClientIPClass", "ClientRequestHost", "ClientRequestMethod", "ClientRequestProtocol",
+    "ClientSSLCipher", "ClientSSLProtocol", "EdgeColoCode", "EdgeColoID", "EdgePathingOp", "EdgePathingSrc", "EdgePathingStatus", "EdgeRateLimitAction", "EdgeRequestHost", "EdgeResponseContentType",
+    "EdgeResponseStatus", "OriginResponseStatus", "OriginSSLProtocol", "SecurityLevel", "WAFAction", "WAFProfile", "WorkerStatus", "ZoneID",
+    "action", "allowed", "app_domain", "app_name", "app_type", "app_uid", "connection", "country", "user_email", "user_id")
+
+#the default number of rows of each row group in the Parquet files, and the number of records converted into columns at a time while a row group is being filled
+PARQUET_ROW_GROUP_SIZE = 65536
+PARQUET_BATCH_SIZE = 8192
+
+#the number of parts uploaded at the same time to S3 log destinations (by all the logpull windows), and the size of each part (bytes) of the multipart uploads. S3 requires at least 5 MiB for each part except the last one.
+#the S3 clients of the log destinations (one for each endpoint and region), the upload pool and the number of parts which can still be held in memory are created by get_s3_client()
+s3_upload_concurrency = 8
+s3_part_size = 8388608
+S3_MIN_PART_SIZE = 5242880
+s3_clients = {}
+s3_executor = None
+s3_slots = None
+s3_lock = threading.Lock()
+
+#the timeout (seconds) of connecting and sending the records to the stream log destinations (path: tcp://host:port, unix:///path or stdout), and the number of times to reconnect before giving up on a logpull window
+#the connection of each stream log destination (see StreamSink) is shared by all the logpull windows, and created by get_stream_sink()
+stream_timeout = 30
+stream_reconnect_attempts = 3
+stream_sinks = {}
+stream_lock = threading.Lock()
+
+#the operators of the record filters of the log destinations (filter option of each log destination, see initialize_pipeline()), and the value of the redacted fields without redact_key
+FILTER_OPERATORS = {"==": operator.eq, "!=": operator.ne, ">=": operator.ge, "<=": operator.le, ">": operator.gt, "<": operator.lt, "in": lambda value, values: value in values}
+REDACTED_VALUE = "REDACTED"
+
+#a lock to update the logpull windows in flight and the checkpoint of the jobs
+checkpoint_lock = threading.Lock()
+
+#adaptive window sizing: the length of the logpull windows is adjusted based on the size and the time taken of the previous windows, instead of always being the interval.
+#disabled by default. The target size (bytes downloaded) and time (seconds) of each window, and the shortest and longest window (seconds).
+adaptive_window = False
+adaptive_target_bytes = 52428800
+adaptive_target_seconds = 30
+adaptive_min_window = 10
+adaptive_max_window = 3600
+
+#the window lengths allowed by adaptive window sizing. Only the divisors of 1 hour are allowed, so the windows never cross the date and hour folders.
+ADAPTIVE_WINDOW_LENGTHS = tuple(n for n in range(1, 3601) if 3600 % n == 0)
+
+#the default number of connections to keep alive in the HTTP connection pool shared by all logpull processes
+pool_size = 10
+
+#the HTTP session and the rate limiter shared by all logpull processes, created by initialize_session()
+session = rate_limiter = None
+
+#the metrics of the program, created by initialize_metrics()
+metrics = None
+
+#the default number of requests per second allowed to Cloudflare API (1200 requests per 5 minutes), and how many requests can be sent at once
+api_rate_limit = 4.0
+api_rate_burst = 10
+
+#the engine to run the logpull tasks (thread | asyncio), and the maximum number of logpull tasks in flight for the asyncio engine
+engine = "thread"
+async_concurrency = 1000
+
+#the HTTP session and the executor to write logs to local storage used by the asyncio engine, created by async_main()
+async_session = write_executor = None
+
+#the timeouts (seconds) of the HTTP session of the asyncio engine: connecting to Cloudflare API, and waiting for the next chunk of the response body.
+#there is no limit on the total time of a request, same as the threading engine, as the logs of a long window can take more than a few minutes to download.
+ASYNC_CONNECT_TIMEOUT = 30
+ASYNC_READ_TIMEOUT = 300
+
+#the default port and address of the metrics endpoint. Port 0 means the metrics endpoint is disabled.
+metrics_port = 0
+metrics_address = "127.0.0.1"
+
+#the base URL of Cloudflare API. Can be changed to point the program to a proxy, or to a local fake API for benchmarking.
+api_url = "https://api.cloudflare.com/client/v4"
+
+#the folder to store the activity logs, the queues and the progress of backfills. Can be changed with CF_LOGS_DOWNLOADER_STATE_DIR environment variable,
+#so that another instance of the program (e.g. a benchmark) will not touch the queue of the running service.
+state_dir = os.environ.get("CF_LOGS_DOWNLOADER_STATE_DIR") or "/var/log/cf_logs_downloader/"
+
+#the upper bounds (in seconds) of the buckets of the request latency and time to first byte histograms
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+#the priority of the requests to Cloudflare API. Logpull windows scheduled by the main loop have priority over the tasks retried from the queue.
+PRIORITY_SCHEDULED = 0
+PRIORITY_RETRY = 1
+
+#the default size (in bytes) of each chunk read from the Cloudflare API response while streaming logs to local storage
+chunk_size = 1048576
+
 #set the below settings to default: False
 one_time = hide_user_logs = False
 
@@ -46,21 +258,24 @@ Deprecated log fields: OriginResponseBytes,WAFFlags,WAFMatchedVar
 http_fields = ["BotScore","BotScoreSrc","CacheCacheStatus","CacheResponseBytes","CacheResponseStatus","CacheTieredFill","ClientASN","ClientCountry","ClientDeviceType","ClientIP","ClientIPClass","ClientRequestBytes","ClientRequestHost","ClientRequestMethod","ClientRequestPath","ClientRequestProtocol","ClientRequestReferer","ClientRequestURI","ClientRequestUserAgent","ClientSSLCipher","ClientSSLProtocol","ClientSrcPort","ClientXRequestedWith","EdgeColoCode","EdgeColoID","EdgeEndTimestamp","EdgePathingOp","EdgePathingSrc","EdgePathingStatus","EdgeRateLimitAction","EdgeRateLimitID","EdgeRequestHost","EdgeResponseBytes","EdgeResponseCompressionRatio","EdgeResponseContentType","EdgeResponseStatus","EdgeServerIP","EdgeStartTimestamp","FirewallMatchesActions","FirewallMatchesRuleIDs","FirewallMatchesSources","OriginIP","OriginResponseHTTPExpires","OriginResponseHTTPLastModified","OriginResponseStatus","OriginResponseTime","OriginSSLProtocol","ParentRayID","RayID","RequestHeaders","SecurityLevel","WAFAction","WAFProfile","WAFRuleID","WAFRuleMessage","WorkerCPUTime","WorkerStatus","WorkerSubrequest","WorkerSubrequestCount","ZoneID"]
 access_fields = ["action","allowed","app_domain","app_name","app_type","app_uid","connection","country","created_at","ip_address","purpose_justification_prompt","purpose_justification_response","ray_id","temporary_access_approvers","temporary_access_duration","user_email","user_id"]
 
-#create three logging object for logging purposes
+#create four logging object for logging purposes
 logger = logging.getLogger("general_logger") #for general logging
 succ_logger = logging.getLogger("succ_logger") #to log successful attempts
 fail_logger = logging.getLogger("fail_logger") #to log failed attempts
+window_logger = logging.getLogger("window_logger") #to log the timings and statistics of each logpull window, one JSON object per line
 
 #the default logging level is INFO, which is one level higher than DEBUG
 logger.setLevel(logging.INFO)
 succ_logger.setLevel(logging.INFO)
 fail_logger.setLevel(logging.INFO)
+window_logger.setLevel(logging.INFO)
 
 #create handlers to write logs to local storage, and automatically rotate them
-Path("/var/log/cf_logs_downloader/").mkdir(parents=True, exist_ok=True)
-handler_file = logging.handlers.TimedRotatingFileHandler("/var/log/cf_logs_downloader/pull.log", when='H', interval=1, backupCount=120, utc=False, encoding="utf-8") #rotate hourly, store up to 120 hours
-succ_handler_file = logging.handlers.TimedRotatingFileHandler("/var/log/cf_logs_downloader/succ.log", when='D', interval=1, backupCount=30, utc=False, encoding="utf-8") #rotate daily, store up to 30 days
-fail_handler_file = logging.handlers.TimedRotatingFileHandler("/var/log/cf_logs_downloader/fail.log", when='D', interval=1, backupCount=30, utc=False, encoding="utf-8") #rotate daily, store up to 30 days
+Path(state_dir).mkdir(parents=True, exist_ok=True)
+handler_file = logging.handlers.TimedRotatingFileHandler(os.path.join(state_dir, "pull.log"), when='H', interval=1, backupCount=120, utc=False, encoding="utf-8") #rotate hourly, store up to 120 hours
+succ_handler_file = logging.handlers.TimedRotatingFileHandler(os.path.join(state_dir, "succ.log"), when='D', interval=1, backupCount=30, utc=False, encoding="utf-8") #rotate daily, store up to 30 days
+fail_handler_file = logging.handlers.TimedRotatingFileHandler(os.path.join(state_dir, "fail.log"), when='D', interval=1, backupCount=30, utc=False, encoding="utf-8") #rotate daily, store up to 30 days
+window_handler_file = logging.handlers.TimedRotatingFileHandler(os.path.join(state_dir, "windows.log"), when='D', interval=1, backupCount=7, utc=False, encoding="utf-8") #rotate daily, store up to 7 days
 
 #create a handler to print logs on terminal
 handler_console = logging.StreamHandler()
@@ -74,14 +289,19 @@ handler_file.setFormatter(formatter)
 handler_console.setFormatter(formatter)
 succ_handler_file.setFormatter(succfail_formatter)
 fail_handler_file.setFormatter(succfail_formatter)
+window_handler_file.setFormatter(succfail_formatter)
 
 #finally, add all handlers to their respective loggers
 logger.addHandler(handler_console)
 succ_logger.addHandler(succ_handler_file)
 fail_logger.addHandler(fail_handler_file)
+window_logger.addHandler(window_handler_file)
 
 #create a SQLite queue system to handle failed tasks
-queue = persistqueue.SQLiteQueue('/var/log/cf_logs_downloader/queue/', auto_commit=True, multithreading=True)
+queue = persistqueue.SQLiteQueue(os.path.join(state_dir, "queue/"), auto_commit=True, multithreading=True)
+
+#the logpull jobs, each with its own log type, Zone ID/Account ID, API token, fields, log destinations and queue. Created by initialize_arg().
+jobs = []
 
 #create a threading event for wait() function
 event = threading.Event()
@@ -93,7 +313,7 @@ If required parameters are not given by the user, an error message will be displ
 '''
 def initialize_arg():
     
-    global log_type, zone_id, account_id, api_token, sample_rate, interval, logger, start_time_static, end_time_static, one_time, fields, final_fields, yaml_schema, log_dest, hide_user_logs
+    global log_type, zone_id, account_id, api_token, sample_rate, interval, logger, start_time_static, end_time_static, one_time, fields, final_fields, yaml_schema, log_dest, hide_user_logs, chunk_size, page_size, page_concurrency, pool_size, workers, max_pending_windows, backlog_policy, backfill_chunk, backfill_parallelism, api_rate_limit, api_rate_burst, queue_concurrency, queue_order, retry_backoff_base, retry_backoff_max, queue_coalesce, coalesce_max_windows, coalesce_output, jobs, engine, async_concurrency, metrics_port, metrics_address, api_url, adaptive_window, adaptive_target_bytes, adaptive_target_seconds, adaptive_min_window, adaptive_max_window, catch_up, use_manifest, find_gaps_range, fill_gaps_mode, compact_period, s3_upload_concurrency, s3_part_size, stream_timeout, stream_reconnect_attempts
     
     welcome_msg = "A little tool to pull/download HTTP, Cloudflare Access and Audit logs from Cloudflare and save it on local storage."
 
@@ -109,6 +329,7 @@ def initialize_arg():
     parser.add_argument("-t", "--token", help="Specify your Cloudflare API Token, if CF_TOKEN environment variable not set. This will override CF_TOKEN variable.")
     parser.add_argument("-r", "--rate", help="Specify the log sampling rate from 0.01 to 1. Default is 1. Only applicable for 'http' log type.", type=float)
     parser.add_argument("-i", "--interval", help="Specify the interval between each logpull in seconds. Default is 60 seconds.", type=int)
+    parser.add_argument("--chunk-size", metavar="BYTES", help="Specify the size of each chunk (in bytes) read from Cloudflare while streaming logs to local storage. This caps the memory used by each logpull process. Default is 1048576 (1 MiB).", type=int)
     parser.add_argument("-n", "--nice", help="Specify the niceness of the logpull process from -20 (highest priority) to 19 (lowest priority). Default is -10.", type=int)
     parser.add_argument("--type", help="Specify the type of logs that you would like to pull. Possible values: http (for HTTP logs), access (for Cloudflare Access logs), audit (for Cloudflare Audit logs)")
     parser.add_argument("--path", metavar="/log/path/", help="Specify the path to store logs. By default, it will save to /var/log/cf_logs/.")
@@ -119,6 +340,8 @@ def initialize_arg():
     parser.add_argument("--one-time", help="Only pull logs from Cloudflare for one time, without scheduling capability. You must specify the start time and end time of the logs to be pulled from Cloudflare.", action="store_true")
     parser.add_argument("--start-time", help="Specify the start time of the logs to be pulled from Cloudflare. The start time is inclusive. You must follow the ISO 8601 (RFC 3339) date format, in UTC timezone. Example: 2020-12-31T12:34:56Z")
     parser.add_argument("--end-time", help="Specify the end time of the logs to be pulled from Cloudflare. The end time is exclusive. You must follow the ISO 8601 (RFC 3339) date format, in UTC timezone. Example: 2020-12-31T12:35:00Z")
+    parser.add_argument("--backfill-chunk", metavar="SECONDS", help="Specify the length (in seconds) of each chunk while pulling logs for one time. The time range between the start time and end time will be split into chunks, and each chunk will be pulled separately. Default is 3600 seconds, which is also the maximum for 'http' log type.", type=int)
+    parser.add_argument("--backfill-parallelism", metavar="N", help="Specify how many chunks to pull concurrently while pulling logs for one time. Default is 4.", type=int)
     parser.add_argument("--exclude", metavar="field1,field2", help="Specify the list of log fields to be excluded from Logpull. Separate each field by comma without spaces. Only applicable for 'http' log type.")
     parser.add_argument("--available-fields", metavar="TYPE", help="Specify the log type to display the list of available log fields used by the program. These fields are also included in the logpull by default (unless field exclusion is configured). Possible values: http | access.")
     parser.add_argument("--install-service", help="Install the program as a systemd service. The service will execute the program from the path where you install the service.", action="store_true")
@@ -126,6 +349,11 @@ def initialize_arg():
     parser.add_argument("--list-queue", help="List all the pending tasks in the queue which has failed before, without beautifying the result (raw JSON).", action="store_true")
     parser.add_argument("--list-queue-beauty", help="List all the pending tasks in the queue which has failed before, with beautifying the result.", action="store_true")
     parser.add_argument("--queue-size", help="Display the number of pending tasks in the queue which has failed before.", action="store_true")
+    parser.add_argument("--list-manifest", help="List all the logfiles which have been written, according to the manifest (JSON, sorted by log start time).", action="store_true")
+    parser.add_argument("--find-gaps", help="Look for the log ranges between --start-time and --end-time which are missing (gaps) or written more than once (overlaps) in each log destination, and display them as JSON. The manifest is used if enabled, otherwise the logfiles are looked up in the log destinations.", action="store_true")
+    parser.add_argument("--fill-gaps", metavar="MODE", help="Specify together with --find-gaps to pull the gaps found. Possible values: queue (add the gaps to the queue, to be retried by the program) | backfill (pull the gaps right away, --backfill-parallelism at a time).", choices=("queue", "backfill"))
+    parser.add_argument("--compact", metavar="PERIOD", help="Merge the logfiles of each hour or day which is over into one logfile per log destination, then exit. The logfiles are concatenated without being recompressed, and the windows of each merged logfile are listed in an index (.index.json) next to it. Parquet files are not merged. Possible values: hour | day.", choices=("hour", "day"))
+    parser.add_argument("--rebuild-manifest", help="Add the logfiles which already exist in the log destinations of each job to the manifest, e.g. the logfiles written before the manifest was introduced.", action="store_true")
     parser.add_argument("--debug", help="Enable debugging functionality.", action="store_true")
     parser.add_argument("-v", "--version", help="Show program version.", action="version", version="Version " + ver_num)
     
@@ -139,21 +367,6 @@ def initialize_arg():
     if one_time is False:
         logger.addHandler(handler_file)
 
-    #if user specifies this parameter, list the queue as it is without any beautification and sorting
-    if args.list_queue:
-        print(json.dumps(queue.queue(), default=str))
-        sys.exit(0)
-
-    #if user specifies this parameter, list the queue with beautification and sorting based on log_start_time_utc
-    if args.list_queue_beauty:
-        print(json.dumps(sorted(queue.queue(), key=sort_json_by_log_start_time_utc), default=str, indent=2))
-        sys.exit(0)
-
-    #if user specifies this parameter, display the current size of the queue (how many items in the queue)
-    if args.queue_size:
-        print(str(queue.size))
-        sys.exit(0)
-
     #catch someone who tries to "install and uninstall" service, which is definitely not logic.
     if args.install_service and args.uninstall_service:
         logger.critical(str(datetime.now()) + " --- Hold on. Are you trying to install or uninstall service?")
@@ -210,120 +423,148 @@ def initialize_arg():
             logger.critical(str(datetime.now()) + " --- Error in configuration file: " + str(e) + ". Please check whether the settings are correct.")
             sys.exit(2)
 
+    #check whether multiple logpull jobs are configured in the config file. If yes, the log type, Zone ID/Account ID, sample rate, fields and log destinations are read from each job instead.
+    job_config = parsed_config.get("jobs") or []
+    job_names = [j.get("name") for j in job_config]
+    for name in job_names:
+        #the name of the job is used as the folder name of the queue, so only letters, numbers, dashes and underscores are allowed
+        if not name or not name.replace("-", "").replace("_", "").isalnum() or job_names.count(name) > 1:
+            logger.critical(str(datetime.now()) + " --- Invalid job name '" + str(name) + "'. Each job must have a unique name, with only letters, numbers, dashes and underscores.")
+            sys.exit(2)
+
+    #each job has its own queue. Without 'jobs' in the config file, there's only one queue.
+    job_queues = [(name, open_job_queue(name)) for name in job_names] if job_config else [(None, queue)]
+
+    #if user specifies this parameter, list the queue as it is without any beautification and sorting
+    if args.list_queue:
+        print(json.dumps(get_queue_items(job_queues), default=str))
+        sys.exit(0)
+
+    #if user specifies this parameter, list the queue with beautification and sorting based on log_start_time_utc
+    if args.list_queue_beauty:
+        print(json.dumps(sorted(get_queue_items(job_queues), key=sort_json_by_log_start_time_utc), default=str, indent=2))
+        sys.exit(0)
+
+    #if user specifies this parameter, display the current size of the queue (how many items in the queue)
+    if args.queue_size:
+        print(str(sum(q.size for name, q in job_queues)))
+        sys.exit(0)
+
+    #if user specifies this parameter, list the logfiles recorded in the manifest, sorted by log start time
+    if args.list_manifest:
+        if parsed_config.get("manifest") is False:
+            logger.critical(str(datetime.now()) + " --- The manifest is disabled in the configuration file.")
+            sys.exit(2)
+        print(json.dumps(Manifest(os.path.join(state_dir, "manifest.db")).query(), indent=2))
+        sys.exit(0)
+
     #enable debugging if specified by the user
     if args.debug is True or parsed_config.get("debug") is True:
         logger.setLevel(logging.DEBUG)
 
-    #check whether the log type is specified by the user via the parameter. If not, check the environment variable.
-    #if not in environment variable, then check the config file.
-    #priority of reading log type: arguments - environment variable - config file.
-    #if no log type is specified, an error message will be given to the user and the program will exit
-    if args.type:
-        log_type = args.type
-    elif os.getenv("CF_LOG_TYPE"):
-        log_type = os.getenv("CF_LOG_TYPE")
-    elif parsed_config.get("type"):
-        log_type = parsed_config.get("type")
-    else:
-        logger.critical(str(datetime.now()) + " --- Please specify the type of logs you want to pull. Possible values: http | access | audit")
+    #without 'jobs' in the config file, there's only one job: the log type, Zone ID/Account ID and sample rate are read from the parameters, environment variables and config file.
+    if job_config and (args.type or args.zone or args.account or args.rate or args.exclude):
+        logger.critical(str(datetime.now()) + " --- Log type, Zone ID, Account ID, sample rate and field exclusion cannot be specified as parameters while 'jobs' is configured in the configuration file. Please specify them in each job instead.")
         sys.exit(2)
-
-    #check either zone ID or account ID based on the log type the user specified. HTTP logs only require zone ID, while Cloudflare Access and Audit logs only require account ID.
-    if log_type == "http":
-        #immediately assign the http fields list to a new variable, future reference of log fields will be the new variable
-        fields = http_fields
-        #check whether Zone ID is given by the user via the parameter. If not, check the environment variable.
+    if not job_config:
+        #check whether the log type is specified by the user via the parameter. If not, check the environment variable.
         #if not in environment variable, then check the config file.
-        #priority of reading Zone ID: arguments - environment variable - config file.
-        #if no Zone ID is given, an error message will be given to the user and the program will exit
-        if args.zone:
-            zone_id = args.zone
-        elif os.getenv("CF_ZONE_ID"):
-            zone_id = os.getenv("CF_ZONE_ID")
-        elif parsed_config.get("cf_zone_id"):
-            zone_id = parsed_config.get("cf_zone_id")
+        #priority of reading log type: arguments - environment variable - config file.
+        #if no log type is specified, an error message will be given to the user and the program will exit
+        if args.type:
+            log_type = args.type
+        elif os.getenv("CF_LOG_TYPE"):
+            log_type = os.getenv("CF_LOG_TYPE")
+        elif parsed_config.get("type"):
+            log_type = parsed_config.get("type")
         else:
-            logger.critical(str(datetime.now()) + " --- Please specify your Cloudflare Zone ID.")
+            logger.critical(str(datetime.now()) + " --- Please specify the type of logs you want to pull. Possible values: http | access | audit")
             sys.exit(2)
-        
-        #check if user provides the sample rate value in command line as argument, if not, check the config file.
-        #if not exist in config file, use the default value.
-        #priority of reading : arguments - config file - default value (1).
-        if args.rate:
-            sample_rate = args.rate
-        elif parsed_config.get("rate"):
-            sample_rate = parsed_config.get("rate")
-        #check whether the sample rate is valid, if not return an error message and exit
-        try:
-            #the value should not more than two decimal places
-            if len(str(sample_rate).split(".", 1)[1]) > 2:
-                logger.critical(str(datetime.now()) + " --- Invalid sample rate specified. Please specify a value between 0.01 and 1, and only two decimal places allowed.")
+
+        #check either zone ID or account ID based on the log type the user specified. HTTP logs only require zone ID, while Cloudflare Access and Audit logs only require account ID.
+        if log_type == "http":
+            #immediately assign the http fields list to a new variable, future reference of log fields will be the new variable
+            fields = list(http_fields)
+            #check whether Zone ID is given by the user via the parameter. If not, check the environment variable.
+            #if not in environment variable, then check the config file.
+            #priority of reading Zone ID: arguments - environment variable - config file.
+            #if no Zone ID is given, an error message will be given to the user and the program will exit
+            if args.zone:
+                zone_id = args.zone
+            elif os.getenv("CF_ZONE_ID"):
+                zone_id = os.getenv("CF_ZONE_ID")
+            elif parsed_config.get("cf_zone_id"):
+                zone_id = parsed_config.get("cf_zone_id")
+            else:
+                logger.critical(str(datetime.now()) + " --- Please specify your Cloudflare Zone ID.")
                 sys.exit(2)
-        except IndexError:
-            #sometimes the user may specify 1 as the value, so we need to handle the exception for value with no decimal places
-            pass
-        if sample_rate <= 1.0 and sample_rate >= 0.01:
-            sample_rate = str(sample_rate)
-        else:
-            logger.critical(str(datetime.now()) + " --- Invalid sample rate specified. Please specify a value between 0.01 and 1, and only two decimal places allowed.")
-            sys.exit(2)
         
-        #display a warning to the user if the user specifies 'hide_user_logs' parameter while using Cloudflare HTTP log type.
-        if args.hide_user_logs or parsed_config.get("hide_user_logs"):
-            logger.warning(str(datetime.now()) + " --- 'hide_user_logs' parameter does not apply to Cloudflare Access logs. 'hide_user_logs' will be ignored.")
+            #check if user provides the sample rate value in command line as argument, if not, check the config file.
+            #if not exist in config file, use the default value.
+            #priority of reading : arguments - config file - default value (1).
+            if args.rate:
+                sample_rate = args.rate
+            elif parsed_config.get("rate"):
+                sample_rate = parsed_config.get("rate")
+            #check whether the sample rate is valid, if not return an error message and exit
+            sample_rate = validate_sample_rate(sample_rate)
+        
+            #display a warning to the user if the user specifies 'hide_user_logs' parameter while using Cloudflare HTTP log type.
+            if args.hide_user_logs or parsed_config.get("hide_user_logs"):
+                logger.warning(str(datetime.now()) + " --- 'hide_user_logs' parameter does not apply to Cloudflare Access logs. 'hide_user_logs' will be ignored.")
 
-    elif log_type == "access":
-        #immediately assign the Access fields list to a new variable, future reference of log fields will be the new variable
-        fields = access_fields
-        #check whether Account ID is given by the user via the parameter. If not, check the environment variable.
-        #if not in environment variable, then check the config file.
-        #priority of reading Account ID: arguments - environment variable - config file.
-        #if no Account ID is given, an error message will be given to the user and the program will exit
-        if args.account:
-            account_id = args.account
-        elif os.getenv("CF_ACCOUNT_ID"):
-            account_id = os.getenv("CF_ACCOUNT_ID")
-        elif parsed_config.get("cf_account_id"):
-            account_id = parsed_config.get("cf_account_id")
-        else:
-            logger.critical(str(datetime.now()) + " --- Please specify your Cloudflare Account ID.")
-            sys.exit(2)
+        elif log_type == "access":
+            #immediately assign the Access fields list to a new variable, future reference of log fields will be the new variable
+            fields = list(access_fields)
+            #check whether Account ID is given by the user via the parameter. If not, check the environment variable.
+            #if not in environment variable, then check the config file.
+            #priority of reading Account ID: arguments - environment variable - config file.
+            #if no Account ID is given, an error message will be given to the user and the program will exit
+            if args.account:
+                account_id = args.account
+            elif os.getenv("CF_ACCOUNT_ID"):
+                account_id = os.getenv("CF_ACCOUNT_ID")
+            elif parsed_config.get("cf_account_id"):
+                account_id = parsed_config.get("cf_account_id")
+            else:
+                logger.critical(str(datetime.now()) + " --- Please specify your Cloudflare Account ID.")
+                sys.exit(2)
 
-        #display a warning to the user if the user specifies sample rate or 'hide_user_logs' parameter while using Cloudflare Access log type.
-        if args.rate or parsed_config.get("rate"):
-            logger.warning(str(datetime.now()) + " --- Cloudflare Access log does not support sampling. Sample rate will be ignored.")
-        if args.hide_user_logs or parsed_config.get("hide_user_logs"):
-            logger.warning(str(datetime.now()) + " --- 'hide_user_logs' parameter does not apply to Cloudflare Access logs. 'hide_user_logs' will be ignored.")
+            #display a warning to the user if the user specifies sample rate or 'hide_user_logs' parameter while using Cloudflare Access log type.
+            if args.rate or parsed_config.get("rate"):
+                logger.warning(str(datetime.now()) + " --- Cloudflare Access log does not support sampling. Sample rate will be ignored.")
+            if args.hide_user_logs or parsed_config.get("hide_user_logs"):
+                logger.warning(str(datetime.now()) + " --- 'hide_user_logs' parameter does not apply to Cloudflare Access logs. 'hide_user_logs' will be ignored.")
 
-    elif log_type == "audit":
-        #check whether Account ID is given by the user via the parameter. If not, check the environment variable.
-        #if not in environment variable, then check the config file.
-        #priority of reading Account ID: arguments - environment variable - config file.
-        #if no Account ID is given, an error message will be given to the user and the program will exit
-        if args.account:
-            account_id = args.account
-        elif os.getenv("CF_ACCOUNT_ID"):
-            account_id = os.getenv("CF_ACCOUNT_ID")
-        elif parsed_config.get("cf_account_id"):
-            account_id = parsed_config.get("cf_account_id")
+        elif log_type == "audit":
+            #check whether Account ID is given by the user via the parameter. If not, check the environment variable.
+            #if not in environment variable, then check the config file.
+            #priority of reading Account ID: arguments - environment variable - config file.
+            #if no Account ID is given, an error message will be given to the user and the program will exit
+            if args.account:
+                account_id = args.account
+            elif os.getenv("CF_ACCOUNT_ID"):
+                account_id = os.getenv("CF_ACCOUNT_ID")
+            elif parsed_config.get("cf_account_id"):
+                account_id = parsed_config.get("cf_account_id")
+            else:
+                logger.critical(str(datetime.now()) + " --- Please specify your Cloudflare Account ID.")
+                sys.exit(2)
+
+            #check if user specifies the 'hide_user_logs' parameter in the command line, if not, check the config file.
+            #if not exist in config file, use the default value.
+            #priority of reading : arguments - config file - default value (False).
+            if args.hide_user_logs:
+                hide_user_logs = args.hide_user_logs
+            elif parsed_config.get("hide_user_logs"):
+                hide_user_logs = parsed_config.get("hide_user_logs")
+
+            #display a warning to the user if the user specifies sample rate while using Cloudflare Audit log type.
+            if args.rate or parsed_config.get("rate"):
+                logger.warning(str(datetime.now()) + " --- Cloudflare Audit log does not support sampling. Sample rate will be ignored.")
         else:
-            logger.critical(str(datetime.now()) + " --- Please specify your Cloudflare Account ID.")
+            logger.critical(str(datetime.now()) + " --- Invalid log type '" + log_type + "'. Valid values: http | access | audit")
             sys.exit(2)
-
-        #check if user specifies the 'hide_user_logs' parameter in the command line, if not, check the config file.
-        #if not exist in config file, use the default value.
-        #priority of reading : arguments - config file - default value (False).
-        if args.hide_user_logs:
-            hide_user_logs = args.hide_user_logs
-        elif parsed_config.get("hide_user_logs"):
-            hide_user_logs = parsed_config.get("hide_user_logs")
-
-        #display a warning to the user if the user specifies sample rate while using Cloudflare Audit log type.
-        if args.rate or parsed_config.get("rate"):
-            logger.warning(str(datetime.now()) + " --- Cloudflare Audit log does not support sampling. Sample rate will be ignored.")
-    else:
-        logger.critical(str(datetime.now()) + " --- Invalid log type '" + log_type + "'. Valid values: http | access | audit")
-        sys.exit(2)
         
     #check whether Cloudflare API Token is given by the user via the parameter. If not, check the environment variable.
     #if not in environment variable, then check the config file.
@@ -335,9 +576,15 @@ def initialize_arg():
         api_token = os.getenv("CF_TOKEN")
     elif parsed_config.get("cf_token"):
         api_token = parsed_config.get("cf_token")
+    elif job_config and all(j.get("cf_token") for j in job_config):
+        #every job has its own Cloudflare API Token
+        pass
     else:
         logger.critical(str(datetime.now()) + " --- Please specify your Cloudflare API Token.")
         sys.exit(2)
+
+    #the log types of all the jobs, used to check the settings which depend on the log type
+    log_types = set(j.get("type") for j in job_config) if job_config else {log_type}
     
     #if the user wants to do one-time operation, check the correctness of the start time and end time of the logs to pull.
     if one_time is True:
@@ -350,11 +597,11 @@ def initialize_arg():
                 if diff_start_end.total_seconds() < 1:
                     logger.critical(str(datetime.now()) + " --- Start time must be earlier than the end time by at least 1 second. ")
                     sys.exit(2)
-                if log_type == "http":
+                if "http" in log_types:
                     if diff_to_now.total_seconds() < 60:
                         logger.critical(str(datetime.now()) + " --- Please specify an end time that is 60 seconds or more earlier than the current time.")
                         sys.exit(2)
-                elif log_type == "access" or log_type == "audit" :
+                else:
                     if diff_to_now.total_seconds() < 1:
                         logger.critical(str(datetime.now()) + " --- Please specify an end time that is 1 second or more earlier than the current time.")
                         sys.exit(2)
@@ -364,6 +611,34 @@ def initialize_arg():
         else:
             logger.critical(str(datetime.now()) + " --- No start time or end time specified for one-time operation. ")
             sys.exit(2)        
+
+    #if the user wants to look for gaps in the archive, check the correctness of the start time and end time of the log range to look into.
+    if args.find_gaps:
+        if one_time is True:
+            logger.critical(str(datetime.now()) + " --- --find-gaps cannot be used together with --one-time.")
+            sys.exit(2)
+        if not args.start_time or not args.end_time:
+            logger.critical(str(datetime.now()) + " --- Please specify --start-time and --end-time of the log range to look for gaps.")
+            sys.exit(2)
+        try:
+            find_gaps_range = (datetime.strptime(args.start_time, "%Y-%m-%dT%H:%M:%SZ"), datetime.strptime(args.end_time, "%Y-%m-%dT%H:%M:%SZ"))
+        except ValueError:
+            logger.critical(str(datetime.now()) + " --- Invalid date format specified. Make sure it is in RFC 3339 date format, in UTC timezone. Please refer to the example: 2020-12-31T12:34:56Z")
+            sys.exit(2)
+        if find_gaps_range[1] <= find_gaps_range[0]:
+            logger.critical(str(datetime.now()) + " --- Start time must be earlier than the end time.")
+            sys.exit(2)
+        fill_gaps_mode = args.fill_gaps
+    elif args.fill_gaps:
+        logger.critical(str(datetime.now()) + " --- --fill-gaps can only be used together with --find-gaps.")
+        sys.exit(2)
+
+    #if the user wants to compact the logfiles, make sure that nothing else is requested at the same time
+    if args.compact:
+        if one_time is True or args.find_gaps:
+            logger.critical(str(datetime.now()) + " --- --compact cannot be used together with --one-time or --find-gaps.")
+            sys.exit(2)
+        compact_period = args.compact
     
     #check if user specifies interval in the command line as parameter. If not, check the config file. Else, use the default value.
     #priority of reading interval value: arguments - config file - default value (60).
@@ -372,6 +647,177 @@ def initialize_arg():
     elif parsed_config.get("interval"):
         interval = parsed_config.get("interval")
 
+    #check if user specifies the backfill chunk length and parallelism in the command line as parameter. If not, check the config file. Else, use the default value.
+    #priority of reading backfill chunk length and parallelism: arguments - config file - default value (3600 and 4).
+    if args.backfill_chunk:
+        backfill_chunk = args.backfill_chunk
+    elif parsed_config.get("backfill_chunk"):
+        backfill_chunk = parsed_config.get("backfill_chunk")
+    if args.backfill_parallelism:
+        backfill_parallelism = args.backfill_parallelism
+    elif parsed_config.get("backfill_parallelism"):
+        backfill_parallelism = parsed_config.get("backfill_parallelism")
+    if backfill_chunk < 1 or ("http" in log_types and backfill_chunk > 3600):
+        logger.critical(str(datetime.now()) + " --- Invalid backfill chunk length specified. Please specify a value larger than 0" + (", and not more than 3600 seconds for HTTP logs." if "http" in log_types else "."))
+        sys.exit(2)
+    if backfill_parallelism < 1:
+        logger.critical(str(datetime.now()) + " --- Invalid backfill parallelism specified. Please specify a value larger than 0.")
+        sys.exit(2)
+
+    #check whether the user disables the manifest in the config file. Else, use the default value (enabled).
+    if parsed_config.get("manifest") is False:
+        use_manifest = False
+
+    #check whether the user disables catching up from the checkpoint in the config file. Else, use the default value (enabled).
+    if parsed_config.get("catch_up") is False:
+        catch_up = False
+
+    #check the settings of adaptive window sizing from the config file. Else, use the default values (disabled).
+    if parsed_config.get("adaptive_window") is True:
+        adaptive_window = True
+    if parsed_config.get("adaptive_target_bytes"):
+        adaptive_target_bytes = parsed_config.get("adaptive_target_bytes")
+    if parsed_config.get("adaptive_target_seconds"):
+        adaptive_target_seconds = parsed_config.get("adaptive_target_seconds")
+    if parsed_config.get("adaptive_min_window"):
+        adaptive_min_window = parsed_config.get("adaptive_min_window")
+    if parsed_config.get("adaptive_max_window"):
+        adaptive_max_window = parsed_config.get("adaptive_max_window")
+    if adaptive_target_bytes < 1 or adaptive_target_seconds < 1:
+        logger.critical(str(datetime.now()) + " --- Invalid adaptive window target specified. Please specify a value larger than 0.")
+        sys.exit(2)
+    if adaptive_max_window > 3600 or not [n for n in ADAPTIVE_WINDOW_LENGTHS if adaptive_min_window <= n <= adaptive_max_window]:
+        logger.critical(str(datetime.now()) + " --- Invalid adaptive window length specified. Please specify the shortest and longest window between 1 and 3600 seconds, with the shortest not longer than the longest.")
+        sys.exit(2)
+
+    #check if user specifies chunk size in the command line as parameter. If not, check the config file. Else, use the default value.
+    #priority of reading chunk size value: arguments - config file - default value (1048576).
+    if args.chunk_size:
+        chunk_size = args.chunk_size
+    elif parsed_config.get("chunk_size"):
+        chunk_size = parsed_config.get("chunk_size")
+    if chunk_size < 1:
+        logger.critical(str(datetime.now()) + " --- Invalid chunk size specified. Please specify a value larger than 0.")
+        sys.exit(2)
+
+    #check the number of logpull workers, the maximum number of pending windows and the backlog policy from the config file. Else, use the default value.
+    if parsed_config.get("workers"):
+        workers = parsed_config.get("workers")
+    if parsed_config.get("max_pending_windows"):
+        max_pending_windows = parsed_config.get("max_pending_windows")
+    if parsed_config.get("backlog_policy"):
+        backlog_policy = parsed_config.get("backlog_policy")
+    if workers < 1 or max_pending_windows < 1:
+        logger.critical(str(datetime.now()) + " --- Invalid number of workers or maximum pending windows specified. Please specify a value larger than 0.")
+        sys.exit(2)
+    if backlog_policy not in ("block", "merge", "spill"):
+        logger.critical(str(datetime.now()) + " --- Invalid backlog policy '" + str(backlog_policy) + "'. Valid values: block | merge | spill")
+        sys.exit(2)
+
+    #check the rate limit of the requests to Cloudflare API from the config file. Else, use the default value. Rate limit of 0 means no rate limit.
+    if parsed_config.get("api_rate_limit") is not None:
+        api_rate_limit = parsed_config.get("api_rate_limit")
+    if parsed_config.get("api_rate_burst"):
+        api_rate_burst = parsed_config.get("api_rate_burst")
+    if api_rate_limit < 0 or api_rate_burst < 1:
+        logger.critical(str(datetime.now()) + " --- Invalid API rate limit or burst specified. API rate limit must be 0 or larger, and API rate burst must be larger than 0.")
+        sys.exit(2)
+
+    #check the settings of retrying the tasks in the queue from the config file. Else, use the default value.
+    if parsed_config.get("queue_concurrency"):
+        queue_concurrency = parsed_config.get("queue_concurrency")
+    if parsed_config.get("queue_order"):
+        queue_order = parsed_config.get("queue_order")
+    if parsed_config.get("retry_backoff_base"):
+        retry_backoff_base = parsed_config.get("retry_backoff_base")
+    if parsed_config.get("retry_backoff_max"):
+        retry_backoff_max = parsed_config.get("retry_backoff_max")
+    if queue_concurrency < 1 or retry_backoff_base < 1 or retry_backoff_max < retry_backoff_base:
+        logger.critical(str(datetime.now()) + " --- Invalid queue settings specified. Queue concurrency and retry backoff base must be larger than 0, and retry backoff max must not be smaller than retry backoff base.")
+        sys.exit(2)
+    if queue_order not in ("oldest", "newest"):
+        logger.critical(str(datetime.now()) + " --- Invalid queue order '" + str(queue_order) + "'. Valid values: oldest | newest")
+        sys.exit(2)
+
+    #check the settings of coalescing the tasks in the queue from the config file. Else, use the default value.
+    if parsed_config.get("queue_coalesce") is not None:
+        queue_coalesce = parsed_config.get("queue_coalesce")
+    if parsed_config.get("coalesce_max_windows"):
+        coalesce_max_windows = parsed_config.get("coalesce_max_windows")
+    if parsed_config.get("coalesce_output"):
+        coalesce_output = parsed_config.get("coalesce_output")
+    if coalesce_max_windows < 1:
+        logger.critical(str(datetime.now()) + " --- Invalid maximum number of log ranges to coalesce specified. Please specify a value larger than 0.")
+        sys.exit(2)
+    if coalesce_output not in ("split", "combined"):
+        logger.critical(str(datetime.now()) + " --- Invalid coalesce output '" + str(coalesce_output) + "'. Valid values: split | combined")
+        sys.exit(2)
+
+    #check the engine to run the logpull tasks, and the maximum number of logpull tasks in flight for the asyncio engine from the config file. Else, use the default value.
+    if parsed_config.get("engine"):
+        engine = parsed_config.get("engine")
+    if parsed_config.get("async_concurrency"):
+        async_concurrency = parsed_config.get("async_concurrency")
+    if engine not in ("thread", "asyncio"):
+        logger.critical(str(datetime.now()) + " --- Invalid engine '" + str(engine) + "'. Valid values: thread | asyncio")
+        sys.exit(2)
+    if async_concurrency < 1:
+        logger.critical(str(datetime.now()) + " --- Invalid async concurrency specified. Please specify a value larger than 0.")
+        sys.exit(2)
+    if engine == "asyncio" and aiohttp is None:
+        logger.critical(str(datetime.now()) + " --- The asyncio engine requires aiohttp library. Please install it with 'pip3 install aiohttp', or use the thread engine instead.")
+        sys.exit(2)
+
+    #check the port and address of the metrics endpoint from the config file. Else, use the default value (disabled).
+    if parsed_config.get("metrics_port"):
+        metrics_port = parsed_config.get("metrics_port")
+    if parsed_config.get("metrics_address"):
+        metrics_address = parsed_config.get("metrics_address")
+    if metrics_port < 0 or metrics_port > 65535:
+        logger.critical(str(datetime.now()) + " --- Invalid metrics port specified. Please specify a value between 1 and 65535, or 0 to disable the metrics endpoint.")
+        sys.exit(2)
+
+    #check the base URL of Cloudflare API from the config file. Else, use the default value.
+    if parsed_config.get("api_url"):
+        api_url = parsed_config.get("api_url").rstrip("/")
+    if not api_url.startswith(("https://", "http://")):
+        logger.critical(str(datetime.now()) + " --- Invalid API URL '" + api_url + "'. Please specify a URL starting with https:// or http://.")
+        sys.exit(2)
+
+    #check the size of the HTTP connection pool from the config file. Else, use the default value.
+    if parsed_config.get("pool_size"):
+        pool_size = parsed_config.get("pool_size")
+    if pool_size < 1:
+        logger.critical(str(datetime.now()) + " --- Invalid pool size specified. Please specify a value larger than 0.")
+        sys.exit(2)
+
+    #check the page size and the number of pages to request concurrently for Cloudflare Access and Audit logs from the config file. Else, use the default value.
+    if parsed_config.get("page_size"):
+        page_size = parsed_config.get("page_size")
+    if parsed_config.get("page_concurrency"):
+        page_concurrency = parsed_config.get("page_concurrency")
+    if page_size < 1 or page_size > 1000 or page_concurrency < 1:
+        logger.critical(str(datetime.now()) + " --- Invalid page size or page concurrency specified. Page size must be between 1 and 1000, and page concurrency must be larger than 0.")
+        sys.exit(2)
+
+    #check the number of parts to upload concurrently and the size of each part for S3 log destinations from the config file. Else, use the default value.
+    if parsed_config.get("s3_upload_concurrency"):
+        s3_upload_concurrency = parsed_config.get("s3_upload_concurrency")
+    if parsed_config.get("s3_part_size"):
+        s3_part_size = parsed_config.get("s3_part_size")
+    if s3_upload_concurrency < 1 or s3_part_size < S3_MIN_PART_SIZE:
+        logger.critical(str(datetime.now()) + " --- Invalid S3 upload concurrency or part size specified. Upload concurrency must be larger than 0, and part size must be at least " + str(S3_MIN_PART_SIZE) + " bytes (5 MiB).")
+        sys.exit(2)
+
+    #check the timeout and the number of reconnect attempts of stream log destinations from the config file. Else, use the default value.
+    if parsed_config.get("stream_timeout"):
+        stream_timeout = parsed_config.get("stream_timeout")
+    if parsed_config.get("stream_reconnect_attempts") is not None:
+        stream_reconnect_attempts = parsed_config.get("stream_reconnect_attempts")
+    if stream_timeout <= 0 or stream_reconnect_attempts < 0:
+        logger.critical(str(datetime.now()) + " --- Invalid stream timeout or reconnect attempts specified. Timeout must be larger than 0, and reconnect attempts must not be negative.")
+        sys.exit(2)
+
     #check if user specifies niceness in the command line as parameter. If not, check the config file. Else, use the default value.
     #priority of reading interval value: arguments - config file - default value (-10).
     #niceness value must be between -20 to 19.
@@ -413,6 +859,10 @@ def initialize_arg():
     for i in range(len(log_dest)):
         log_dest[i]['no_organize'] = True if args.no_organize is True else log_dest[i].get('no_organize')
         log_dest[i]['no_gzip'] = True if args.no_gzip is True else log_dest[i].get('no_gzip')
+        initialize_compression(log_dest[i], args)
+        initialize_pipeline(log_dest[i])
+        initialize_s3(log_dest[i])
+        initialize_stream(log_dest[i])
     
     #only perform field exclusion on HTTP log type
     if log_type == "http":
@@ -428,10 +878,324 @@ def initialize_arg():
         final_fields = ','.join(field for field in fields)
     elif log_type == "access":
         if args.exclude or parsed_config.get('fields.exclude'):
-            logger.warning(str(datetime.now()) + " --- Cloudflare Access log does not support exclusion of log fields. All fields will be included in the log. Field exclusion will be ignored. Specify '--available-fields access' parameter to view the list of Cloudflare Access log fields.")
+            logger.warning(str(datetime.now()) + " --- Cloudflare Access log does not support exclusion of log fields. All fields will be included in the log. Field exclusion will be ignored. Specify '--available-fields access' parameter to view the list of Cloudflare Access log fields, or 'fields.drop' of the log destinations to drop fields from the logfiles.")
     elif log_type == "audit":
         if args.exclude or parsed_config.get('fields.exclude'):
-            logger.warning(str(datetime.now()) + " --- Cloudflare Audit log does not support exclusion of log fields. All fields will be included in the log. Field exclusion will be ignored.")
+            logger.warning(str(datetime.now()) + " --- Cloudflare Audit log does not support exclusion of log fields. All fields will be included in the log. Field exclusion will be ignored. Specify 'fields.drop' of the log destinations to drop fields from the logfiles instead.")
+
+    #create the logpull jobs. Without 'jobs' in the config file, there's only one job which uses the settings above.
+    if job_config:
+        jobs = [initialize_job(j, job_queue, args) for j, (name, job_queue) in zip(job_config, job_queues)]
+    else:
+        jobs = [{'name': None, 'label': "", 'log_type': log_type, 'zone_id': zone_id, 'account_id': account_id, 'api_token': api_token, 'sample_rate': sample_rate, 'fields': fields, 'final_fields': final_fields, 'log_dest': log_dest, 'hide_user_logs': hide_user_logs, 'interval': interval, 'queue': queue}]
+
+    #the schema of the Parquet files of each job depends on the fields of the job
+    for job in jobs:
+        initialize_parquet(job)
+
+    #the current window length of each job and the log range waiting to be pulled, used by adaptive window sizing. The first windows are as long as the interval.
+    for job in jobs:
+        job['window'] = get_adaptive_window_length(job['interval'])
+        job['pending_window'] = None
+
+    #the logpull windows of each job which have not been written or added to the queue yet (start time: end time), the end time of the last logpull window of the job,
+    #and the checkpoint saved for the job (see settle_window())
+    for job in jobs:
+        job['windows_in_flight'] = {}
+        job['scheduled_until'] = None
+        job['checkpoint'] = None
+
+    #the tasks in the queue of each job ordered by when they are due, so that queue_thread() does not need to read the whole queue to find them (see enqueue_failed())
+    for job in jobs:
+        job['due_heap'] = get_due_heap(job['queue'])
+
+    #if user specifies this parameter, add the logfiles which already exist in the log destinations to the manifest, then exit
+    if args.rebuild_manifest:
+        if use_manifest is False:
+            logger.critical(str(datetime.now()) + " --- The manifest is disabled in the configuration file.")
+            sys.exit(2)
+        initialize_manifest()
+        for job in jobs:
+            rebuild_manifest(job)
+        sys.exit(0)
+
+'''
+This method creates a logpull job from one of the jobs configured in the config file (jobs).
+Cloudflare API Token, interval and log destinations which are not specified in the job are taken from the settings of the program (parameters, environment variables and config file).
+If the job has no log destinations of its own, the name of the job is appended to the logfile name prefix, so that the logfiles of different jobs will not overwrite each other.
+'''
+def initialize_job(job_config, job_queue, args):
+    name = job_config.get("name")
+    job = {'name': name, 'label': "[" + name + "] ", 'log_type': job_config.get("type"), 'zone_id': "", 'account_id': "", 'api_token': job_config.get("cf_token") or api_token, 'sample_rate': "1", 'fields': [], 'final_fields': "", 'log_dest': [], 'hide_user_logs': False, 'interval': job_config.get("interval") or interval, 'queue': job_queue}
+
+    if job['log_type'] == "http":
+        if not job_config.get("cf_zone_id"):
+            logger.critical(str(datetime.now()) + " --- Job '" + name + "': Please specify your Cloudflare Zone ID.")
+            sys.exit(2)
+        job['zone_id'] = job_config.get("cf_zone_id")
+        job['sample_rate'] = validate_sample_rate(job_config.get("rate") or 1)
+        #exclude certain fields in logpull
+        exclude_fields = job_config.get("fields.exclude") or []
+        job['fields'] = [field for field in http_fields if field not in exclude_fields]
+        job['final_fields'] = ','.join(field for field in job['fields'])
+    elif job['log_type'] == "access" or job['log_type'] == "audit":
+        if not job_config.get("cf_account_id"):
+            logger.critical(str(datetime.now()) + " --- Job '" + name + "': Please specify your Cloudflare Account ID.")
+            sys.exit(2)
+        job['account_id'] = job_config.get("cf_account_id")
+        job['fields'] = list(access_fields) if job['log_type'] == "access" else []
+        job['hide_user_logs'] = job_config.get("hide_user_logs") is True and job['log_type'] == "audit"
+        if job_config.get("rate") or job_config.get("fields.exclude"):
+            logger.warning(str(datetime.now()) + " --- Job '" + name + "': Sample rate and field exclusion only apply to HTTP logs, and will be ignored.")
+    else:
+        logger.critical(str(datetime.now()) + " --- Job '" + name + "': Invalid log type '" + str(job['log_type']) + "'. Valid values: http | access | audit")
+        sys.exit(2)
+
+    if job['interval'] < 1:
+        logger.critical(str(datetime.now()) + " --- Job '" + name + "': Invalid interval specified. Please specify a value larger than 0.")
+        sys.exit(2)
+
+    if job_config.get("log_dest"):
+        job['log_dest'] = [dict(d) for d in job_config.get("log_dest")]
+    else:
+        job['log_dest'] = [dict(d, prefix=d.get('prefix') + "_" + name) for d in log_dest]
+    for d in job['log_dest']:
+        d['no_organize'] = True if args.no_organize is True else d.get('no_organize')
+        d['no_gzip'] = True if args.no_gzip is True else d.get('no_gzip')
+        initialize_compression(d, args, "Job '" + name + "': ")
+        initialize_pipeline(d, "Job '" + name + "': ")
+        initialize_s3(d, "Job '" + name + "': ")
+        initialize_stream(d, "Job '" + name + "': ")
+
+    if not job['api_token']:
+        logger.critical(str(datetime.now()) + " --- Job '" + name + "': Please specify your Cloudflare API Token.")
+        sys.exit(2)
+
+    return job
+
+'''
+This method checks whether the sample rate given by the user is valid, and returns it as a string which is used in the request to Cloudflare API.
+If it is not valid, an error message will be given to the user and the program will exit.
+'''
+def validate_sample_rate(sample_rate):
+    try:
+        #the value should not more than two decimal places
+        if len(str(sample_rate).split(".", 1)[1]) > 2:
+            logger.critical(str(datetime.now()) + " --- Invalid sample rate specified. Please specify a value between 0.01 and 1, and only two decimal places allowed.")
+            sys.exit(2)
+    except IndexError:
+        #sometimes the user may specify 1 as the value, so we need to handle the exception for value with no decimal places
+        pass
+    if sample_rate <= 1.0 and sample_rate >= 0.01:
+        return str(sample_rate)
+    else:
+        logger.critical(str(datetime.now()) + " --- Invalid sample rate specified. Please specify a value between 0.01 and 1, and only two decimal places allowed.")
+        sys.exit(2)
+
+'''
+This method checks the compression options of a log destination (compression, compression_level, compression_threads and compression_long), and saves them in the log destination as 'codec'.
+no_gzip (or --no-gzip) is the same as 'compression: none'. Without a compression option, the logfiles are compressed with gzip as before.
+If the options are not valid, an error message will be given to the user and the program will exit.
+'''
+def initialize_compression(d, args, label=""):
+    global compression_pool_size
+
+    label = label + "Log destination '" + str(d.get('name')) + "': "
+    if args.no_gzip is True:
+        d['compression'] = "none"
+    elif d.get('no_gzip') is True and d.get('compression') not in (None, "none"):
+        logger.critical(str(datetime.now()) + " --- " + label + "no_gzip cannot be true when the compression is " + str(d.get('compression')) + ".")
+        sys.exit(2)
+    #Parquet files are compressed with zstd by default, by pyarrow
+    codec = {'name': d.get('compression') or ("none" if d.get('no_gzip') is True else "zstd" if d.get('format') == "parquet" else "gzip"), 'level': d.get('compression_level'), 'threads': d.get('compression_threads') or 1, 'long': d.get('compression_long') or 0}
+
+    if codec['name'] not in COMPRESSION_EXTENSIONS:
+        logger.critical(str(datetime.now()) + " --- " + label + "Invalid compression '" + str(codec['name']) + "'. Valid values: gzip | zstd | none")
+        sys.exit(2)
+    if codec['threads'] < 1:
+        logger.critical(str(datetime.now()) + " --- " + label + "Invalid compression_threads specified. Please specify a value larger than 0.")
+        sys.exit(2)
+    if codec['name'] == "gzip" and codec['level'] is not None and not 1 <= codec['level'] <= 9:
+        logger.critical(str(datetime.now()) + " --- " + label + "Invalid compression_level specified. Please specify a value between 1 and 9 for gzip.")
+        sys.exit(2)
+    if codec['name'] == "zstd":
+        if zstandard is None and d.get('format') != "parquet":
+            logger.critical(str(datetime.now()) + " --- " + label + "zstd compression requires zstandard library. Please install it with 'pip3 install zstandard', or use gzip compression instead.")
+            sys.exit(2)
+        if codec['level'] is not None and not 1 <= codec['level'] <= 22:
+            logger.critical(str(datetime.now()) + " --- " + label + "Invalid compression_level specified. Please specify a value between 1 and 22 for zstd.")
+            sys.exit(2)
+        if codec['long'] and not 10 <= codec['long'] <= 31:
+            logger.critical(str(datetime.now()) + " --- " + label + "Invalid compression_long specified. Please specify the window size as a power of 2 between 10 and 31, e.g. 27 (128 MiB).")
+            sys.exit(2)
+    elif codec['long']:
+        logger.warning(str(datetime.now()) + " --- " + label + "compression_long only applies to zstd compression, and will be ignored.")
+    if d.get('format') == "parquet" and (codec['threads'] > 1 or codec['long']):
+        logger.warning(str(datetime.now()) + " --- " + label + "compression_threads and compression_long do not apply to Parquet files, and will be ignored.")
+    if codec['name'] == "none" and (codec['level'] is not None or codec['threads'] > 1):
+        logger.warning(str(datetime.now()) + " --- " + label + "compression_level and compression_threads do not apply to logs without compression, and will be ignored.")
+
+    if codec['name'] == "gzip" and d.get('format') != "parquet":
+        compression_pool_size = max(compression_pool_size, codec['threads'])
+
+    d['no_gzip'] = codec['name'] == "none"
+    d['codec'] = codec
+
+'''
+This method checks the S3 options of a log destination whose path is an S3 URL (s3://bucket/prefix), and saves them in the log destination as 's3' (None for the log destinations in local storage).
+The logfiles are uploaded to the bucket with the same keys as the paths in local storage, e.g. prefix/2021-04-01/1300/cf_logs_2021-04-01T13:00:00Z~2021-04-01T13:01:00Z.json.gz.
+s3_endpoint_url is the URL of S3-compatible object storage (e.g. Cloudflare R2 or MinIO). The credentials are taken from the environment variables or the configuration files of boto3 (e.g. AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY).
+If the options are not valid, an error message will be given to the user and the program will exit.
+'''
+def initialize_s3(d, label=""):
+    label = label + "Log destination '" + str(d.get('name')) + "': "
+    if not str(d.get('path')).startswith("s3://"):
+        if d.get('s3_endpoint_url') or d.get('s3_region'):
+            logger.warning(str(datetime.now()) + " --- " + label + "s3_endpoint_url and s3_region only apply to S3 log destinations (path starting with s3://), and will be ignored.")
+        d['s3'] = None
+        return
+    if boto3 is None:
+        logger.critical(str(datetime.now()) + " --- " + label + "S3 log destinations require boto3 library. Please install it with 'pip3 install boto3'.")
+        sys.exit(2)
+    d['path'] = d['path'].rstrip("/")
+    if not split_s3_path(d['path'])[0]:
+        logger.critical(str(datetime.now()) + " --- " + label + "Invalid S3 path '" + d['path'] + "'. Please specify the path as s3://bucket or s3://bucket/prefix.")
+        sys.exit(2)
+    d['s3'] = {'endpoint_url': d.get('s3_endpoint_url'), 'region': d.get('s3_region')}
+
+'''
+This method checks the path of a log destination which streams the records to a collector instead of writing logfiles: tcp://host:port, unix:///path/to/socket or stdout.
+The connection is saved in the log destination as 'stream' (None for the other log destinations). The records are always sent as NDJSON without compression, so Parquet files and compression are not supported.
+If the options are not valid, an error message will be given to the user and the program will exit.
+'''
+def initialize_stream(d, label=""):
+    label = label + "Log destination '" + str(d.get('name')) + "': "
+    path = str(d.get('path'))
+    if path == "stdout":
+        stream = {'url': path, 'type': "stdout", 'address': None}
+    elif path.startswith("tcp://"):
+        host, null, port = path[len("tcp://"):].rstrip("/").rpartition(":")
+        if not host or not port.isdigit():
+            logger.critical(str(datetime.now()) + " --- " + label + "Invalid stream path '" + path + "'. Please specify the path as tcp://host:port.")
+            sys.exit(2)
+        stream = {'url': path, 'type': "tcp", 'address': (host.strip("[]"), int(port))}
+    elif path.startswith("unix://"):
+        if not path[len("unix://"):]:
+            logger.critical(str(datetime.now()) + " --- " + label + "Invalid stream path '" + path + "'. Please specify the path as unix:///path/to/socket.")
+            sys.exit(2)
+        stream = {'url': path, 'type': "unix", 'address': path[len("unix://"):]}
+    else:
+        d['stream'] = None
+        return
+
+    if d.get('format') == "parquet":
+        logger.critical(str(datetime.now()) + " --- " + label + "Parquet format is not supported by stream log destinations. The records are sent as NDJSON.")
+        sys.exit(2)
+    if d.get('compression') not in (None, "none"):
+        logger.critical(str(datetime.now()) + " --- " + label + "Compression is not supported by stream log destinations. The records are sent as NDJSON without compression.")
+        sys.exit(2)
+    #no_gzip is implied, the records are sent as they are written to logfiles without compression
+    d['no_gzip'] = True
+    d['codec'] = dict(d['codec'], name="none")
+    d['stream'] = stream
+
+'''
+This method checks the record processing options of a log destination (fields.drop, fields.redact, redact_key and filter), and saves them in the log destination as 'pipeline' (None if there's nothing to do).
+Each filter is a condition in the form of '<field> <operator> <value>', e.g. 'EdgeResponseStatus >= 400'. The value is read as JSON (e.g. 400, "GET", true, null, ["US", "CA"]), or as a string if it is not valid JSON.
+If the options are not valid, an error message will be given to the user and the program will exit.
+'''
+def initialize_pipeline(d, label=""):
+    label = label + "Log destination '" + str(d.get('name')) + "': "
+    filters = []
+    for condition in d.get('filter') or []:
+        matched = re.match(r"^\s*([^\s=!<>]+)\s*(==|!=|>=|<=|>|<|\sin\s)\s*(.+?)\s*$", str(condition))
+        if not matched:
+            logger.critical(str(datetime.now()) + " --- " + label + "Invalid filter '" + str(condition) + "'. Please specify the filter as '<field> <operator> <value>', e.g. 'EdgeResponseStatus >= 400'. Valid operators: " + " | ".join(FILTER_OPERATORS))
+            sys.exit(2)
+        field, op, value = matched.group(1), matched.group(2).strip(), matched.group(3)
+        try:
+            value = json.loads(value)
+        except ValueError:
+            pass
+        if op == "in" and not isinstance(value, list):
+            logger.critical(str(datetime.now()) + " --- " + label + "Invalid filter '" + str(condition) + "'. Please specify a list of values for the 'in' operator, e.g. 'ClientCountry in [\"us\", \"ca\"]'.")
+            sys.exit(2)
+        filters.append((field, FILTER_OPERATORS[op], value))
+
+    pipeline = {'drop': list(d.get('fields.drop') or []), 'redact': list(d.get('fields.redact') or []), 'redact_key': d.get('redact_key').encode() if d.get('redact_key') else None, 'filters': filters}
+    if d.get('redact_key') and not pipeline['redact']:
+        logger.warning(str(datetime.now()) + " --- " + label + "redact_key only applies to the fields specified in fields.redact, and will be ignored.")
+    d['pipeline'] = pipeline if pipeline['drop'] or pipeline['redact'] or pipeline['filters'] else None
+
+'''
+This method prepares the log destinations of a job which write Parquet files (format: parquet), and saves the schema, the row group size and the dictionary encoded fields in each of them as 'parquet'.
+The columns are the fields of the job (see http_fields and access_fields, without the excluded fields) and their types (PARQUET_FIELD_TYPES), without the fields in fields.drop. Fields in fields.redact are strings.
+Cloudflare Audit logs are nested objects without a fixed set of fields, so they can only be written as JSON.
+'''
+def initialize_parquet(job):
+    for d in job['log_dest']:
+        label = job['label'] + "Log destination '" + str(d.get('name')) + "': "
+        if d.get('format') != "parquet":
+            d['parquet'] = None
+            continue
+        if pyarrow is None:
+            logger.critical(str(datetime.now()) + " --- " + label + "Parquet format requires pyarrow library. Please install it with 'pip3 install pyarrow', or use ndjson format instead.")
+            sys.exit(2)
+        if job['log_type'] == "audit":
+            logger.critical(str(datetime.now()) + " --- " + label + "Cloudflare Audit logs cannot be written in Parquet format. Please use ndjson format instead.")
+            sys.exit(2)
+        if d.get('parquet_row_group_size') is not None and d.get('parquet_row_group_size') < 1:
+            logger.critical(str(datetime.now()) + " --- " + label + "Invalid parquet_row_group_size specified. Please specify a value larger than 0.")
+            sys.exit(2)
+
+        pipeline = d.get('pipeline') or {'drop': [], 'redact': []}
+        arrow_types = {"int64": pyarrow.int64(), "float64": pyarrow.float64(), "bool": pyarrow.bool_(), "timestamp": pyarrow.timestamp("ns", tz="UTC"), "list": pyarrow.list_(pyarrow.string()), "map": pyarrow.map_(pyarrow.string(), pyarrow.string())}
+        schema = pyarrow.schema([pyarrow.field(field, pyarrow.string() if field in pipeline['redact'] else arrow_types.get(PARQUET_FIELD_TYPES.get(field), pyarrow.string())) for field in job['fields'] if field not in pipeline['drop']])
+        dictionary_fields = d.get('parquet_dictionary_fields') if d.get('parquet_dictionary_fields') is not None else PARQUET_DICTIONARY_FIELDS
+        d['parquet'] = {'schema': schema, 'row_group_size': d.get('parquet_row_group_size') or PARQUET_ROW_GROUP_SIZE, 'dictionary': [field for field in schema.names if field in dictionary_fields]}
+
+'''
+This method opens the queue of a logpull job configured in the config file (jobs). Each job has its own queue, so the failed tasks of different jobs are kept apart.
+'''
+def open_job_queue(name):
+    return persistqueue.SQLiteQueue(os.path.join(state_dir, "queue", "jobs", name) + "/", auto_commit=True, multithreading=True)
+
+'''
+This method returns all the items in the given queues. If the queues belong to the jobs configured in the config file, the name of the job is added to each item.
+'''
+def get_queue_items(job_queues):
+    items = []
+    for name, job_queue in job_queues:
+        for item in job_queue.queue():
+            if name is not None:
+                item['job'] = name
+            items.append(item)
+    return items
+
+'''
+This method reads the tasks in the queue of a job once, and returns them as a heap of (time when the task is due, ID in the queue, task), see queue_thread().
+Tasks without the time when they are due (added by older versions of the program) are due immediately.
+'''
+def get_due_heap(job_queue):
+    due_heap = [(item['data'].get('next_attempt_utc') or datetime.min, item['id'], item['data']) for item in job_queue.queue()]
+    heapq.heapify(due_heap)
+    return due_heap
+
+'''
+This method adds the tasks which have been put into the queue of a job by another process (e.g. --find-gaps with --fill-gaps queue) to the heap of the job, and returns the number of tasks added.
+The tasks put by this process are already in the heap (see enqueue_failed()), and the tasks being retried are no longer in the queue, so the tasks which are not in the heap are the new ones.
+persist-queue only counts the tasks put and taken by this process, so the size of the queue is corrected as well.
+'''
+def merge_due_heap(job):
+    with queue_lock:
+        items = job['queue'].queue()
+        with thread_lock:
+            known_ids = set(e[1] for e in job['due_heap'])
+            new_entries = [(item['data'].get('next_attempt_utc') or datetime.min, item['id'], item['data']) for item in items if item['id'] not in known_ids]
+            for e in new_entries:
+                heapq.heappush(job['due_heap'], e)
+        job['queue'].total = len(items)
+    return len(new_entries)
 
 '''
 This method is to retrieve the YAML schema from the schema file (schema.yml), and return the value of the schema to the caller.
@@ -526,25 +1290,603 @@ def uninstall_service():
 
 '''
 This method will be invoked after initialize_arg().
-This method is to verify whether the Cloudflare Zone ID/Account ID (depending on the log type) and Cloudflare API Token given by the user is valid.
-If it is not valid, an error message will be given to the user and the program will exit
+This method creates a HTTP session and a rate limiter which are shared by all logpull processes, the queue thread and the credential verification.
+Connections to Cloudflare API are kept alive and reused across requests, so that a new TCP connection and TLS handshake is not required for every logpull.
 '''
-def verify_credential():
-    
-    global logger
+def initialize_session():
+    global session, rate_limiter
 
-    if log_type == "http":
-        #specify the Cloudflare API URL to check the Zone ID and API Token
-        url = "https://api.cloudflare.com/client/v4/zones/" + zone_id + "/logs/received"
-        headers = {"Authorization": "Bearer " + api_token, "Content-Type": "application/json"}
+    session = requests.Session()
+    #up to pool_size connections are kept alive in the pool. Retry is handled by the queue thread, so the adapter should not retry by itself.
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0, pool_block=False)
+    #the requests and connections of the pool are counted in the metrics
+    adapter.poolmanager.pool_classes_by_scheme = {"http": CountedHTTPConnectionPool, "https": CountedHTTPSConnectionPool}
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
 
-        #make a HTTP request to the Cloudflare API
-        try:
-            r = requests.get(url, headers=headers)
-            r.encoding = "utf-8"
-        except Exception as e:
-            logger.critical(str(datetime.now()) + " --- Unable to perform API request to Cloudflare: " + str(e))
-            sys.exit(2)
+    #create the rate limiter shared by all the requests to Cloudflare API
+    rate_limiter = RateLimiter(api_rate_limit, api_rate_burst)
+
+'''
+This class is a token bucket rate limiter shared by every request to Cloudflare API, so that the program stays just under the rate limit of the account instead of being throttled repeatedly.
+Tokens are refilled at api_rate_limit per second, up to api_rate_burst tokens. Each request takes one token, and waits if there's no token left.
+Logpull windows scheduled by the main loop have priority over the tasks retried from the queue: retries only get a token when no scheduled request is waiting for one.
+When Cloudflare API responds with HTTP 429 or tells that no more requests are allowed (Retry-After and RateLimit headers), all requests will be paused until the given time, and the refill rate will be halved.
+The refill rate will then slowly increase back to api_rate_limit as the requests succeed.
+'''
+class RateLimiter:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.current_rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.blocked_until = 0
+        self.scheduled_waiting = 0
+        self.condition = threading.Condition()
+
+    #add tokens to the bucket based on the time elapsed since the last update
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.current_rate)
+        self.updated = now
+
+    #take one token from the bucket, and wait until a token is available if the bucket is empty
+    def acquire(self, priority=PRIORITY_SCHEDULED):
+        if self.rate <= 0:
+            return
+        with self.condition:
+            if priority == PRIORITY_SCHEDULED:
+                self.scheduled_waiting += 1
+            try:
+                while is_exit is False:
+                    now = time.monotonic()
+                    self.refill(now)
+                    wait = self.blocked_until - now
+                    if wait <= 0:
+                        if priority == PRIORITY_SCHEDULED or self.scheduled_waiting == 0:
+                            if self.tokens >= 1:
+                                self.tokens -= 1
+                                return
+                            wait = (1 - self.tokens) / self.current_rate
+                        else:
+                            #let the scheduled requests go first. Will be notified once they have got their tokens.
+                            wait = 1
+                    self.condition.wait(wait)
+            finally:
+                if priority == PRIORITY_SCHEDULED:
+                    self.scheduled_waiting -= 1
+                    self.condition.notify_all()
+
+    #the asyncio version of acquire(), which waits for a token without blocking the event loop
+    async def acquire_async(self, priority=PRIORITY_SCHEDULED):
+        if self.rate <= 0:
+            return
+        with self.condition:
+            if priority == PRIORITY_SCHEDULED:
+                self.scheduled_waiting += 1
+        try:
+            while is_exit is False:
+                with self.condition:
+                    now = time.monotonic()
+                    self.refill(now)
+                    wait = self.blocked_until - now
+                    if wait <= 0:
+                        if priority == PRIORITY_SCHEDULED or self.scheduled_waiting == 0:
+                            if self.tokens >= 1:
+                                self.tokens -= 1
+                                return
+                            wait = (1 - self.tokens) / self.current_rate
+                        else:
+                            wait = 1
+                await asyncio.sleep(min(wait, 1))
+        finally:
+            if priority == PRIORITY_SCHEDULED:
+                with self.condition:
+                    self.scheduled_waiting -= 1
+                    self.condition.notify_all()
+
+    #pause all requests for the given number of seconds
+    def pause(self, seconds):
+        with self.condition:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+            self.tokens = 0
+
+    #adjust the rate limiter according to the HTTP response code and headers of the response from Cloudflare API
+    def update(self, status_code, headers):
+        if self.rate <= 0:
+            return
+        retry_after = get_retry_after(headers)
+        if status_code == 429:
+            with self.condition:
+                self.current_rate = max(self.rate / 10, self.current_rate / 2)
+            self.pause(retry_after if retry_after is not None else 60)
+            logger.warning(str(datetime.now()) + " --- Rate limited by Cloudflare API. Pausing all requests for " + str(retry_after if retry_after is not None else 60) + " seconds, and reducing the request rate to " + str(round(self.current_rate, 2)) + " per second.")
+        else:
+            if retry_after is not None:
+                self.pause(retry_after)
+            with self.condition:
+                self.current_rate = min(self.rate, self.current_rate + self.rate / 20)
+
+'''
+This method returns the number of seconds that Cloudflare API asks the client to wait before the next request, based on the Retry-After header,
+or the RateLimit header when the remaining number of requests is 0. None will be returned if there's nothing to wait.
+'''
+def get_retry_after(headers):
+    retry_after = headers.get("Retry-After")
+    if retry_after:
+        try:
+            return max(float(retry_after), 0)
+        except ValueError:
+            #Retry-After can also be a HTTP date
+            try:
+                return max((parsedate_to_datetime(retry_after) - datetime.now(timezone.utc)).total_seconds(), 0)
+            except Exception:
+                pass
+
+    #RateLimit header can be either "limit=1200, remaining=0, reset=30" or "default";r=0;t=30
+    ratelimit = headers.get("RateLimit")
+    if ratelimit:
+        values = {}
+        for item in ratelimit.replace(",", ";").split(";"):
+            if "=" in item:
+                key, value = item.split("=", 1)
+                values[key.strip()] = value.strip()
+        remaining = values.get("remaining", values.get("r"))
+        reset = values.get("reset", values.get("t"))
+        try:
+            if remaining is not None and reset is not None and int(remaining) <= 0:
+                return max(float(reset), 0)
+        except ValueError:
+            pass
+
+    return None
+
+'''
+This method performs a GET request with the shared HTTP session. All requests to Cloudflare API should go through this method.
+Each request will take a token from the rate limiter first. Specify priority=PRIORITY_RETRY for the requests made by the tasks retried from the queue.
+If timing (a dictionary) is given, the time when the request is sent (after waiting for the rate limiter) will be recorded as timing['sent'],
+and the time when the headers of the response are received will be recorded as timing['first_byte'].
+'''
+def http_get(url, headers, stream=False, priority=PRIORITY_SCHEDULED, timing=None):
+    rate_limiter.acquire(priority)
+    if timing is not None:
+        timing['sent'] = time.monotonic()
+    r = session.get(url, headers=headers, stream=stream)
+    if timing is not None:
+        timing['first_byte'] = time.monotonic()
+    rate_limiter.update(r.status_code, r.headers)
+    #elapsed is the time between sending the request and receiving the headers of the response
+    metrics.observe("cf_logs_downloader_time_to_first_byte_seconds", {}, r.elapsed.total_seconds())
+    return r
+
+'''
+This method will be invoked after initialize_arg().
+This method creates the metrics of the program, and starts the metrics endpoint if metrics_port is specified by the user.
+The metrics endpoint serves the metrics at http://metrics_address:metrics_port/metrics in Prometheus text format, from a separate thread.
+'''
+def initialize_metrics():
+    global metrics
+
+    metrics = Metrics()
+    #the metrics endpoint is not started for --find-gaps and --compact, as the program may be running as a service with the same port
+    if metrics_port == 0 or find_gaps_range is not None or compact_period is not None:
+        return
+
+    try:
+        server = http.server.ThreadingHTTPServer((metrics_address, metrics_port), MetricsHandler)
+    except Exception as e:
+        logger.critical(str(datetime.now()) + " --- Unable to start the metrics endpoint on " + metrics_address + ":" + str(metrics_port) + ": " + str(e) + ".")
+        sys.exit(2)
+    #the thread will not keep the program running after all the other threads have exited
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logger.info(str(datetime.now()) + " --- Metrics endpoint started at http://" + metrics_address + ":" + str(metrics_port) + "/metrics.")
+
+'''
+This method opens the manifest of the logfiles (manifest.db in the state folder), unless the user disables it.
+'''
+def initialize_manifest():
+    global manifest
+
+    if use_manifest is False:
+        return
+    try:
+        manifest = Manifest(os.path.join(state_dir, "manifest.db"))
+    except Exception as e:
+        logger.critical(str(datetime.now()) + " --- Unable to open the manifest: " + str(e) + ".")
+        sys.exit(2)
+
+'''
+This class keeps the manifest of the logfiles which have been written, in a SQLite database. Each logfile is identified by the log type, the Zone ID/Account ID (scope),
+the log range and the name of the log destination, together with the path, the size (bytes), the number of records (if known) and the SHA-256 checksum of the logfile.
+Log ranges without any logs (Cloudflare Access and Audit logs) are recorded as well, without path.
+The manifest tells whether a log range has been written to a log destination with one query, instead of checking the logfile of each log destination in local storage.
+Once a logfile has been merged by --compact, the path, offset and length of its window within the compacted logfile are recorded as well.
+'''
+class Manifest:
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS logfiles (log_type TEXT NOT NULL, scope TEXT NOT NULL, log_start_time TEXT NOT NULL, log_end_time TEXT NOT NULL, dest TEXT NOT NULL, path TEXT, bytes INTEGER, records INTEGER, sha256 TEXT, job TEXT, written_at TEXT NOT NULL, compacted_path TEXT, compacted_offset INTEGER, compacted_length INTEGER, PRIMARY KEY (log_type, scope, log_start_time, log_end_time, dest))")
+        #the manifest created before --compact was introduced does not have the columns of compacted logfiles
+        columns = [row[1] for row in self.connection.execute("PRAGMA table_info(logfiles)")]
+        for column in ("compacted_path TEXT", "compacted_offset INTEGER", "compacted_length INTEGER"):
+            if column.split()[0] not in columns:
+                self.connection.execute("ALTER TABLE logfiles ADD COLUMN " + column)
+        self.connection.commit()
+
+    #the Zone ID or Account ID of the job
+    @staticmethod
+    def scope(job):
+        return job['zone_id'] if job['log_type'] == "http" else job['account_id']
+
+    #return the logfiles of a log range which have been written, as a dictionary of the name of the log destination: path of the logfile ("" if there's no logs in the log range)
+    def get(self, job, log_start_time_rfc3339, log_end_time_rfc3339):
+        with self.lock:
+            rows = self.connection.execute("SELECT dest, path FROM logfiles WHERE log_type = ? AND scope = ? AND log_start_time = ? AND log_end_time = ?", (job['log_type'], self.scope(job), log_start_time_rfc3339, log_end_time_rfc3339)).fetchall()
+        return {dest: path or "" for dest, path in rows}
+
+    #record the logfiles which have been written. Each logfile is a dictionary with name, path, log_start_time, log_end_time, bytes, records and sha256 (see commit_timed()).
+    def add(self, job, logfiles):
+        written_at = datetime.utcnow().isoformat() + 'Z'
+        rows = [(job['log_type'], self.scope(job), l.get('log_start_time'), l.get('log_end_time'), l.get('name'), str(l.get('path')) if l.get('path') else None, l.get('bytes'), l.get('records'), l.get('sha256'), job['name'] or "default", written_at) for l in logfiles]
+        with self.lock, self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO logfiles (log_type, scope, log_start_time, log_end_time, dest, path, bytes, records, sha256, job, written_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    #record that the windows of a log destination have been merged into a compacted logfile (see compact_logfiles()). Each window is a dictionary with log_start_time, log_end_time, offset and length.
+    #the path of the logfile of each window is kept, so that the window is still known to be written.
+    def set_compacted(self, job, dest, compacted_path, windows):
+        rows = [(str(compacted_path), w['offset'], w['length'], job['log_type'], self.scope(job), w['log_start_time'], w['log_end_time'], dest) for w in windows]
+        with self.lock, self.connection:
+            self.connection.executemany("UPDATE logfiles SET compacted_path = ?, compacted_offset = ?, compacted_length = ? WHERE log_type = ? AND scope = ? AND log_start_time = ? AND log_end_time = ? AND dest = ?", rows)
+
+    #return the log ranges (log start time, log end time) written to a log destination which overlap with the given log range, sorted by the log start time.
+    #the end time of Cloudflare Access and Audit log ranges is inclusive, so the log ranges which end at the start time are included as well.
+    def get_ranges(self, job, dest, log_start_time_rfc3339, log_end_time_rfc3339):
+        with self.lock:
+            return self.connection.execute("SELECT log_start_time, log_end_time FROM logfiles WHERE log_type = ? AND scope = ? AND log_start_time < ? AND log_end_time >= ? AND dest = ? ORDER BY log_start_time", (job['log_type'], self.scope(job), log_end_time_rfc3339, log_start_time_rfc3339, dest)).fetchall()
+
+    #return all the logfiles recorded in the manifest, sorted by the log start time
+    def query(self):
+        with self.lock:
+            cursor = self.connection.execute("SELECT * FROM logfiles ORDER BY log_start_time, log_type, scope, dest")
+            columns = [c[0] for c in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+'''
+This method records the logfiles of a logpull window in the manifest (if enabled), after they have been written.
+'''
+def add_to_manifest(job, logfiles):
+    if manifest is None or not logfiles:
+        return
+    try:
+        manifest.add(job, logfiles)
+    except Exception as e:
+        logger.warning(str(datetime.now()) + " --- " + job['label'] + "Unable to record " + str(len(logfiles)) + " logfile(s) in the manifest: " + str(e) + ".")
+
+'''
+This method returns the regular expression which matches the name of the logfiles of a log destination (see prepare_path()), with the log start time and log end time as the groups.
+'''
+def get_logfile_name_pattern(d):
+    return re.compile(re.escape(d.get('prefix')) + r"_(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}Z)~(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}Z)" + re.escape(get_logfile_extension(d)) + "$")
+
+'''
+This method returns the file extension of the logfiles of a log destination: .parquet for Parquet files, or the extension of the compression codec for JSON (see COMPRESSION_EXTENSIONS).
+'''
+def get_logfile_extension(d):
+    return ".parquet" if d.get('parquet') else COMPRESSION_EXTENSIONS[get_codec(d)['name']]
+
+'''
+This method adds the logfiles which already exist in the log destinations of a job to the manifest (--rebuild-manifest), e.g. the logfiles written before the manifest was introduced.
+The log range of each logfile is taken from the name of the logfile (see prepare_path()), or from the index of compacted logfiles. The number of records and the checksum are not known.
+'''
+def rebuild_manifest(job):
+    for d in job['log_dest']:
+        #stream log destinations do not keep the records
+        if d.get('stream'):
+            continue
+        logfile_name_pattern = get_logfile_name_pattern(d)
+        logfiles = []
+        compacted = []
+        #the logfiles of S3 log destinations are listed in the bucket instead
+        if d.get('s3'):
+            key_prefix = split_s3_path(d.get('path'))[1]
+            for logfile_path, size in iter_s3_objects(d, key_prefix + "/" if key_prefix else ""):
+                matched = logfile_name_pattern.match(logfile_path.rsplit("/", 1)[-1])
+                if matched:
+                    logfiles.append({'name': d.get('name'), 'path': logfile_path, 'log_start_time': matched.group(1), 'log_end_time': matched.group(2), 'bytes': size})
+        for dirpath, dirnames, filenames in (os.walk(d.get('path')) if not d.get('s3') else []):
+            for filename in filenames:
+                matched = logfile_name_pattern.match(filename)
+                if matched:
+                    logfile_path = os.path.join(dirpath, filename)
+                    #a compacted logfile (see compact_logfiles()) is added as the windows in its index
+                    windows = read_compaction_index(logfile_path)
+                    if windows is None:
+                        logfiles.append({'name': d.get('name'), 'path': logfile_path, 'log_start_time': matched.group(1), 'log_end_time': matched.group(2), 'bytes': os.path.getsize(logfile_path)})
+                    else:
+                        logfiles.extend({'name': d.get('name'), 'path': logfile_path, 'log_start_time': w['log_start_time'], 'log_end_time': w['log_end_time'], 'bytes': w['length']} for w in windows)
+                        compacted.append((logfile_path, windows))
+        manifest.add(job, logfiles)
+        for logfile_path, windows in compacted:
+            manifest.set_compacted(job, d.get('name'), logfile_path, windows)
+        logger.info(str(datetime.now()) + " --- " + job['label'] + str(len(logfiles)) + " logfile(s) in " + d.get('path') + " (" + d.get('name') + ") added to the manifest.")
+
+'''
+This class keeps the counters, gauges and histograms of the program, and renders them in Prometheus text format.
+Each value is identified by the name of the metric and its labels (a dictionary). The type and help text of each metric are defined in METRICS_HELP.
+'''
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = {}
+        self.histograms = {}
+
+    #the key of a value: the name of the metric, and the labels sorted by their names
+    def key(self, name, labels):
+        return (name, tuple(sorted(labels.items())))
+
+    #add the value to a counter or gauge. Use a negative value to decrease a gauge.
+    def inc(self, name, labels, value=1):
+        key = self.key(name, labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + value
+
+    #set the value of a gauge
+    def set(self, name, labels, value):
+        with self.lock:
+            self.values[self.key(name, labels)] = value
+
+    #set the value of a gauge, only if it's larger than the current value
+    def set_max(self, name, labels, value):
+        key = self.key(name, labels)
+        with self.lock:
+            self.values[key] = max(self.values.get(key, value), value)
+
+    #return the value of a counter or gauge, or None if it has not been set
+    def get(self, name, labels):
+        with self.lock:
+            return self.values.get(self.key(name, labels))
+
+    #add an observation to a histogram. The buckets are cumulative, followed by the sum and the count of the observations.
+    def observe(self, name, labels, value):
+        key = self.key(name, labels)
+        with self.lock:
+            histogram = self.histograms.setdefault(key, [0] * len(LATENCY_BUCKETS) + [0, 0])
+            for i, bucket in enumerate(LATENCY_BUCKETS):
+                if value <= bucket:
+                    histogram[i] += 1
+            histogram[-2] += value
+            histogram[-1] += 1
+
+    #render all the metrics in Prometheus text format
+    def render(self):
+        lines = []
+        with self.lock:
+            samples = [(name, labels, "", value) for (name, labels), value in self.values.items()]
+            for (name, labels), histogram in self.histograms.items():
+                for i, bucket in enumerate(LATENCY_BUCKETS):
+                    samples.append((name, labels + (("le", str(bucket)),), "_bucket", histogram[i]))
+                samples.append((name, labels + (("le", "+Inf"),), "_bucket", histogram[-1]))
+                samples.append((name, labels, "_sum", histogram[-2]))
+                samples.append((name, labels, "_count", histogram[-1]))
+
+        last_name = None
+        for name, labels, suffix, value in sorted(samples, key=lambda sample: sample[0]):
+            if name != last_name:
+                metric_type, help_text = METRICS_HELP.get(name, ("untyped", ""))
+                lines.append("# HELP " + name + " " + help_text)
+                lines.append("# TYPE " + name + " " + metric_type)
+                last_name = name
+            label_text = ",".join(k + '="' + str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"' for k, v in labels)
+            lines.append(name + suffix + ("{" + label_text + "}" if label_text else "") + " " + str(value))
+        return "\n".join(lines) + "\n"
+
+#the type and help text of each metric
+METRICS_HELP = {
+    "cf_logs_downloader_windows_total": ("counter", "Number of logpull windows, by result (pulled, failed or skipped because the logfile already exists)."),
+    "cf_logs_downloader_bytes_downloaded_total": ("counter", "Number of bytes downloaded from Cloudflare API."),
+    "cf_logs_downloader_bytes_written_total": ("counter", "Number of bytes written to each log destination."),
+    "cf_logs_downloader_request_duration_seconds": ("histogram", "Time from sending a logpull request until the whole response has been downloaded."),
+    "cf_logs_downloader_time_to_first_byte_seconds": ("histogram", "Time from sending a request to Cloudflare API until the response headers are received."),
+    "cf_logs_downloader_api_requests_total": ("counter", "Number of requests to Cloudflare API."),
+    "cf_logs_downloader_api_connections_opened_total": ("counter", "Number of connections opened to Cloudflare API."),
+    "cf_logs_downloader_api_connections_reused_total": ("counter", "Number of requests to Cloudflare API which reused a kept alive connection, i.e. the requests which did not open a new connection."),
+    "cf_logs_downloader_queue_size": ("gauge", "Number of failed logpull tasks waiting in the queue."),
+    "cf_logs_downloader_logpull_in_flight": ("gauge", "Number of logpull tasks in progress."),
+    "cf_logs_downloader_last_log_end_time_seconds": ("gauge", "Unix time of the end of the latest log range which has been pulled successfully."),
+    "cf_logs_downloader_ingest_lag_seconds": ("gauge", "Seconds between now and the end of the latest log range which has been pulled successfully."),
+    "cf_logs_downloader_window_seconds": ("gauge", "Current length of the logpull windows, adjusted by adaptive window sizing."),
+    "cf_logs_downloader_checkpoint_time_seconds": ("gauge", "Unix time before which all the logpull windows have been written or added to the queue. The program resumes from here after it restarts."),
+    "cf_logs_downloader_catch_up_seconds": ("gauge", "Seconds spent pulling the log range missed while the program was not running."),
+    "cf_logs_downloader_catch_up_remaining_seconds": ("gauge", "Seconds of log range missed while the program was not running which are still waiting to be pulled."),
+}
+
+'''
+This class handles the requests to the metrics endpoint. Only /metrics is available.
+'''
+class MetricsHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = collect_metrics().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    #do not print every request to the terminal
+    def log_message(self, format, *args):
+        pass
+
+'''
+This method updates the metrics which are only known when the metrics are requested (queue size, ingest lag and reused connections), then renders all the metrics.
+'''
+def collect_metrics():
+    now = time.time()
+    requests_sent = metrics.get("cf_logs_downloader_api_requests_total", {})
+    if requests_sent is not None:
+        metrics.set("cf_logs_downloader_api_connections_reused_total", {}, max(requests_sent - (metrics.get("cf_logs_downloader_api_connections_opened_total", {}) or 0), 0))
+    for job in jobs:
+        labels = get_metrics_labels(job)
+        metrics.set("cf_logs_downloader_queue_size", labels, job['queue'].size)
+        last_log_end_time = metrics.get("cf_logs_downloader_last_log_end_time_seconds", labels)
+        if last_log_end_time is not None:
+            metrics.set("cf_logs_downloader_ingest_lag_seconds", labels, round(now - last_log_end_time, 3))
+    return metrics.render()
+
+'''
+This method returns the labels of the metrics of a job.
+'''
+def get_metrics_labels(job):
+    return {'job': job['name'] or "default", 'log_type': job['log_type']}
+
+'''
+This method counts a logpull window in the metrics by its result (pulled | failed | skipped), and writes the record of the window to windows.log (see write_window_record()).
+For windows pulled successfully, log_end_time_utc is used to calculate the ingest lag.
+'''
+def record_window(job, stats, result, reason=None, log_end_time_utc=None):
+    labels = get_metrics_labels(job)
+    metrics.inc("cf_logs_downloader_windows_total", dict(labels, result=result))
+    if log_end_time_utc is not None:
+        metrics.set_max("cf_logs_downloader_last_log_end_time_seconds", labels, log_end_time_utc.replace(tzinfo=timezone.utc).timestamp())
+    write_window_record(job, stats, result, reason)
+    update_adaptive_window(job, stats, result)
+    #failed windows are settled once they have been added to the queue (see handle_logpull_failure())
+    if result != "failed":
+        settle_window(job, stats['log_start_time_utc'], get_window_end(job, stats['log_end_time_utc']))
+
+'''
+This method creates the dictionary to collect the timings and statistics of a logpull window, from the moment the window is started.
+The dictionary is filled by get_logpull_dest(), http_get() and write_logs_stream() / write_logs_split() as the window goes through each stage.
+'''
+def new_window_stats(log_start_time_utc, log_end_time_utc, retry=False, attempts=0, windows=None):
+    return {'started': time.monotonic(), 'log_start_time_utc': log_start_time_utc, 'log_end_time_utc': log_end_time_utc, 'retry': retry, 'attempts': attempts, 'coalesced': len(windows) if windows else 0}
+
+'''
+This method writes the record of a logpull window to windows.log, as one JSON object per line. All the timings are in seconds:
+- prepare: preparing the folders and checking the existing logfiles of the log destinations
+- rate_limit_wait: waiting for the rate limiter before the request is sent
+- first_byte: from sending the request to receiving the headers of the response
+- download: receiving the response body (and the rest of the pages for Cloudflare Access and Audit logs)
+- encode: compressing or decompressing the logs
+- write: writing the logs to each log destination, by the name of the log destination
+- total: from the start of the window until now
+A timing or statistic is null if the window did not reach that stage. records is null if the logs were kept as Cloudflare compressed them for every log destination (see get_encoder()).
+'''
+def write_window_record(job, stats, result, reason=None):
+    def seconds(value):
+        return round(value, 6) if value is not None else None
+
+    record = {
+        'time': datetime.now(timezone.utc).isoformat(),
+        'job': job['name'] or "default",
+        'log_type': job['log_type'],
+        'log_start_time_utc': stats['log_start_time_utc'].isoformat() + 'Z',
+        'log_end_time_utc': stats['log_end_time_utc'].isoformat() + 'Z',
+        'result': result,
+        'reason': reason,
+        'retry': stats['retry'],
+        'attempts': stats['attempts'],
+        'coalesced': stats['coalesced'],
+        'timings': {
+            'prepare': seconds(stats.get('prepare')),
+            'rate_limit_wait': seconds(stats['sent'] - stats['requested']) if 'sent' in stats else None,
+            'first_byte': seconds(stats['first_byte'] - stats['sent']) if 'first_byte' in stats else None,
+            'download': seconds(stats.get('download')),
+            'encode': seconds(stats.get('encode')),
+            'write': {name: seconds(value) for name, value in stats['write'].items()} if 'write' in stats else None,
+            'total': seconds(time.monotonic() - stats['started'])
+        },
+        'bytes_downloaded': stats.get('bytes_downloaded'),
+        'bytes_written': stats.get('bytes_written'),
+        'records': stats.get('records')
+    }
+    window_logger.info(json.dumps(record))
+
+'''
+This method passes the chunks of the logs through while counting the bytes downloaded in the metrics.
+Once all the chunks have been downloaded, the time since the request was sent (timing['sent'], see http_get()) is recorded as the request duration.
+'''
+def iter_counted_chunks(job, chunks, timing):
+    labels = get_metrics_labels(job)
+    for chunk in chunks:
+        metrics.inc("cf_logs_downloader_bytes_downloaded_total", labels, len(chunk))
+        yield chunk
+    metrics.observe("cf_logs_downloader_request_duration_seconds", labels, time.monotonic() - timing.get('sent', time.monotonic()))
+
+'''
+These methods count the requests to Cloudflare API and the connections opened by the HTTP session in the metrics. The requests which did not open a connection reused one (see collect_metrics()).
+'''
+def count_api_request():
+    metrics.inc("cf_logs_downloader_api_requests_total", {})
+
+def count_api_connection():
+    metrics.inc("cf_logs_downloader_api_connections_opened_total", {})
+
+'''
+These classes are the connection pools of the shared HTTP session (see initialize_session()), which count the requests and connections in the metrics (see count_api_request()).
+Each request takes a connection from the pool, and the pool creates a new connection when there is no kept alive connection left.
+'''
+class CountedHTTPConnectionPool(urllib3.HTTPConnectionPool):
+    def _get_conn(self, timeout=None):
+        count_api_request()
+        return super()._get_conn(timeout)
+
+    def _new_conn(self):
+        count_api_connection()
+        return super()._new_conn()
+
+class CountedHTTPSConnectionPool(urllib3.HTTPSConnectionPool):
+    def _get_conn(self, timeout=None):
+        count_api_request()
+        return super()._get_conn(timeout)
+
+    def _new_conn(self):
+        count_api_connection()
+        return super()._new_conn()
+
+'''
+This method returns the trace config of the HTTP session of the asyncio engine, which counts the requests and connections in the metrics (see count_api_connection()).
+'''
+def get_async_trace_config():
+    async def on_request_start(session, context, params):
+        count_api_request()
+
+    async def on_connection_create_end(session, context, params):
+        count_api_connection()
+
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_start.append(on_request_start)
+    trace_config.on_connection_create_end.append(on_connection_create_end)
+    return trace_config
+
+'''
+This method will be invoked after initialize_arg(), once for each logpull job.
+This method is to verify whether the Cloudflare Zone ID/Account ID (depending on the log type) and Cloudflare API Token given by the user is valid.
+If it is not valid, an error message will be given to the user and the program will exit
+'''
+def verify_credential(job):
+    
+    global logger
+
+    log_type, zone_id, account_id, api_token = job['log_type'], job['zone_id'], job['account_id'], job['api_token']
+
+    if log_type == "http":
+        #specify the Cloudflare API URL to check the Zone ID and API Token
+        url = api_url + "/zones/" + zone_id + "/logs/received"
+        headers = {"Authorization": "Bearer " + api_token, "Content-Type": "application/json"}
+
+        #make a HTTP request to the Cloudflare API
+        try:
+            r = http_get(url, headers=headers)
+            r.encoding = "utf-8"
+        except Exception as e:
+            logger.critical(str(datetime.now()) + " --- " + job['label'] + "Unable to perform API request to Cloudflare: " + str(e))
+            sys.exit(2)
         
         #if there's an error, Cloudflare API will return a JSON object to indicate the error
         #and if it's not, a plain text will be returned instead
@@ -552,22 +1894,22 @@ def verify_credential():
         try:
             response = json.loads(r.text)
             if response["success"] is False:
-                logger.critical(str(datetime.now()) + " --- Failed to authenticate with Cloudflare API. Please check your Zone ID and Cloudflare API Token.")
+                logger.critical(str(datetime.now()) + " --- " + job['label'] + "Failed to authenticate with Cloudflare API. Please check your Zone ID and Cloudflare API Token.")
                 sys.exit(2)
         except json.JSONDecodeError:
             #a non-JSON object returned by Cloudflare indicates that authentication successful
             pass
     elif log_type == 'access':
         #specify the Cloudflare API URL to check the Account ID and API Token
-        url = "https://api.cloudflare.com/client/v4/accounts/" + account_id + "/access/logs/access_requests"
+        url = api_url + "/accounts/" + account_id + "/access/logs/access_requests"
         headers = {"Authorization": "Bearer " + api_token, "Content-Type": "application/json"}
         
         #make a HTTP request to the Cloudflare API
         try:
-            r = requests.get(url, headers=headers)
+            r = http_get(url, headers=headers)
             r.encoding = "utf-8"
         except Exception as e:
-            logger.critical(str(datetime.now()) + " --- Unable to perform API request to Cloudflare: " + str(e))
+            logger.critical(str(datetime.now()) + " --- " + job['label'] + "Unable to perform API request to Cloudflare: " + str(e))
             sys.exit(2)
         
         #Cloudflare API should always return a JSON object to indicate whether the request is successful or not.
@@ -575,24 +1917,24 @@ def verify_credential():
         try:
             response = json.loads(r.text)
             if response["success"] is False:
-                logger.critical(str(datetime.now()) + " --- Failed to authenticate with Cloudflare API. Please check your Account ID and Cloudflare API Token.")
+                logger.critical(str(datetime.now()) + " --- " + job['label'] + "Failed to authenticate with Cloudflare API. Please check your Account ID and Cloudflare API Token.")
                 sys.exit(2)
             else:
                 #no errors. Can proceed with logpull.
                 pass
         except json.JSONDecodeError as e:
-            logger.critical(str(datetime.now()) + " --- Unable to perform API request to Cloudflare: " + str(e))
+            logger.critical(str(datetime.now()) + " --- " + job['label'] + "Unable to perform API request to Cloudflare: " + str(e))
     elif log_type == 'audit':
         #specify the Cloudflare API URL to check the Account ID and API Token
-        url = "https://api.cloudflare.com/client/v4/accounts/" + account_id + "/audit_logs?per_page=1"
+        url = api_url + "/accounts/" + account_id + "/audit_logs?per_page=1"
         headers = {"Authorization": "Bearer " + api_token, "Content-Type": "application/json"}
         
         #make a HTTP request to the Cloudflare API
         try:
-            r = requests.get(url, headers=headers)
+            r = http_get(url, headers=headers)
             r.encoding = "utf-8"
         except Exception as e:
-            logger.critical(str(datetime.now()) + " --- Unable to perform API request to Cloudflare: " + str(e))
+            logger.critical(str(datetime.now()) + " --- " + job['label'] + "Unable to perform API request to Cloudflare: " + str(e))
             sys.exit(2)
         
         #Cloudflare API should always return a JSON object to indicate whether the request is successful or not.
@@ -600,13 +1942,13 @@ def verify_credential():
         try:
             response = json.loads(r.text)
             if response["success"] is False:
-                logger.critical(str(datetime.now()) + " --- Failed to authenticate with Cloudflare API. Please check your Account ID and Cloudflare API Token.")
+                logger.critical(str(datetime.now()) + " --- " + job['label'] + "Failed to authenticate with Cloudflare API. Please check your Account ID and Cloudflare API Token.")
                 sys.exit(2)
             else:
                 #no errors. Can proceed with logpull.
                 pass
         except json.JSONDecodeError as e:
-            logger.critical(str(datetime.now()) + " --- Unable to perform API request to Cloudflare: " + str(e))
+            logger.critical(str(datetime.now()) + " --- " + job['label'] + "Unable to perform API request to Cloudflare: " + str(e))
 
 '''
 This method is to initialize the folder with the date and time of the logs being stored on local storage as the name of the folder
@@ -620,26 +1962,101 @@ def initialize_folder(path_with_date):
 '''
 This method is to prepare the path of where the logfile will be stored and what will be the name of the logfile.
 If the logfile already exists, we assume that the logs has been pulled from Cloudflare previously
+written_path is the path of the logfile recorded in the manifest for the log destination ("" for a log range without logs, False if not recorded).
+If it's given, the manifest is trusted and local storage will not be checked.
+For S3 log destinations (s3, see initialize_s3()), data_folder is the S3 URL of the folder, and the object is looked up in the bucket instead of local storage.
 '''
-def prepare_path(log_start_time_rfc3339, log_end_time_rfc3339, data_folder, logfile_name_prefix, no_gzip):
-    logfile_name = logfile_name_prefix + "_" + log_start_time_rfc3339 + "~" + log_end_time_rfc3339 + (".json" if no_gzip is True else ".json.gz")
-    logfile_path = data_folder / logfile_name
+def prepare_path(log_start_time_rfc3339, log_end_time_rfc3339, data_folder, logfile_name_prefix, extension, written_path=None, s3=None):
+    logfile_name = logfile_name_prefix + "_" + log_start_time_rfc3339 + "~" + log_end_time_rfc3339 + extension
+    logfile_path = data_folder + "/" + logfile_name if s3 else data_folder / logfile_name
     
-    if os.path.exists(str(logfile_path)):
+    if written_path is not None:
+        #the logfile is only considered written if the path is the same, e.g. not if the path of the log destination has been changed
+        exists = written_path == "" or written_path == str(logfile_path)
+    elif s3:
+        exists = s3_object_exists(s3, logfile_path)
+    else:
+        exists = os.path.exists(str(logfile_path))
+
+    if exists:
         return logfile_path, False
     else:
         return logfile_path, True
     
+'''
+This method prepares the list of log destinations for a log range, with the full path (incl. file name) of the logfile in each destination.
+If the logfile already exists in a destination, we assume that the logs has been pulled from Cloudflare previously, and the destination will be excluded.
+'''
+def get_log_dest_per_window(job, current_time, log_start_time_rfc3339, log_end_time_rfc3339):
+    log_dest = job['log_dest']
+    log_dest_per_thread = []
+    log_dest_per_thread_final = []
+
+    #if the user instructs the program to do logpull for only one time, the logs will not be stored in folder that follows the naming convention: date and time
+    if one_time is True or (all(d.get('no_organize') is True for d in log_dest)):
+        pass
+    else:
+        #get the current date and hour, these will be used to initialize the folder to store the logs
+        today_date = str(current_time.date())
+        current_hour = str(current_time.hour) + "00"
+
+    #iterate through the list of objects - log destination configuration
+    for d in log_dest:
+        #check if the user wants to do one-time operation, or instructs not to organize logs into date and time folder
+        #if yes, leave the path value as it is. The records of stream log destinations are not kept in folders either.
+        if d.get('no_organize') is True or one_time is True or d.get('stream'):
+            log_dest_per_thread.append({'name': d.get('name'), 'path': d.get('path'), 'prefix': d.get('prefix'), 'no_gzip': d.get('no_gzip'), 'codec': get_codec(d), 'pipeline': d.get('pipeline'), 'parquet': d.get('parquet'), 's3': d.get('s3'), 'stream': d.get('stream')})
+        #if not, modify the path to include date and time folder
+        else:
+            log_dest_per_thread.append({'name': d.get('name'), 'path': d.get('path') + "/" + today_date + "/" + current_hour, 'prefix': d.get('prefix'), 'no_gzip': d.get('no_gzip'), 'codec': get_codec(d), 'pipeline': d.get('pipeline'), 'parquet': d.get('parquet'), 's3': d.get('s3'), 'stream': d.get('stream')})
+
+    #the logfiles of this log range which have been written, according to the manifest. One query for all the log destinations, instead of checking each logfile in local storage.
+    written_logfiles = manifest.get(job, log_start_time_rfc3339, log_end_time_rfc3339) if manifest is not None else None
+
+    #iterate through the list of objects - log destination configuration
+    for p in log_dest_per_thread:
+        #the records of stream log destinations are not kept anywhere, so only the manifest tells whether they have been sent
+        if p.get('stream'):
+            written_path = written_logfiles.get(p.get('name'), False) if written_logfiles is not None else False
+            if written_path == "" or written_path == p.get('path'):
+                logger.warning(str(datetime.now()) + " --- " + job['label'] + "Log range " + log_start_time_rfc3339 + " to " + log_end_time_rfc3339 + ": Logs have been sent to " + p.get('path') + " already! Skipping.")
+            else:
+                log_dest_per_thread_final.append({'name': p.get('name'), 'path': p.get('path'), 'no_gzip': p.get('no_gzip'), 'codec': p.get('codec'), 'pipeline': p.get('pipeline'), 'parquet': None, 'stream': p.get('stream'), 'log_start_time': log_start_time_rfc3339, 'log_end_time': log_end_time_rfc3339})
+            continue
+
+        #prepare the full path (incl. file name) to store the logs
+        logfile_path, prepare_status = prepare_path(log_start_time_rfc3339, log_end_time_rfc3339, p.get('path') if p.get('s3') else Path(p.get('path')), p.get('prefix'), get_logfile_extension(p), written_logfiles.get(p.get('name'), False) if written_logfiles is not None else None, p.get('s3'))
+
+        #check the returned value from prepare_path() method. if False, means logfile already exists and no further action required
+        if prepare_status is False:
+            logger.warning(str(datetime.now()) + " --- " + job['label'] + "Log range " + log_start_time_rfc3339 + " to " + log_end_time_rfc3339 + ": Logfile " + str(logfile_path) + " already exists! Skipping.")
+        else:
+            #create folder, unless the logfile is uploaded to S3
+            if not p.get('s3'):
+                initialize_folder(p.get('path'))
+            log_dest_per_thread_final.append({'name': p.get('name'), 'path': logfile_path, 'no_gzip': p.get('no_gzip'), 'codec': p.get('codec'), 'pipeline': p.get('pipeline'), 'parquet': p.get('parquet'), 's3': p.get('s3'), 'log_start_time': log_start_time_rfc3339, 'log_end_time': log_end_time_rfc3339})
+
+    return log_dest_per_thread_final
+
+'''
+This method tells whether the records of any log destination are sent to stdout (path: stdout), in which case nothing else can be printed to stdout without breaking the NDJSON stream.
+'''
+def is_stdout_streamed():
+    return any((d.get('stream') or {}).get('type') == "stdout" for job in jobs for d in job['log_dest'])
+
 '''
 A method to check whether the user initiates program exit.
 This method will be triggered every time the logpull thread finishes its job (which is, finish the logpull)
 This method will minus 1 from the total number of running threads, and check whether the user triggers the program exit process.
 If program exit initiated by user, is_exit will become True, and this method will make sure that number of running threads must be zero in order to exit the program gracefully.
 '''
-def check_if_exited():
+def check_if_exited(logpull_task=True):
     global is_exit, num_of_running_thread
-    
-    num_of_running_thread -= 1
+
+    with thread_lock:
+        num_of_running_thread -= 1
+    if logpull_task is True:
+        metrics.inc("cf_logs_downloader_logpull_in_flight", {}, -1)
 
     if is_exit is True and num_of_running_thread <= 0:
         logger.info(str(datetime.now()) + " --- Program exited gracefully.")
@@ -660,212 +2077,2393 @@ def graceful_terminate(signum, frame):
 
     #stop all the sleep timers in other methods, particularly queue_thread()
     event.set()
-    print("")
+
+    print("", file=sys.stderr if is_stdout_streamed() else sys.stdout)
     logger.info(str(datetime.now()) + " --- " + signal.Signals(signum).name + " detected. Initiating program exit. Finishing up log download tasks...")
+
+    #the log ranges waiting to be pulled by adaptive window sizing are put into the queue, so they are not lost
+    enqueue_pending_windows()
     if num_of_running_thread <= 0:
         logger.info(str(datetime.now()) + " --- Program exited gracefully.")
         
     sys.exit(0)
 
 '''
-This method is responsible to write logs to local storage after the logs have been pulled from Cloudflare API.
-Depending on the user preference, logs might need to save in compressed gzip format.
+This class inflates gzipped logs incrementally, chunk by chunk, without ever holding the whole decompressed logs in memory.
+Each decompressed chunk is raw bytes (never decoded to string) and no larger than the chunk size, so it can be written to the file straight away.
+It handles gzip streams made of multiple members as well, in case the members are concatenated together.
 '''
-def write_logs(logfile_path, data, no_gzip):
-    dirname, basename = os.path.split(logfile_path)
-    try:
-        if no_gzip is True:
-            #open the temporary file as write mode if user specifies not to compress the logs. Save the logs from decoded text response.
-            logfile = tempfile.NamedTemporaryFile(mode="w", encoding="utf-8", prefix=basename, dir=dirname)
-            if log_type == "http":
-                #write the decompressed data
-                logfile.write(str(decompress(data).decode(encoding='utf-8')))
-            elif log_type == 'access' or log_type == 'audit':
-                #Cloudflare Access and Audit log does not compress by default. Can write to file directly.
-                logfile.write(data)
-            #after writing logs to temporary file, create a hard link from actual file to the temporary file
-            os.link(logfile.name, logfile_path)
-        else:
-            #open the temporary file as write binary mode to save the logs from raw gzipped response.
-            logfile = tempfile.NamedTemporaryFile(mode="wb", prefix=basename, dir=dirname)
-            if log_type == "http":
-                #write the compressed gzip data
-                logfile.write(data)
-            elif log_type == 'access' or log_type == 'audit':
-                #Cloudflare Access and Audit log does not compress by default. Data compression needs to be applied first.
-                logfile.write(compress(data.encode()))
-            #after writing logs to temporary file, create a hard link from actual file to the temporary file
-            os.link(logfile.name, logfile_path)
-        #close the temporary file and it will automatically deleted
-        logfile.close()
-    except Exception as e:
-        return False, e
-    
-    return True, True
+class GunzipStream:
+    def __init__(self, max_length=None):
+        self.max_length = max_length if max_length else chunk_size
+        self.decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+    #decompress one chunk of gzipped data, and yield the decompressed data in pieces of at most max_length bytes
+    def decompress(self, chunk):
+        while chunk:
+            decompressed_chunk = self.decompressor.decompress(chunk, self.max_length)
+            if decompressed_chunk:
+                yield decompressed_chunk
+            if self.decompressor.eof:
+                #end of the current gzip member. If there's still data left, it belongs to the next gzip member.
+                chunk = self.decompressor.unused_data
+                self.decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            else:
+                chunk = self.decompressor.unconsumed_tail
+
+    #return whatever data left inside the decompressor after all chunks have been fed
+    def flush(self):
+        return self.decompressor.flush()
 
 '''
-This method will be run as a separate thread
-Its main responsibility is to pick up new tasks from the queue and perform the logpull tasks again.
+This method decompresses a stream of gzipped chunks, either from a streamed Cloudflare API response or from an in-memory buffer (see iter_buffer()), and yields raw decompressed chunks.
 '''
-def queue_thread():
-    global num_of_running_thread, queue, is_exit, event
+def gunzip_chunks(chunks):
+    decompressor = GunzipStream()
+    for chunk in chunks:
+        yield from decompressor.decompress(chunk)
+    remaining = decompressor.flush()
+    if remaining:
+        yield remaining
 
-    #ensure that this process is also counted as one running thread, useful to perform task cleanup while stopping the process
-    num_of_running_thread += 1
+'''
+This method splits an in-memory buffer into chunks without copying it, so that it can be consumed the same way as a streamed Cloudflare API response.
+'''
+def iter_buffer(data, size):
+    view = memoryview(data)
+    for offset in range(0, len(view), size):
+        yield view[offset:offset + size]
+
+'''
+This class compresses logs into gzip format incrementally, chunk by chunk. It is the counterpart of GunzipStream and used for logs that are not compressed by Cloudflare (Cloudflare Access and Audit logs),
+or logs which are compressed again (see TranscodeStream). The compression level is 9 by default, same as gzip.compress().
+'''
+class GzipStream:
+    def __init__(self, level=GZIP_DEFAULT_LEVEL):
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
 
-    #failed count to check how many failed tasks
-    failed_count = 0
+    #compress one chunk of data, and yield the compressed data (if any) produced by the compressor
+    def compress(self, chunk):
+        compressed_chunk = self.compressor.compress(chunk)
+        if compressed_chunk:
+            yield compressed_chunk
 
-    #wait for 5 seconds before starting the process below, doesn't make sense to check the queue immediately after running the tool
-    event.wait(5)
+    #return whatever data left inside the compressor, including the gzip trailer
+    def flush(self):
+        return self.compressor.flush()
 
-    #keep below process in a loop until it's terminated by the user
-    while True:
+'''
+This class compresses logs into gzip format with multiple threads (compression_threads). The logs are cut into blocks of PARALLEL_GZIP_BLOCK_SIZE bytes, and each block is compressed into a gzip member of its own by a thread.
+The members are written in order, and the members concatenated together are a valid gzip file (see GunzipStream). zlib releases the GIL while compressing, so the blocks are compressed in parallel.
+The blocks of all the logpull windows are compressed by the same pool of threads (see get_compression_executor()), and at most 2 blocks per thread of each logfile are kept in memory.
+'''
+class ParallelGzipStream:
+    def __init__(self, level=GZIP_DEFAULT_LEVEL, threads=2):
+        self.level = level
+        self.threads = threads
+        self.executor = get_compression_executor()
+        self.buffer = bytearray()
+        self.futures = deque()
+        self.members = 0
+
+    #compress one block of data into a complete gzip member
+    def compress_block(self, block):
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        return compressor.compress(block) + compressor.flush()
+
+    def submit_block(self, block):
+        self.futures.append(self.executor.submit(self.compress_block, block))
+        self.members += 1
+
+    #add one chunk of data to the current block, and yield the gzip members which have been compressed, in order
+    def compress(self, chunk):
+        self.buffer += chunk
+        while len(self.buffer) >= PARALLEL_GZIP_BLOCK_SIZE:
+            self.submit_block(bytes(self.buffer[:PARALLEL_GZIP_BLOCK_SIZE]))
+            del self.buffer[:PARALLEL_GZIP_BLOCK_SIZE]
+            #wait for the oldest block if all threads are busy and the next blocks are waiting already
+            while len(self.futures) >= self.threads * 2:
+                yield self.futures.popleft().result()
+        while self.futures and self.futures[0].done():
+            yield self.futures.popleft().result()
+
+    #compress the last block, and return all the gzip members left. An empty gzip member is returned if there's no data at all, same as GzipStream.
+    def flush(self):
         try:
-            #check whether the queue has any content (size larger than 0)
-            if queue.size > 0:
-                #get the item from the queue based on FIFO
-                item = queue.get()
-
-                #then run the logpull task again
-                logger.info(str(datetime.now()) + " --- Retrying log range " + item.get('log_start_time_utc').isoformat() + "Z to " + item.get('log_end_time_utc').isoformat() + "Z from queue due to " + item.get('reason') + "... (currently " + str(queue.size) + " item(s) left in the queue)")
-                null, status = logs_thread(item.get('folder_time'), item.get('log_start_time_utc'), item.get('log_end_time_utc'))
-
-                #check the status returned from the logpull process, if True means the last logpull task has been successful
-                if status is True:
-                    failed_count = 0
-                    event.wait(3)
-                else:
-                    #if not, increment the failed count counter, also check if the failed tasks more than or equal to 3
-                    failed_count += 1
-                    if failed_count >= 3:
-                        #too many failed tasks, wait for 60 seconds and try again
-                        event.wait(60)
-                    else:
-                        #else, just wait for 3 seconds
-                        event.wait(3)
-            else:
-                #if no item in the queue, wait for 5 seconds and try again
-                event.wait(5)
+            if self.buffer or self.members == 0:
+                self.submit_block(bytes(self.buffer))
+                self.buffer = bytearray()
+            return b"".join(future.result() for future in self.futures)
+        finally:
+            self.close()
 
-            #check if the user wants to stop the logpull process, if no then just continue the looping
-            if is_exit is True:
-                time.sleep(1)
-                return check_if_exited()
-            else:
-                pass
-        except Exception as e:
-            logger.critical(str(datetime.now()) + " --- Queue thread failed unexpectedly. Exception message: " + str(e))
-            continue
+    #forget the blocks which have not been compressed yet, e.g. when writing the logfile failed, so the threads are not kept busy by a logfile which will be deleted
+    def close(self):
+        for future in self.futures:
+            future.cancel()
+        self.futures.clear()
+        self.buffer = bytearray()
 
-          
 '''
-This method will handle the overall log processing tasks and it will run as a separate thread.
-Based on the interval setting configured by the user, this method will only handle logs for a specific time slot.
+This method returns the pool of threads which compresses the blocks of multi-threaded gzip (see ParallelGzipStream), which is shared by all the logpull windows.
 '''
-def logs_thread(current_time, log_start_time_utc, log_end_time_utc):
-    
-    global num_of_running_thread, logger, retry_attempt, final_fields, log_dest, queue, one_time, hide_user_logs
+def get_compression_executor():
+    global compression_executor
 
-    #a list to store list of objects - log destination configuration
-    log_dest_per_thread = []
-    log_dest_per_thread_final = []
-    
-    #add one to the variable to indicate number of running threads. useful to determine whether to exit the program gracefully
-    num_of_running_thread += 1
+    with compression_lock:
+        if compression_executor is None:
+            compression_executor = ThreadPoolExecutor(max_workers=compression_pool_size, thread_name_prefix="compression")
+        return compression_executor
 
-    #specify the number of attempts to retry in the event of error
-    #Note! Setting 0 prevents retrying logpull tasks as defined in below code. The process will be replaced by queue_thread() instead.
-    retry_attempt = 0
-    
-    #a variable to check whether the request to Cloudflare API is successful.
-    request_success = False
+'''
+This class compresses logs into zstd format incrementally, chunk by chunk. It requires zstandard library.
+With threads larger than 1, the data is compressed by the worker threads of zstd. With long (the window size as a power of 2, e.g. 27 for 128 MiB), long distance matching is enabled for a better compression ratio.
+The logfiles compressed with a window size larger than 27 need the same option to be decompressed, e.g. 'zstd -d --long=31'.
+'''
+class ZstdStream:
+    def __init__(self, level=ZSTD_DEFAULT_LEVEL, threads=1, long=0):
+        params = zstandard.ZstdCompressionParameters.from_level(level, threads=threads if threads > 1 else 0, enable_ldm=bool(long), window_log=long, write_checksum=True)
+        self.compressor = zstandard.ZstdCompressor(compression_params=params).compressobj()
 
-    #a variable to check whether we should skip adding failed items to the queue (based on situation)
-    skip_add_queue = False
+    #compress one chunk of data, and yield the compressed data (if any) produced by the compressor
+    def compress(self, chunk):
+        compressed_chunk = self.compressor.compress(chunk)
+        if compressed_chunk:
+            yield compressed_chunk
 
-    status_code = 0
-    cf_status_code = 0
-    cf_err_msg = ""
-    
-    #if the user instructs the program to do logpull for only one time, the logs will not be stored in folder that follows the naming convention: date and time
-    if one_time is True or (all(d.get('no_organize') is True for d in log_dest)):
-        pass
-    else:
-        #get the current date and hour, these will be used to initialize the folder to store the logs
-        today_date = str(current_time.date())
-        current_hour = str(current_time.hour) + "00"
-    
-    #get the log start time and log end time in RFC3339 format, so Cloudflare API will understand it and pull the appropriate logs for us
-    log_start_time_rfc3339 = log_start_time_utc.isoformat() + 'Z'
-    log_end_time_rfc3339 = log_end_time_utc.isoformat() + 'Z'
+    #return whatever data left inside the compressor, including the end of the zstd frame
+    def flush(self):
+        return self.compressor.flush()
 
-    #iterate through the list of objects - log destination configuration
-    for d in log_dest:
-        #check if the user wants to do one-time operation, or instructs not to organize logs into date and time folder
-        #if yes, leave the path value as it is
-        if d.get('no_organize') is True or one_time is True:
-            log_dest_per_thread.append({'name': d.get('name'), 'path': d.get('path'), 'prefix': d.get('prefix'), 'no_gzip': d.get('no_gzip')})
-        #if not, modify the path to include date and time folder
-        else:
-            log_dest_per_thread.append({'name': d.get('name'), 'path': d.get('path') + "/" + today_date + "/" + current_hour, 'prefix': d.get('prefix'), 'no_gzip': d.get('no_gzip')})
+'''
+This class inflates gzipped logs (HTTP logs) and compresses them again with another encoder (GzipStream, ParallelGzipStream or ZstdStream) in a single streaming pass, chunk by chunk.
+Without an encoder, the logs are only inflated (compression: none). The number of records (lines) is counted along the way.
+'''
+class TranscodeStream:
+    def __init__(self, encoder=None):
+        self.decompressor = GunzipStream()
+        self.encoder = encoder
+        self.records = 0
 
-    #iterate through the list of objects - log destination configuration
-    for p in log_dest_per_thread:
-        #create folder
-        data_folder = initialize_folder(p.get('path'))
+    #inflate one chunk of gzipped data, and yield the data compressed again (or inflated) from it
+    def compress(self, chunk):
+        for decompressed_chunk in self.decompressor.decompress(chunk):
+            yield from self.encode(decompressed_chunk)
 
-        #prepare the full path (incl. file name) to store the logs
-        logfile_path, prepare_status = prepare_path(log_start_time_rfc3339, log_end_time_rfc3339, data_folder, p.get('prefix'), p.get('no_gzip'))
+    def encode(self, data):
+        self.records += data.count(b"\n")
+        if self.encoder:
+            yield from self.encoder.compress(data)
+        elif data:
+            yield data
 
-        #check the returned value from prepare_path() method. if False, means logfile already exists and no further action required
-        if prepare_status is False:
-            logger.warning(str(datetime.now()) + " --- Log range " + log_start_time_rfc3339 + " to " + log_end_time_rfc3339 + ": Logfile " + str(logfile_path) + " already exists! Skipping.")
+    #return whatever data left inside the decompressor and the encoder
+    def flush(self):
+        data = b"".join(self.encode(self.decompressor.flush()))
+        return data + self.encoder.flush() if self.encoder else data
+
+'''
+This class processes the logs record by record (one JSON object per line) for a log destination with record processing options (see initialize_pipeline()), before the logs go to the encoder of the log destination (if any).
+The records which do not match all the filters are dropped, then the fields in fields.drop are removed and the values of the fields in fields.redact are replaced (see process_record()).
+Only the lines of the current chunk are kept in memory. Records which are not valid JSON are dropped as well, as they cannot be filtered or redacted.
+records is the number of records written to the log destination.
+'''
+class RecordStream:
+    def __init__(self, pipeline, encoder=None, name=""):
+        self.pipeline = pipeline
+        self.encoder = encoder
+        self.name = name
+        self.remaining = b""
+        self.records = 0
+        self.invalid = 0
+
+    #process the complete lines of one chunk of data, and yield the processed records compressed by the encoder (if any)
+    def compress(self, chunk):
+        lines = (self.remaining + bytes(chunk)).split(b"\n")
+        self.remaining = lines.pop()
+        yield from self.encode(lines)
+
+    def encode(self, lines):
+        data = b"".join(self.process(line) for line in lines)
+        if self.encoder:
+            yield from self.encoder.compress(data)
+        elif data:
+            yield data
+
+    #return the processed record of one line, with the line break. An empty string is returned if the record is dropped.
+    def process(self, line):
+        if not line.strip():
+            return b""
+        try:
+            record = record_loads(line)
+        except ValueError:
+            record = None
+        if not isinstance(record, dict):
+            self.invalid += 1
+            return b""
+        if not process_record(self.pipeline, record):
+            return b""
+        self.records += 1
+        #the line is written as it is if only the filters are specified, so the record does not have to be serialized again
+        return (record_dumps(record) if self.pipeline['drop'] or self.pipeline['redact'] else line) + b"\n"
+
+    #process the last line (if any), and return whatever data left inside the encoder
+    def flush(self):
+        data = b"".join(self.encode([self.remaining]))
+        self.remaining = b""
+        if self.invalid > 0:
+            logger.warning(str(datetime.now()) + " --- " + str(self.invalid) + " record(s) which are not valid JSON have been dropped from log destination " + self.name + ".")
+        return data + self.encoder.flush() if self.encoder else data
+
+'''
+This method checks whether a log record matches all the filters of a log destination. If it does, the fields in fields.drop are removed from the record and the values of the fields in fields.redact are replaced, and True is returned.
+The values are replaced by the HMAC-SHA256 of the value with redact_key if it is specified, so the same values can still be correlated, or REDACTED_VALUE otherwise.
+'''
+def process_record(pipeline, record):
+    for field, compare, value in pipeline['filters']:
+        try:
+            if not compare(get_record_field(record, field)[2], value):
+                return False
+        except TypeError:
+            #values which cannot be compared (e.g. a string and a number) do not match
+            return False
+    for field in pipeline['drop']:
+        container, key, value = get_record_field(record, field)
+        if container is not None:
+            del container[key]
+    for field in pipeline['redact']:
+        container, key, value = get_record_field(record, field)
+        if container is not None and value is not None:
+            container[key] = hmac.new(pipeline['redact_key'], str(value).encode(), hashlib.sha256).hexdigest() if pipeline['redact_key'] else REDACTED_VALUE
+    return True
+
+'''
+This method looks up a field of a log record, and returns the object containing the field, the key of the field in that object, and the value. (None, None, None) is returned if the field is not found.
+Nested fields of Cloudflare Access and Audit logs are separated by dots, e.g. actor.email.
+'''
+def get_record_field(record, field):
+    if field in record:
+        return record, field, record[field]
+    container = record
+    keys = field.split(".")
+    for key in keys[:-1]:
+        container = container.get(key) if isinstance(container, dict) else None
+    if isinstance(container, dict) and keys[-1] in container:
+        return container, keys[-1], container[keys[-1]]
+    return None, None, None
+
+'''
+These methods parse and serialize one log record (one line of JSON), with orjson if it is installed or the json library otherwise. The records are serialized without spaces, same as Cloudflare.
+'''
+def record_loads(line):
+    return orjson.loads(line) if orjson else json.loads(line)
+
+def record_dumps(record):
+    if orjson:
+        try:
+            return orjson.dumps(record)
+        except TypeError:
+            #orjson does not support everything the json library does, e.g. integers larger than 64 bits
+            pass
+    return json.dumps(record, separators=(",", ":"), ensure_ascii=False).encode()
+
+'''
+This class collects the data written by pyarrow into a Parquet file, so that ParquetStream can hand it over chunk by chunk the same way as the other encoders.
+'''
+class ParquetSink:
+    def __init__(self):
+        self.data = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        self.data.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    #return the data written since the last call, and forget it
+    def drain(self):
+        data = b"".join(self.data)
+        self.data = []
+        return data
+
+'''
+This class converts logs (one JSON object per line) into a Parquet file incrementally, chunk by chunk. It requires pyarrow library.
+The records are converted into typed columns PARQUET_BATCH_SIZE records at a time, and written as one row group once there are row_group_size records (see initialize_parquet()), so only the current row group is kept in memory.
+The data of each row group is returned as soon as it is written. Fields which are not in the schema are left out, and records which are not valid JSON are dropped.
+'''
+class ParquetStream:
+    def __init__(self, parquet, codec, name=""):
+        self.schema = parquet['schema']
+        self.row_group_size = parquet['row_group_size']
+        self.batch_size = min(PARQUET_BATCH_SIZE, self.row_group_size)
+        self.name = name
+        self.sink = ParquetSink()
+        self.writer = pyarrow.parquet.ParquetWriter(self.sink, self.schema, compression=codec['name'], compression_level=codec['level'], use_dictionary=parquet['dictionary'])
+        self.columns = {field: [] for field in self.schema.names}
+        self.rows = 0
+        self.batches = []
+        self.batch_rows = 0
+        self.remaining = b""
+        self.invalid = 0
+
+    #add the complete lines of one chunk of data to the current row group, and yield the data of the row groups which have been written
+    def compress(self, chunk):
+        lines = (self.remaining + bytes(chunk)).split(b"\n")
+        self.remaining = lines.pop()
+        for line in lines:
+            self.add_record(line)
+        data = self.sink.drain()
+        if data:
+            yield data
+
+    def add_record(self, line):
+        if not line.strip():
+            return
+        try:
+            record = record_loads(line)
+        except ValueError:
+            record = None
+        if not isinstance(record, dict):
+            self.invalid += 1
+            return
+        for field, values in self.columns.items():
+            values.append(record.get(field))
+        self.rows += 1
+        #the last batch of a row group is cut short, so each row group has exactly row_group_size records
+        if self.rows >= min(self.batch_size, self.row_group_size - self.batch_rows):
+            self.add_batch()
+
+    #convert the records collected so far into typed columns, and write a row group if it's full
+    def add_batch(self):
+        self.batches.append(pyarrow.RecordBatch.from_arrays([to_arrow_array(values, field.type) for values, field in zip(self.columns.values(), self.schema)], schema=self.schema))
+        self.batch_rows += self.rows
+        self.columns = {field: [] for field in self.schema.names}
+        self.rows = 0
+        if self.batch_rows >= self.row_group_size:
+            self.write_row_group()
+
+    def write_row_group(self):
+        if self.batches:
+            self.writer.write_table(pyarrow.Table.from_batches(self.batches, schema=self.schema), row_group_size=self.batch_rows)
+        self.batches = []
+        self.batch_rows = 0
+
+    #write the last row group and the footer of the Parquet file, and return whatever data left
+    def flush(self):
+        self.add_record(self.remaining)
+        self.remaining = b""
+        if self.rows > 0:
+            self.add_batch()
+        self.write_row_group()
+        self.writer.close()
+        if self.invalid > 0:
+            logger.warning(str(datetime.now()) + " --- " + str(self.invalid) + " record(s) which are not valid JSON have been dropped from log destination " + self.name + ".")
+        return self.sink.drain()
+
+'''
+This method converts the values of one field into a column of the given type. Timestamps in RFC 3339 format are parsed by pyarrow.
+If some of the values do not match the type (e.g. Cloudflare changes the type of a field), those values are written as JSON text to string columns, or as null to the other columns, instead of failing the whole logpull window.
+'''
+def to_arrow_array(values, arrow_type):
+    def convert(values):
+        if pyarrow.types.is_timestamp(arrow_type):
+            return pyarrow.compute.cast(pyarrow.array(values, pyarrow.string()), arrow_type)
+        return pyarrow.array(values, arrow_type)
+
+    try:
+        return convert(values)
+    except (pyarrow.ArrowException, TypeError, ValueError, OverflowError):
+        pass
+
+    if pyarrow.types.is_string(arrow_type):
+        return convert([value if value is None or isinstance(value, str) else json.dumps(value) for value in values])
+
+    def is_valid(value):
+        try:
+            convert([value])
+            return True
+        except (pyarrow.ArrowException, TypeError, ValueError, OverflowError):
+            return False
+    return convert([value if is_valid(value) else None for value in values])
+
+'''
+This method returns the compression codec of a log destination (see initialize_compression()).
+The log destinations which are not checked by initialize_compression() (e.g. created by write_logs()) are compressed with gzip unless no_gzip is true.
+'''
+def get_codec(d):
+    return d.get('codec') or {'name': "none" if d.get('no_gzip') is True else "gzip", 'level': None, 'threads': 1, 'long': 0}
+
+'''
+This method describes the compression of the logfiles of a log destination, for the activity log.
+'''
+def get_codec_description(d):
+    codec = get_codec(d)
+    if codec['name'] == "none":
+        return ("in Parquet format " if d.get('parquet') else "") + "without compression"
+    return ("in Parquet format " if d.get('parquet') else "") + "compressed with " + codec['name'] + (" (level " + str(codec['level']) + ")" if codec['level'] is not None else "")
+
+'''
+This method returns the encoder which turns the logs into the compression codec of a log destination, or None if the logs can be written as they are.
+compressed tells whether the logs are gzipped (HTTP logs) or not (Cloudflare Access and Audit logs). Gzipped logs are kept as they are for gzip without a compression level, otherwise they go through TranscodeStream.
+If the log destination has record processing options, the records go through RecordStream before they are compressed. Parquet files are written by ParquetStream instead of the compression encoders.
+'''
+def get_encoder(d, compressed):
+    codec = get_codec(d)
+    if codec['name'] == "gzip" and codec['level'] is None and compressed is True and not d.get('pipeline') and not d.get('parquet'):
+        return None
+    if d.get('parquet'):
+        encoder = ParquetStream(d.get('parquet'), codec, d.get('name'))
+    elif codec['name'] == "zstd":
+        encoder = ZstdStream(codec['level'] or ZSTD_DEFAULT_LEVEL, codec['threads'], codec['long'])
+    elif codec['name'] == "gzip" and codec['threads'] > 1:
+        encoder = ParallelGzipStream(codec['level'] or GZIP_DEFAULT_LEVEL, codec['threads'])
+    elif codec['name'] == "gzip":
+        encoder = GzipStream(codec['level'] or GZIP_DEFAULT_LEVEL)
+    else:
+        encoder = None
+    if d.get('pipeline'):
+        encoder = RecordStream(d.get('pipeline'), encoder, d.get('name'))
+    return TranscodeStream(encoder) if compressed is True else encoder
+
+'''
+This method returns what the logfiles of a log destination are made of: the file extension, the compression codec, the record processing options and the Parquet schema.
+Log destinations with the same encoding get exactly the same logfiles from the same logs.
+'''
+def get_encoding_key(d):
+    return (get_logfile_extension(d), repr(sorted(get_codec(d).items())), repr(d.get('pipeline')), repr(d.get('parquet')))
+
+'''
+This method groups the log destinations of a log range by their encoding (see get_encoding_key()), in the order of the log destinations.
+The logs are only encoded and written once for each group, and the logfile is shared by the other log destinations of the group when it is committed (see commit_timed()).
+'''
+def group_by_encoding(log_dest_list):
+    groups = {}
+    for each_log_dest in log_dest_list:
+        groups.setdefault(get_encoding_key(each_log_dest), []).append(each_log_dest)
+    return list(groups.values())
+
+'''
+This method returns the number of records written by an encoder (see get_encoder()), or None if the records are not processed by RecordStream, i.e. all records are written.
+'''
+def get_encoder_records(encoder):
+    encoder = encoder.encoder if isinstance(encoder, TranscodeStream) else encoder
+    return encoder.records if isinstance(encoder, RecordStream) else None
+
+'''
+This method stops an encoder (see get_encoder()) from compressing the rest of the logs, after the logfile has been written or has failed.
+'''
+def close_encoder(encoder):
+    while encoder is not None:
+        if isinstance(encoder, ParallelGzipStream):
+            encoder.close()
+        encoder = encoder.encoder if isinstance(encoder, (TranscodeStream, RecordStream)) else None
+
+'''
+This method is responsible to write logs to local storage after the logs have been pulled from Cloudflare API.
+Depending on the user preference, logs might need to save in compressed format (see initialize_compression()).
+The data can either be the text of Cloudflare Access and Audit logs, or a buffer of gzipped logs (bytes). Both will be handed over to write_logs_stream() so they are processed chunk by chunk.
+Logs coming from the Cloudflare API response are streamed to local storage by write_logs_stream() directly.
+'''
+def write_logs(logfile_path, data, no_gzip, codec=None):
+    if isinstance(data, str):
+        #Cloudflare Access and Audit log does not compress by default.
+        result, e, null = write_logs_stream([{'name': os.path.basename(logfile_path), 'path': logfile_path, 'no_gzip': no_gzip, 'codec': codec}], iter_buffer(data.encode(), chunk_size), False)
+    else:
+        #gzipped data that is already in memory is inflated chunk by chunk instead of all at once
+        result, e, null = write_logs_stream([{'name': os.path.basename(logfile_path), 'path': logfile_path, 'no_gzip': no_gzip, 'codec': codec}], iter_buffer(data, chunk_size), True)
+
+    return result, e
+
+'''
+This method is responsible to write logs to local storage while the logs are still being downloaded from Cloudflare API.
+Each chunk coming from the response body is written to the temporary file of every log destination as soon as it arrives, so the memory usage is bounded by the chunk size instead of the size of the logs.
+The chunks are gzipped by default (HTTP logs). Specify compressed=False if the chunks are plain text (Cloudflare Access and Audit logs).
+After the whole response has been received, a hard link will be created from the actual file to each temporary file, same as write_logs().
+Log destinations with the same encoding (e.g. the same logs kept on two disks) share one encoder and one temporary file (see group_by_encoding()), and gzipped logs are inflated once for all of them,
+so extra log destinations only cost a hard link (or a copy on another file system) instead of encoding and writing the logs again.
+The third value returned is the name of the log destination that failed. None means the download itself failed (e.g. connection reset), which happened before anything was committed.
+If stats (a dictionary) is given, the time spent on downloading, compressing/decompressing and writing to each log destination, and the number of bytes and records will be recorded in it (see write_window_record()).
+'''
+def write_logs_stream(log_dest_list, chunks, compressed=True, stats=None):
+    writer = LogWriter(log_dest_list, compressed, stats)
+    try:
+        failure = writer.open()
+        if failure is not None:
+            return failure
+
+        chunks = iter_timed(chunks, writer.stats, 'download')
+        while True:
+            #read the next chunk from the response body. Any error here is caused by the download, not by the local storage.
+            try:
+                chunk = next(chunks)
+            except StopIteration:
+                break
+            except Exception as e:
+                return False, e, None
+
+            failure = writer.write(chunk)
+            if failure is not None:
+                return failure
+
+        return writer.finish()
+    finally:
+        #close the temporary files and they will automatically deleted
+        writer.close()
+
+'''
+This class writes the logs of a logpull window to its log destinations chunk by chunk, as the chunks are handed over to it (see write_logs_stream()).
+The asyncio engine reads the chunks on the event loop, and only hands over each chunk to a thread to be written (see logs_task()), so no thread is held while waiting for Cloudflare API.
+open(), write() and finish() return None if successful (finish() returns the result of write_logs_stream() instead), or the result of write_logs_stream() if failed. close() must be called in the end.
+'''
+class LogWriter:
+    def __init__(self, log_dest_list, compressed=True, stats=None):
+        stats = {} if stats is None else stats
+        stats['write'] = {}
+        stats['bytes_written'] = {}
+        stats['sha256'] = {}
+        stats['logfiles'] = []
+        self.stats = stats
+        self.compressed = compressed
+        #each group of log destinations with the same encoding gets its own encoder (if needed), so the logs are compressed, inflated or compressed again chunk by chunk in the codec of the log destinations (see get_encoder())
+        self.groups = group_by_encoding(log_dest_list)
+        encoders = [get_encoder(group[0], compressed) for group in self.groups]
+        #gzipped logs are inflated only once for all the groups which need them inflated, instead of by the TranscodeStream of each group
+        self.inflated = [isinstance(encoder, TranscodeStream) for encoder in encoders]
+        self.encoders = [encoder.encoder if isinstance(encoder, TranscodeStream) else encoder for encoder in encoders]
+        self.inflater = TranscodeStream() if any(self.inflated) else None
+        #the records can only be counted if the logs are not compressed, or inflated for one of the log destinations
+        stats['records'] = 0 if compressed is False or self.inflater is not None else None
+        self.logfiles = []
+
+    def open(self):
+        try:
+            #open one temporary file as write binary mode for each group, in the same folder as the actual file of the first log destination so that the hard link can be created later (see GroupLogfile)
+            for group in self.groups:
+                self.logfiles.append(GroupLogfile(group))
+        except Exception as e:
+            return False, e, get_group_name(group)
+        return None
+
+    def write(self, chunk):
+        global bytes_downloaded
+
+        stats = self.stats
+        with thread_lock:
+            bytes_downloaded += len(chunk)
+        stats['bytes_downloaded'] = stats.get('bytes_downloaded', 0) + len(chunk)
+        if self.compressed is False:
+            stats['records'] += chunk.count(b"\n")
+
+        #write the data in the format that the user prefers (see initialize_compression()) to every group, either the chunk inflated or the chunk as it is.
+        #failing to inflate the chunk is reported as the failure of the first group which needs it inflated.
+        groups = self.groups
+        writing = groups[self.inflated.index(True)] if self.inflater else None
+        try:
+            for data in (iter_timed(self.inflater.compress(chunk), stats, 'encode') if self.inflater else ()):
+                for logfile, encoder, group, is_inflated in zip(self.logfiles, self.encoders, groups, self.inflated):
+                    if is_inflated:
+                        writing = group
+                        write_encoded(logfile, encoder, data, stats, group[0].get('name'))
+                writing = groups[self.inflated.index(True)]
+            for logfile, encoder, group, is_inflated in zip(self.logfiles, self.encoders, groups, self.inflated):
+                if not is_inflated:
+                    writing = group
+                    write_encoded(logfile, encoder, chunk, stats, group[0].get('name'))
+        except Exception as e:
+            return False, e, get_group_name(writing)
+        return None
+
+    def finish(self):
+        stats = self.stats
+        groups = self.groups
+        #write whatever data left inside the inflater and the encoders, so that the records of the logs are all counted before the logfiles are committed
+        writing = groups[self.inflated.index(True)] if self.inflater else None
+        try:
+            data = timed_call(self.inflater.flush, stats, 'encode') if self.inflater else b""
+            for logfile, encoder, group, is_inflated in zip(self.logfiles, self.encoders, groups, self.inflated):
+                writing = group
+                if is_inflated and data:
+                    write_encoded(logfile, encoder, data, stats, group[0].get('name'))
+                if encoder:
+                    write_timed(logfile, timed_call(encoder.flush, stats, 'encode'), stats, group[0].get('name'))
+        except Exception as e:
+            return False, e, get_group_name(writing)
+        if self.inflater is not None:
+            stats['records'] = self.inflater.records
+
+        #after writing logs to temporary files, create a hard link from actual file of each log destination to the temporary file of its group
+        for logfile, encoder, group in zip(self.logfiles, self.encoders, groups):
+            records = get_encoder_records(encoder)
+            for each_log_dest in group:
+                try:
+                    commit_timed(logfile, each_log_dest, stats, stats['records'] if records is None else records)
+                except Exception as e:
+                    return False, e, each_log_dest.get('name')
+        return True, True, None
+
+    def close(self):
+        for encoder in self.encoders:
+            close_encoder(encoder)
+        for logfile in self.logfiles:
+            try:
+                logfile.close()
+            except Exception:
+                pass
+
+'''
+This method returns the name of a group of log destinations with the same encoding (see group_by_encoding()), e.g. to tell which log destinations failed.
+'''
+def get_group_name(group):
+    return ", ".join(d.get('name') for d in group)
+
+'''
+This method writes data to the temporary file of a group of log destinations, after encoding it with the encoder of the group (if any), see get_encoder().
+'''
+def write_encoded(logfile, encoder, data, stats, name):
+    for encoded_chunk in (iter_timed(encoder.compress(data), stats, 'encode') if encoder else (data,)):
+        write_timed(logfile, encoded_chunk, stats, name)
+
+'''
+This method passes the items of an iterator through, while adding the time spent on producing each item to stats[key] (in seconds).
+It is used to tell how much time is spent on downloading the logs, and on compressing or decompressing them.
+'''
+def iter_timed(iterable, stats, key):
+    iterator = iter(iterable)
+    while True:
+        started = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            stats[key] = stats.get(key, 0) + time.perf_counter() - started
+        yield item
+
+'''
+This method calls a function without arguments and returns its result, while adding the time spent to stats[key] (in seconds), same as iter_timed().
+'''
+def timed_call(function, stats, key):
+    started = time.perf_counter()
+    try:
+        return function()
+    finally:
+        stats[key] = stats.get(key, 0) + time.perf_counter() - started
+
+'''
+This method writes data to the temporary file of a log destination, while adding the time spent on writing to stats['write'][name] (in seconds).
+If the manifest is enabled, the SHA-256 checksum of the logfile is calculated along the way as well, so the logfile does not have to be read again.
+'''
+def write_timed(logfile, data, stats, name):
+    started = time.perf_counter()
+    logfile.write(data)
+    if manifest is not None:
+        stats['sha256'].setdefault(logfile.name, hashlib.sha256()).update(data)
+    stats['write'][name] = stats['write'].get(name, 0) + time.perf_counter() - started
+
+'''
+This method flushes the temporary file of a log destination and creates a hard link from the actual file to it, while recording the time spent and the size of the logfile in stats.
+The logfile is added to stats['logfiles'] together with the number of records, to be recorded in the manifest once the whole logpull window is done (see handle_logpull_success()).
+If the logfile turns out to exist already while the manifest is enabled (e.g. written before the manifest was introduced), the existing logfile is kept and recorded in the manifest instead.
+The temporary file is shared by the log destinations with the same encoding (see GroupLogfile). It is copied instead (see copy_logfile()) for the log destinations on another file system, the upload is completed for S3 log destinations, and the rest of the records are sent to stream log destinations.
+'''
+def commit_timed(logfile, each_log_dest, stats, records=None):
+    name = each_log_dest.get('name')
+    started = time.perf_counter()
+    logfile.flush()
+    try:
+        if each_log_dest.get('s3'):
+            #the logfile has been uploaded to S3 log destinations while being written (see S3Upload)
+            logfile.uploads[name].complete()
+        elif each_log_dest.get('stream'):
+            #the records have been sent to stream log destinations while being written (see StreamWriter)
+            logfile.streams[name].commit()
+        else:
+            try:
+                os.link(logfile.file.name, each_log_dest.get('path'))
+            except OSError as e:
+                #the temporary file is shared by a log destination on another file system (see group_by_encoding()), where it cannot be linked to
+                if e.errno != errno.EXDEV:
+                    raise
+                copy_logfile(logfile.file, each_log_dest.get('path'))
+    except FileExistsError:
+        if manifest is None:
+            raise
+        logger.warning(str(datetime.now()) + " --- Logfile " + str(each_log_dest.get('path')) + " already exists but is not in the manifest. Keeping the existing logfile.")
+        stats['logfiles'].append(dict(each_log_dest, bytes=os.path.getsize(each_log_dest.get('path'))))
+        return
+    stats['write'][name] = stats['write'].get(name, 0) + time.perf_counter() - started
+    stats['bytes_written'][name] = stats['bytes_written'].get(name, 0) + logfile.tell()
+    checksum = (stats['sha256'].get(logfile.name) or hashlib.sha256()).hexdigest() if manifest is not None else None
+    stats['logfiles'].append(dict(each_log_dest, bytes=logfile.tell(), records=records, sha256=checksum))
+
+'''
+This method copies the temporary file of a log destination into a temporary file in the folder of another logfile, and creates a hard link from the logfile to the copy, same as commit_timed().
+The data is copied by the kernel (see shutil.copyfile()) instead of being encoded again.
+'''
+def copy_logfile(logfile, logfile_path):
+    dirname, basename = os.path.split(logfile_path)
+    with tempfile.NamedTemporaryFile(mode="wb", prefix=basename, dir=dirname) as copied_logfile:
+        copyfile(logfile.name, copied_logfile.name)
+        os.link(copied_logfile.name, logfile_path)
+
+'''
+This class is the temporary file of a group of log destinations with the same encoding (see group_by_encoding()), which is written once and committed by each log destination of the group (see commit_timed()).
+The logs are written to a temporary file next to the logfile of the first log destination in local storage (if any), uploaded to each S3 log destination of the group (see S3Upload) and sent to each stream log destination (see StreamWriter) at the same time.
+name identifies the logfile of the group, e.g. for its checksum (see write_timed()).
+'''
+class GroupLogfile:
+    def __init__(self, group):
+        local_log_dest = [d for d in group if not d.get('s3') and not d.get('stream')]
+        self.file = None
+        self.uploads = {}
+        self.streams = {}
+        self.size = 0
+        if local_log_dest:
+            dirname, basename = os.path.split(local_log_dest[0].get('path'))
+            self.file = tempfile.NamedTemporaryFile(mode="wb", prefix=basename, dir=dirname)
+        for d in group:
+            if d.get('s3'):
+                self.uploads[d.get('name')] = S3Upload(d)
+            elif d.get('stream'):
+                self.streams[d.get('name')] = StreamWriter(get_stream_sink(d['stream']))
+        self.name = self.file.name if self.file else str(group[0].get('path'))
+
+    def write(self, data):
+        if self.file:
+            self.file.write(data)
+        for upload in self.uploads.values():
+            upload.write(data)
+        for stream in self.streams.values():
+            stream.write(data)
+        self.size += len(data)
+
+    def tell(self):
+        return self.size
+
+    def flush(self):
+        if self.file:
+            self.file.flush()
+
+    #the temporary file is deleted, and the uploads which are not complete are aborted
+    def close(self):
+        for upload in self.uploads.values():
+            try:
+                upload.close()
+            except Exception:
+                pass
+        if self.file:
+            self.file.close()
+
+'''
+This method splits the S3 URL of a logfile or a folder (s3://bucket/key) into the bucket and the key.
+'''
+def split_s3_path(path):
+    bucket, null, key = str(path)[len("s3://"):].partition("/")
+    return bucket, key
+
+'''
+This method returns the S3 client of an S3 log destination (see initialize_s3()), which is shared by the log destinations with the same endpoint and region.
+The upload pool of the multipart uploads (see S3Upload) is created together with the first S3 client.
+'''
+def get_s3_client(s3):
+    global s3_executor, s3_slots
+
+    key = (s3['endpoint_url'], s3['region'])
+    with s3_lock:
+        if s3_executor is None:
+            s3_executor = ThreadPoolExecutor(max_workers=s3_upload_concurrency, thread_name_prefix="s3_upload")
+            s3_slots = threading.BoundedSemaphore(s3_upload_concurrency * 2)
+        if key not in s3_clients:
+            #one connection for each part being uploaded, and for each logpull window completing its upload at the same time
+            s3_clients[key] = boto3.session.Session().client("s3", endpoint_url=s3['endpoint_url'], region_name=s3['region'], config=botocore.config.Config(max_pool_connections=s3_upload_concurrency + max(workers, queue_concurrency, backfill_parallelism)))
+        return s3_clients[key]
+
+'''
+This method checks whether the logfile of an S3 log destination exists in the bucket, same as checking whether a logfile exists in local storage.
+If the bucket cannot be checked, the logfile is considered not to exist, so it will be uploaded again.
+'''
+def s3_object_exists(s3, logfile_path):
+    bucket, key = split_s3_path(logfile_path)
+    try:
+        get_s3_client(s3).head_object(Bucket=bucket, Key=key)
+        return True
+    except botocore.exceptions.ClientError as e:
+        if e.response.get('Error', {}).get('Code') not in ("404", "NoSuchKey", "NotFound"):
+            logger.warning(str(datetime.now()) + " --- Unable to check whether " + str(logfile_path) + " exists: " + str(e) + ".")
+        return False
+    except Exception as e:
+        logger.warning(str(datetime.now()) + " --- Unable to check whether " + str(logfile_path) + " exists: " + str(e) + ".")
+        return False
+
+'''
+This method lists the objects of an S3 log destination under a key prefix, and yields the S3 URL and the size of each object.
+If delimiter is given, the objects in the "folders" under the key prefix are not listed, same as os.scandir().
+'''
+def iter_s3_objects(d, prefix, delimiter=None):
+    bucket = split_s3_path(d.get('path'))[0]
+    paginator = get_s3_client(d['s3']).get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix, **({'Delimiter': delimiter} if delimiter else {})):
+        for item in page.get('Contents', []):
+            yield "s3://" + bucket + "/" + item['Key'], item['Size']
+
+'''
+This class uploads a logfile to an S3 log destination while the logs are still being downloaded, as a multipart upload.
+The data is cut into parts of s3_part_size bytes (the same size, as required by some S3-compatible object storage), and each part is uploaded by the upload pool while the next part is being filled.
+All the uploads share the upload pool (s3_upload_concurrency parts at a time), and at most twice as many parts are held in memory, so writing waits for the upload pool if the object storage is slower than the download.
+Logfiles smaller than one part are uploaded with one request when they are complete. The upload is aborted if it's closed before it is complete, so that no partial logfile is left in the bucket.
+'''
+class S3Upload:
+    def __init__(self, d):
+        self.client = get_s3_client(d['s3'])
+        self.bucket, self.key = split_s3_path(d.get('path'))
+        self.buffer = bytearray()
+        self.upload_id = None
+        self.parts = []
+        self.completed = False
+
+    def write(self, data):
+        self.buffer += data
+        while len(self.buffer) >= s3_part_size:
+            self.upload_part(bytes(self.buffer[:s3_part_size]))
+            del self.buffer[:s3_part_size]
+
+    def upload_part(self, data):
+        #a part which failed fails the upload right away, instead of after the whole logs have been downloaded
+        for part in self.parts:
+            if part.done() and part.exception() is not None:
+                raise part.exception()
+        if self.upload_id is None:
+            self.upload_id = self.client.create_multipart_upload(Bucket=self.bucket, Key=self.key)['UploadId']
+        s3_slots.acquire()
+        try:
+            part = s3_executor.submit(self.client.upload_part, Bucket=self.bucket, Key=self.key, UploadId=self.upload_id, PartNumber=len(self.parts) + 1, Body=data)
+        except BaseException:
+            s3_slots.release()
+            raise
+        part.add_done_callback(lambda null: s3_slots.release())
+        self.parts.append(part)
+
+    #upload the rest of the data, and complete the upload once all the parts have been uploaded
+    def complete(self):
+        if self.upload_id is None:
+            self.client.put_object(Bucket=self.bucket, Key=self.key, Body=bytes(self.buffer))
+        else:
+            if self.buffer:
+                self.upload_part(bytes(self.buffer))
+            parts = [{'PartNumber': i + 1, 'ETag': part.result()['ETag']} for i, part in enumerate(self.parts)]
+            self.client.complete_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id, MultipartUpload={'Parts': parts})
+        self.buffer = bytearray()
+        self.completed = True
+
+    def close(self):
+        if self.completed or self.upload_id is None:
+            return
+        #the parts still being uploaded would be kept by the object storage if they finish after the upload is aborted
+        futures_wait(self.parts)
+        self.client.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
+
+'''
+This method returns the connection of a stream log destination (see initialize_stream()), which is shared by all the logpull windows sending the records to the same path.
+'''
+def get_stream_sink(stream):
+    with stream_lock:
+        if stream['url'] not in stream_sinks:
+            stream_sinks[stream['url']] = StreamSink(stream)
+        return stream_sinks[stream['url']]
+
+'''
+This class is the connection of a stream log destination: a TCP endpoint, a Unix domain socket or stdout. It is connected when the first records are sent.
+The records of the logpull windows running at the same time are sent in batches of whole lines (see StreamWriter), one batch at a time, so the records of different logpull windows never get mixed up within a line.
+Sending waits for the collector (up to stream_timeout seconds for each part of a batch), so the logs are downloaded no faster than the collector receives them.
+generation counts the connections, and sent is the number of bytes sent over the current connection, so that a logpull window can tell whether all of its records have been received (see wait_received()).
+'''
+class StreamSink:
+    def __init__(self, stream):
+        self.stream = stream
+        self.socket = None
+        self.generation = 0
+        self.sent = 0
+        self.lock = threading.Lock()
+
+    def connect(self):
+        if self.stream['type'] == "tcp":
+            self.socket = socket.create_connection(self.stream['address'], timeout=stream_timeout)
+        else:
+            self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.socket.settimeout(stream_timeout)
+            try:
+                self.socket.connect(self.stream['address'])
+            except BaseException:
+                self.disconnect()
+                raise
+        self.generation += 1
+        self.sent = 0
+        logger.info(str(datetime.now()) + " --- Connected to " + self.stream['url'] + ".")
+
+    def disconnect(self):
+        if self.socket is not None:
+            try:
+                self.socket.close()
+            except OSError:
+                pass
+            self.socket = None
+
+    #send a batch of records, and return the connection and the number of bytes sent over it so far.
+    #generation is the connection of the previous batches of the logpull window. If the connection has been lost since, the records sent over it may not have been received, so the logpull window fails.
+    #otherwise (e.g. the first batch), the batch is sent again over a new connection, up to stream_reconnect_attempts times.
+    def send(self, data, generation=None):
+        with self.lock:
+            if self.stream['type'] == "stdout":
+                sys.stdout.buffer.write(data)
+                sys.stdout.buffer.flush()
+                return None, 0
+            attempt = 0
+            while True:
+                try:
+                    if self.socket is None:
+                        self.connect()
+                    if generation is not None and generation != self.generation:
+                        raise StreamLostError(self.stream['url'])
+                    self.socket.sendall(data)
+                    self.sent += len(data)
+                    return self.generation, self.sent
+                except StreamLostError:
+                    raise
+                except OSError as e:
+                    self.disconnect()
+                    if generation is not None and generation == self.generation:
+                        raise StreamLostError(self.stream['url'], e)
+                    if attempt >= stream_reconnect_attempts or is_exit is True:
+                        raise
+                    attempt += 1
+                    logger.warning(str(datetime.now()) + " --- Unable to send the records to " + self.stream['url'] + ": " + str(e) + ". Reconnecting (" + str(attempt) + " of " + str(stream_reconnect_attempts) + ")...")
+                    time.sleep(min(2 ** (attempt - 1), 10))
+
+    #wait until the collector has received the bytes sent over a connection up to offset, i.e. they are no longer in the send buffer of the socket (see SIOCOUTQ of tcp(7) and unix(7))
+    def wait_received(self, generation, offset):
+        if generation is None:
+            return
+        deadline = time.monotonic() + stream_timeout
+        delay = 0.001
+        while True:
+            with self.lock:
+                if generation != self.generation or self.socket is None:
+                    raise StreamLostError(self.stream['url'])
+                unsent = struct.unpack("i", fcntl.ioctl(self.socket.fileno(), termios.TIOCOUTQ, b"\0\0\0\0"))[0]
+                if self.sent - unsent >= offset:
+                    return
+            if time.monotonic() > deadline:
+                raise StreamLostError(self.stream['url'], "The collector has not received the records after " + str(stream_timeout) + " seconds")
+            time.sleep(delay)
+            delay = min(delay * 2, 0.1)
+
+'''
+This exception is raised when the connection of a stream log destination is lost after some of the records of a logpull window have been sent over it (see StreamSink).
+The records may not have been received by the collector, so the logpull window is added to the queue and all of its records will be sent again.
+'''
+class StreamLostError(ConnectionError):
+    def __init__(self, url, reason=None):
+        super().__init__("Connection to " + url + " lost while sending the logs" + (" (" + str(reason) + ")" if reason is not None else ""))
+
+'''
+This class sends the records of a logpull window to a stream log destination (see StreamSink) as soon as they are written, instead of after the whole logpull window has been downloaded.
+Only whole lines are sent, so the records are never cut in half if the logpull window fails. The incomplete last line of the data written so far is kept until the rest of it arrives, so only one record is held in memory.
+The logpull window is only done once the collector has received all of its records. The records which have been sent cannot be taken back, so a logpull window which fails and is pulled again from the queue may send some of the records again.
+'''
+class StreamWriter:
+    def __init__(self, sink):
+        self.sink = sink
+        self.pending = bytearray()
+        self.generation = None
+        self.offset = 0
+
+    def write(self, data):
+        self.pending += data
+        end = self.pending.rfind(b"\n") + 1
+        if end > 0:
+            self.generation, self.offset = self.sink.send(bytes(self.pending[:end]), self.generation)
+            del self.pending[:end]
+
+    #send the last record, which may not end with a new line, and wait until all the records have been received
+    def commit(self):
+        if self.pending:
+            self.generation, self.offset = self.sink.send(bytes(self.pending) + b"\n", self.generation)
+            self.pending = bytearray()
+        self.sink.wait_received(self.generation, self.offset)
+
+'''
+This method converts the timestamp of a log record (RFC 3339 format, in UTC timezone) into a datetime object, so that it can be compared with the log ranges.
+'''
+def parse_log_timestamp(value):
+    value = str(value).replace("Z", "").split("+")[0]
+    if "." in value:
+        value, fraction = value.split(".", 1)
+        return datetime.strptime(value, "%Y-%m-%dT%H:%M:%S") + timedelta(microseconds=int((fraction + "000000")[:6]))
+    return datetime.strptime(value, "%Y-%m-%dT%H:%M:%S")
+
+'''
+This method is responsible to write logs of coalesced Cloudflare Access and Audit log ranges back to the logfile of each original log range, while the logs are still being downloaded from Cloudflare API.
+The logs are processed line by line (one record per line), and each record is written to the log range which its timestamp falls into (TIMESTAMP_FIELDS). Since Cloudflare Access and Audit logs are selected by the same timestamp, this gives the same logfiles as pulling each log range alone. Records outside of all log ranges will be written to the nearest log range.
+window_log_dest_list is a list of (start time, end time, list of log destinations) of each original log range, sorted by the start time.
+The return values and stats are the same as write_logs_stream().
+'''
+def write_logs_split(job, window_log_dest_list, chunks, compressed=True, stats=None):
+    global bytes_downloaded
+
+    stats = {} if stats is None else stats
+    stats['write'] = {}
+    stats['bytes_written'] = {}
+    stats['sha256'] = {}
+    stats['logfiles'] = []
+    log_type = job['log_type']
+    logfiles = []
+    timestamp_field = TIMESTAMP_FIELDS[log_type]
+    window_start_times = [w[0] for w in window_log_dest_list]
+    #the number of records written to each log range
+    record_count = [0] * len(window_log_dest_list)
+    try:
+        try:
+            #open one temporary file as write binary mode for each group of log destinations with the same encoding (see group_by_encoding()) of each log range, together with a compressor if the user prefers compression (see get_encoder())
+            for each_window in window_log_dest_list:
+                window_logfiles = []
+                for group in group_by_encoding(each_window[2]):
+                    window_logfiles.append((GroupLogfile(group), get_encoder(group[0], False), group))
+                logfiles.append(window_logfiles)
+        except Exception as e:
+            return False, e, get_group_name(group)
+
+        #split the logs into lines, after decompressing them if needed
+        def iter_lines():
+            global bytes_downloaded
+            remaining = b""
+            for chunk in iter_timed(chunks, stats, 'download'):
+                with thread_lock:
+                    bytes_downloaded += len(chunk)
+                stats['bytes_downloaded'] = stats.get('bytes_downloaded', 0) + len(chunk)
+                for decompressed_chunk in (iter_timed(decompressor.decompress(chunk), stats, 'encode') if compressed is True else [chunk]):
+                    lines = (remaining + bytes(decompressed_chunk)).split(b"\n")
+                    remaining = lines.pop()
+                    yield from lines
+            if compressed is True:
+                lines = (remaining + decompressor.flush()).split(b"\n")
+                remaining = lines.pop()
+                yield from lines
+            if remaining:
+                yield remaining
+
+        decompressor = GunzipStream()
+        lines = iter_lines()
+        while True:
+            #read the next line from the response body. Any error here is caused by the download, not by the local storage.
+            try:
+                line = next(lines)
+            except StopIteration:
+                break
+            except Exception as e:
+                return False, e, None
+            if not line.strip():
+                continue
+
+            #find the log ranges which the record belongs to
+            try:
+                timestamp = parse_log_timestamp(record_loads(line)[timestamp_field])
+                index = max(bisect_right(window_start_times, timestamp) - 1, 0)
+                indexes = [i for i in range(index, -1, -1) if window_log_dest_list[i][0] <= timestamp <= window_log_dest_list[i][1]] or [index]
+            except Exception:
+                #if the timestamp is not available, the record will be written to the first log range
+                indexes = [0]
+
+            for i in indexes:
+                record_count[i] += 1
+                for logfile, encoder, group in logfiles[i]:
+                    try:
+                        write_encoded(logfile, encoder, line + b"\n", stats, group[0].get('name'))
+                    except Exception as e:
+                        return False, e, get_group_name(group)
+
+        #after writing logs to temporary files, create a hard link from actual file to each temporary file
+        for i in range(len(logfiles)):
+            #same as the logs which are not coalesced, no file will be written for Cloudflare Access and Audit log ranges without any logs
+            if record_count[i] == 0:
+                stats['logfiles'].extend(dict(each_log_dest, path=None, bytes=0, records=0) for logfile, encoder, group in logfiles[i] for each_log_dest in group)
+                continue
+            for logfile, encoder, group in logfiles[i]:
+                try:
+                    if encoder:
+                        write_timed(logfile, timed_call(encoder.flush, stats, 'encode'), stats, group[0].get('name'))
+                except Exception as e:
+                    return False, e, get_group_name(group)
+                records = get_encoder_records(encoder)
+                for each_log_dest in group:
+                    try:
+                        commit_timed(logfile, each_log_dest, stats, record_count[i] if records is None else records)
+                    except Exception as e:
+                        return False, e, each_log_dest.get('name')
+    finally:
+        #close the temporary files and they will automatically deleted
+        for window_logfiles in logfiles:
+            for logfile, encoder, group in window_logfiles:
+                close_encoder(encoder)
+                try:
+                    logfile.close()
+                except Exception:
+                    pass
+
+    stats['records'] = sum(record_count)
+    return True, True, None
+
+'''
+This exception is raised when Cloudflare API returns an error while pulling the logs, after the first response has been received (e.g. while requesting the next page of Cloudflare Access and Audit logs).
+The message follows the same format as the reason of the failed tasks in the queue, e.g. HTTP 429, Cloudflare 10000 - Rate limited.
+'''
+class LogpullError(Exception):
+    def __init__(self, status_code, cf_status_code=0, cf_err_msg=""):
+        self.status_code = status_code
+        self.cf_status_code = cf_status_code
+        self.cf_err_msg = cf_err_msg
+        super().__init__("HTTP " + str(status_code) + (", Cloudflare " + str(cf_status_code) + " - " + cf_err_msg if cf_status_code != 0 else ""))
+
+'''
+This method requests one page of Cloudflare Access or Audit logs from Cloudflare API, and returns the JSON object of the response.
+If Cloudflare API returns an error, LogpullError will be raised.
+'''
+def fetch_log_page(url, headers, priority=PRIORITY_SCHEDULED):
+    r = http_get(url, headers=headers, priority=priority)
+    r.encoding = 'utf-8'
+    if r.status_code == 200:
+        return r.json()
+    raise get_log_page_error(r.status_code, r.text)
+
+'''
+This method returns the LogpullError of a page of Cloudflare Access or Audit logs which failed, with the error code and message given by Cloudflare API (if any).
+'''
+def get_log_page_error(status_code, text):
+    logger.debug(str(datetime.now()) + " --- Output from Cloudflare API:\n" + text) #the raw response will be logged only if the user enables debugging
+    try:
+        response = json.loads(text)
+        return LogpullError(status_code, response["errors"][0]["code"], response["errors"][0]["message"])
+    except (ValueError, KeyError, IndexError, TypeError):
+        return LogpullError(status_code)
+
+'''
+This method yields the records of Cloudflare Access or Audit logs page by page, starting from the first page which has been requested by logs_thread().
+If Cloudflare API tells the total number of records, the rest of the pages will be requested concurrently (up to page_concurrency pages at the same time), but still yielded in order.
+Otherwise, the pages will be requested one by one, by following the cursor or the page number until a page with less than page_size records is returned.
+'''
+def iter_log_pages(url, headers, first_page, priority=PRIORITY_SCHEDULED):
+    yield first_page["result"]
+
+    result_info = first_page.get("result_info") or {}
+
+    if result_info.get("cursor"):
+        #cursor based pagination, the next page can only be known after the current page is received
+        cursor = result_info.get("cursor")
+        while cursor:
+            page = fetch_log_page(url + "&cursor=" + str(cursor), headers, priority)
+            if len(page["result"]) <= 0:
+                break
+            yield page["result"]
+            cursor = (page.get("result_info") or {}).get("cursor")
+    elif result_info.get("total_count") is not None:
+        #the total number of records is known, thus the total number of pages as well
+        per_page = result_info.get("per_page") or page_size
+        total_pages = -(-int(result_info.get("total_count")) // int(per_page))
+        next_page = 2
+        futures = deque()
+        with ThreadPoolExecutor(max_workers=page_concurrency) as executor:
+            #keep at most page_concurrency pages in flight, so the memory usage is bounded no matter how many pages are there
+            while next_page <= total_pages and len(futures) < page_concurrency:
+                futures.append(executor.submit(fetch_log_page, url + "&page=" + str(next_page), headers, priority))
+                next_page += 1
+            try:
+                while futures:
+                    page = futures.popleft().result()
+                    if next_page <= total_pages:
+                        futures.append(executor.submit(fetch_log_page, url + "&page=" + str(next_page), headers, priority))
+                        next_page += 1
+                    yield page["result"]
+            finally:
+                #if something goes wrong, do not request the rest of the pages
+                for future in futures:
+                    future.cancel()
+    else:
+        #no pagination info, keep requesting the next page until the logs within the time range are exhausted
+        page_number = 1
+        records = first_page["result"]
+        while len(records) >= page_size:
+            page_number += 1
+            records = fetch_log_page(url + "&page=" + str(page_number), headers, priority)["result"]
+            if len(records) <= 0:
+                break
+            yield records
+
+'''
+This method converts the pages of Cloudflare Access or Audit logs into chunks of newline-delimited JSON (one record per line), so that they can be streamed into the log destinations by write_logs_stream().
+Only one page is kept in memory at a time (excluding the pages being requested). The records are serialized straight into bytes by record_dumps().
+'''
+def iter_ndjson_pages(url, headers, first_page, priority=PRIORITY_SCHEDULED):
+    for records in iter_log_pages(url, headers, first_page, priority):
+        yield b"".join(record_dumps(record) + b"\n" for record in records)
+
+'''
+This method checks whether two logpull windows can be merged into one, which is only possible if the second window starts right after the first window ends,
+and both windows belong to the same job and are stored in the same date and hour folder (which also keeps the merged window within the 1 hour limit of Cloudflare Logpull API).
+'''
+def can_merge_windows(first_window, second_window):
+    first_job, first_time, first_start, first_end = first_window
+    second_job, second_time, second_start, second_end = second_window
+    if first_job is not second_job:
+        return False
+    if first_job['log_type'] == "http":
+        adjacent = first_end == second_start
+    else:
+        #Cloudflare Access and Audit log windows are 1 second apart, see the main loop
+        adjacent = first_end + timedelta(seconds=1) == second_start
+    return adjacent and first_time.date() == second_time.date() and first_time.hour == second_time.hour
+
+'''
+This method is called by the main loop to hand over a new logpull window to the workers.
+If there are already max_pending_windows windows waiting for a worker (e.g. Cloudflare API is slow), the backlog policy decides what to do:
+block - wait until a worker picks up a pending window. The following windows will be pulled later, but none of them will be skipped.
+merge - merge the new window into the last pending window of the same job, so that one request covers both windows. If they cannot be merged, fall back to block.
+spill - put the new window into the queue of the job, so that it will be picked up by queue_thread() later.
+'''
+def submit_window(job, current_time, log_start_time_utc, log_end_time_utc):
+    window = (job, current_time, log_start_time_utc, log_end_time_utc)
+    with pending_condition:
+        if len(pending_windows) >= max_pending_windows:
+            if backlog_policy == "spill":
+                logger.warning(str(datetime.now()) + " --- " + job['label'] + "Log range " + log_start_time_utc.isoformat() + "Z to " + log_end_time_utc.isoformat() + "Z: " + str(len(pending_windows)) + " logpull windows are waiting for a worker. Adding the log range to the queue...")
+                enqueue_failed(job, current_time, log_start_time_utc, log_end_time_utc, 'Scheduler backlog')
+                return
+            if backlog_policy == "merge":
+                #look for the last pending window of the same job, as the windows of other jobs may have been submitted after it
+                last_index = next((i for i in range(len(pending_windows) - 1, -1, -1) if pending_windows[i][0] is job), None)
+                if last_index is not None and can_merge_windows(pending_windows[last_index], window):
+                    last_window = pending_windows[last_index]
+                    pending_windows[last_index] = (job, last_window[1], last_window[2], log_end_time_utc)
+                    logger.warning(str(datetime.now()) + " --- " + job['label'] + "Log range " + log_start_time_utc.isoformat() + "Z to " + log_end_time_utc.isoformat() + "Z: " + str(len(pending_windows)) + " logpull windows are waiting for a worker. Merged into log range " + last_window[2].isoformat() + "Z to " + log_end_time_utc.isoformat() + "Z.")
+                    return
+            logger.warning(str(datetime.now()) + " --- " + job['label'] + "Log range " + log_start_time_utc.isoformat() + "Z to " + log_end_time_utc.isoformat() + "Z: " + str(len(pending_windows)) + " logpull windows are waiting for a worker. Waiting...")
+            while len(pending_windows) >= max_pending_windows and is_exit is False:
+                pending_condition.wait(1)
+        pending_windows.append(window)
+        pending_condition.notify()
+
+'''
+This method will be run as a separate thread. There are a fixed number of these threads (workers), regardless of how slow Cloudflare API is.
+Its main responsibility is to pick up the logpull windows submitted by the main loop and perform the logpull tasks.
+When the user initiates program exit, the windows which are still pending will be put into the queue so they are not lost.
+'''
+def window_worker():
+    while True:
+        with pending_condition:
+            while not pending_windows and is_exit is False:
+                pending_condition.wait(1)
+            if is_exit is True:
+                while pending_windows:
+                    job, current_time, log_start_time_utc, log_end_time_utc = pending_windows.popleft()
+                    enqueue_failed(job, current_time, log_start_time_utc, log_end_time_utc, 'Program exited before logpull')
+                pending_condition.notify_all()
+                return
+            job, current_time, log_start_time_utc, log_end_time_utc = pending_windows.popleft()
+            #wake up the main loop if it is blocked by a full backlog
+            pending_condition.notify_all()
+
+        try:
+            logs_thread(job, current_time, log_start_time_utc, log_end_time_utc)
+        except SystemExit:
+            return
+        except Exception as e:
+            logger.critical(str(datetime.now()) + " --- Logpull worker failed unexpectedly. Exception message: " + str(e))
+
+'''
+This method splits the time range of a one-time logpull into chunks of backfill_chunk seconds, so that each chunk is accepted by Cloudflare API (e.g. 1 hour limit for HTTP logs).
+It returns a list of (start time, end time) of each chunk.
+'''
+def split_time_range(job, log_start_time_utc, log_end_time_utc):
+    chunks = []
+    chunk_start_time = log_start_time_utc
+    while chunk_start_time < log_end_time_utc:
+        next_chunk_start_time = min(chunk_start_time + timedelta(seconds=backfill_chunk), log_end_time_utc)
+        if job['log_type'] == "http" or next_chunk_start_time == log_end_time_utc:
+            chunks.append((chunk_start_time, next_chunk_start_time))
+        else:
+            #as Cloudflare Access & Audit log request API does not automatically exclude 1 second from end time, subtract 1 second so that the chunks will not overlap
+            chunks.append((chunk_start_time, next_chunk_start_time - timedelta(seconds=1)))
+        chunk_start_time = next_chunk_start_time
+    return chunks
+
+'''
+This method returns the path of the file which records the progress of a one-time logpull (backfill), so that the backfill can be resumed if it is stopped halfway.
+'''
+def get_backfill_state_path(job, log_start_time_utc, log_end_time_utc):
+    Path(os.path.join(state_dir, "backfill")).mkdir(parents=True, exist_ok=True)
+    return os.path.join(state_dir, "backfill", (job['name'] + "_" if job['name'] else "") + job['log_type'] + "_" + (job['zone_id'] if job['log_type'] == "http" else job['account_id']) + "_" + log_start_time_utc.strftime("%Y%m%dT%H%M%SZ") + "_" + log_end_time_utc.strftime("%Y%m%dT%H%M%SZ") + ".json")
+
+'''
+This method will be invoked if the user instructs the program to do logpull for only one time.
+The time range will be split into chunks by split_time_range(), and up to backfill_parallelism chunks will be pulled concurrently.
+The progress and throughput are displayed after each chunk is done. Chunks which are done are recorded in a state file, so running the same command again will resume from where it stopped.
+It returns False if any of the chunks failed.
+'''
+def backfill(job, log_start_time_utc, log_end_time_utc):
+    state_path = get_backfill_state_path(job, log_start_time_utc, log_end_time_utc)
+
+    #retrieve the chunks which are done previously, if any
+    completed_chunks = []
+    if os.path.exists(state_path):
+        try:
+            with open(state_path, mode="r", encoding="utf-8") as state_file:
+                completed_chunks = json.load(state_file).get("completed", [])
+            logger.info(str(datetime.now()) + " --- " + job['label'] + "Resuming backfill: " + str(len(completed_chunks)) + " chunk(s) have been pulled previously.")
+        except Exception as e:
+            logger.warning(str(datetime.now()) + " --- Unable to read backfill progress from " + state_path + ": " + str(e) + ". Starting over.")
+
+    all_chunks = split_time_range(job, log_start_time_utc, log_end_time_utc)
+    remaining_chunks = deque(c for c in all_chunks if c[0].isoformat() + 'Z' not in completed_chunks)
+    total_chunks = len(all_chunks)
+    failed_chunks = []
+
+    logger.info(str(datetime.now()) + " --- " + job['label'] + "Backfill log range " + log_start_time_utc.isoformat() + "Z to " + log_end_time_utc.isoformat() + "Z: " + str(len(remaining_chunks)) + " of " + str(total_chunks) + " chunk(s) of " + str(backfill_chunk) + " seconds to pull, " + str(backfill_parallelism) + " at a time.")
+
+    initial_time = time.time()
+    initial_bytes = bytes_downloaded
+    futures = {}
+    with ThreadPoolExecutor(max_workers=backfill_parallelism) as executor:
+        while remaining_chunks or futures:
+            #keep at most backfill_parallelism chunks in flight, so that nothing more will be started once the user initiates program exit
+            while remaining_chunks and len(futures) < backfill_parallelism and is_exit is False:
+                chunk = remaining_chunks.popleft()
+                futures[executor.submit(logs_thread, job, None, chunk[0], chunk[1])] = chunk
+            if not futures:
+                break
+
+            done_future = next(as_completed(futures))
+            chunk = futures.pop(done_future)
+            try:
+                null, status = done_future.result()
+            except Exception as e:
+                logger.error(str(datetime.now()) + " --- " + job['label'] + "Backfill chunk " + chunk[0].isoformat() + "Z to " + chunk[1].isoformat() + "Z failed unexpectedly. Exception message: " + str(e))
+                status = False
+            if status is True:
+                completed_chunks.append(chunk[0].isoformat() + 'Z')
+                try:
+                    #write the progress to a temporary file first, then replace the state file, so the state file is never half written
+                    with open(state_path + ".tmp", mode="w", encoding="utf-8") as state_file:
+                        json.dump({"completed": completed_chunks}, state_file)
+                    os.replace(state_path + ".tmp", state_path)
+                except Exception as e:
+                    logger.warning(str(datetime.now()) + " --- Unable to save backfill progress to " + state_path + ": " + str(e) + ".")
+            else:
+                failed_chunks.append(chunk)
+
+            #display the progress and throughput of the backfill
+            elapsed = max(time.time() - initial_time, 0.001)
+            downloaded_mb = (bytes_downloaded - initial_bytes) / 1048576
+            logger.info(str(datetime.now()) + " --- " + job['label'] + "Backfill progress: " + str(len(completed_chunks)) + " of " + str(total_chunks) + " chunk(s) done (" + str(round(len(completed_chunks) * 100 / total_chunks, 1)) + "%), " + str(len(failed_chunks)) + " failed, " + str(round(downloaded_mb, 2)) + " MB downloaded at " + str(round(downloaded_mb / elapsed, 2)) + " MB/s.")
+
+    if failed_chunks:
+        logger.error(str(datetime.now()) + " --- " + job['label'] + "Backfill finished with " + str(len(failed_chunks)) + " failed chunk(s): " + ", ".join(c[0].isoformat() + "Z to " + c[1].isoformat() + "Z" for c in failed_chunks) + ". Run the same command again to retry the failed chunks.")
+        return False
+
+    logger.info(str(datetime.now()) + " --- " + job['label'] + "Backfill finished. " + str(total_chunks) + " chunk(s) pulled in " + str(round(time.time() - initial_time, 1)) + " seconds.")
+    #the state file is no longer required once everything is done
+    try:
+        os.remove(state_path)
+    except OSError:
+        pass
+    return True
+
+'''
+This method returns the path of the file which records the checkpoint of a job, so that the program can resume from it after it restarts.
+'''
+def get_checkpoint_path(job):
+    Path(os.path.join(state_dir, "checkpoint")).mkdir(parents=True, exist_ok=True)
+    return os.path.join(state_dir, "checkpoint", (job['name'] + "_" if job['name'] else "") + job['log_type'] + "_" + (job['zone_id'] if job['log_type'] == "http" else job['account_id']) + ".json")
+
+'''
+This method reads the checkpoint of a job saved by settle_window(). It returns None if the job does not have a checkpoint yet (e.g. the first time the program runs).
+'''
+def read_checkpoint(job):
+    checkpoint_path = get_checkpoint_path(job)
+    if not os.path.exists(checkpoint_path):
+        return None
+    try:
+        with open(checkpoint_path, mode="r", encoding="utf-8") as checkpoint_file:
+            return datetime.strptime(json.load(checkpoint_file)["log_end_time_utc"], "%Y-%m-%dT%H:%M:%SZ")
+    except Exception as e:
+        logger.warning(str(datetime.now()) + " --- " + job['label'] + "Unable to read checkpoint from " + checkpoint_path + ": " + str(e) + ". The log range missed while the program was not running will not be pulled.")
+        return None
+
+'''
+This method records a logpull window of a job which has been scheduled, until it is settled by settle_window(). The end time is exclusive (see get_window_end()).
+'''
+def track_window(job, log_start_time_utc, log_end_time_utc):
+    with checkpoint_lock:
+        job['windows_in_flight'][log_start_time_utc] = log_end_time_utc
+        if job['scheduled_until'] is None or log_end_time_utc > job['scheduled_until']:
+            job['scheduled_until'] = log_end_time_utc
+
+'''
+This method is called once the logs of a log range have been written, or the log range has been added to the queue or fail.log, so it will not be lost if the program stops.
+The logpull windows within the log range are no longer in flight. The checkpoint of the job is the start time of the oldest logpull window still in flight,
+or the end time of the last logpull window if none of them is in flight, so everything before the checkpoint has been settled even though the windows finish in any order.
+The checkpoint is saved to a file whenever it moves forward. The end time is exclusive (see get_window_end()).
+'''
+def settle_window(job, log_start_time_utc, log_end_time_utc):
+    if one_time is True:
+        return
+    with checkpoint_lock:
+        windows_in_flight = job['windows_in_flight']
+        for window_start_time in [w for w in windows_in_flight if log_start_time_utc <= w < log_end_time_utc]:
+            del windows_in_flight[window_start_time]
+        checkpoint = min(windows_in_flight) if windows_in_flight else job['scheduled_until']
+        if checkpoint is None or checkpoint == job['checkpoint']:
+            return
+        job['checkpoint'] = checkpoint
+
+        checkpoint_path = get_checkpoint_path(job)
+        try:
+            #write the checkpoint to a temporary file first, then replace the checkpoint file, so the checkpoint file is never half written
+            with open(checkpoint_path + ".tmp", mode="w", encoding="utf-8") as checkpoint_file:
+                json.dump({"log_end_time_utc": checkpoint.isoformat() + 'Z'}, checkpoint_file)
+            os.replace(checkpoint_path + ".tmp", checkpoint_path)
+        except Exception as e:
+            logger.warning(str(datetime.now()) + " --- " + job['label'] + "Unable to save checkpoint to " + checkpoint_path + ": " + str(e) + ".")
+    metrics.set("cf_logs_downloader_checkpoint_time_seconds", get_metrics_labels(job), checkpoint.replace(tzinfo=timezone.utc).timestamp())
+
+'''
+This method returns the first logpull window of a job when the program starts: the folder time, the start time (UTC) and the delay (in seconds) of the first logpull.
+The logs are pulled from logs_from seconds before the current time, so Cloudflare API has received the logs of the window before it is requested (at least 60 seconds for HTTP logs).
+If the program restarted shortly, the windows before the checkpoint (see read_checkpoint()) have been done already, so the first window starts from the checkpoint instead.
+The first logpull is then delayed by the same amount of time, so the window is still requested logs_from seconds after its start time, same as if the program had not been restarted.
+'''
+def get_first_window(job, checkpoint, current_time_utc, current_time_local):
+    #calculate how many seconds to go back from current time to pull the logs. 
+    if job['log_type'] == "http":
+        #mininum 60 seconds difference to accommodate Cloudflare logs delay, and also add at least 60 seconds or more, based on interval
+        logs_from = 60.0 + (((job['interval']-1) // 60 * 60) + 60)
+    else:
+        #add at least 60 seconds or more, based on interval
+        logs_from = 0.0 + (((job['interval']-1) // 60 * 60) + 60)
+
+    log_start_time_utc = current_time_utc.replace(second=0, microsecond=0) - timedelta(seconds=logs_from)
+    current_time = current_time_local.replace(second=0, microsecond=0) - timedelta(seconds=logs_from)
+    if checkpoint is not None and log_start_time_utc < checkpoint < current_time_utc:
+        delay = checkpoint - log_start_time_utc
+        return current_time + delay, checkpoint, delay.total_seconds()
+    return current_time, log_start_time_utc, 0
+
+'''
+This method is called when the program starts, before the logpull windows of the job are scheduled from log_start_time_utc (folder time current_time).
+If the checkpoint (see read_checkpoint()) of the job is earlier than that, the log range in between was missed while the program was not running. The log range is split into chunks of backfill_chunk seconds,
+aligned within the hour like adaptive window sizing (see split_aligned_windows()), so the chunks never cross the date and hour folders. The chunks are tracked right away,
+so the checkpoint will not move past them until they have been pulled. HTTP logs older than HTTP_LOG_RETENTION can no longer be pulled, and are recorded in fail.log instead.
+It returns the list of (current_time, log_start_time_utc, log_end_time_utc) of each chunk to be pulled by catch_up_job().
+'''
+def get_catch_up_windows(job, checkpoint, current_time, log_start_time_utc, current_time_utc):
+    if checkpoint is None or checkpoint >= log_start_time_utc:
+        return []
+
+    if catch_up is False:
+        logger.warning(str(datetime.now()) + " --- " + job['label'] + "Log range " + checkpoint.isoformat() + "Z to " + log_start_time_utc.isoformat() + "Z was missed while the program was not running. Catching up is disabled, the log range will not be pulled.")
+        return []
+
+    catch_up_start_time_utc = checkpoint
+    oldest_time_utc = (current_time_utc - timedelta(seconds=HTTP_LOG_RETENTION)).replace(second=0, microsecond=0) + timedelta(minutes=1)
+    if job['log_type'] == "http" and catch_up_start_time_utc < oldest_time_utc:
+        catch_up_start_time_utc = min(oldest_time_utc, log_start_time_utc)
+        logger.warning(str(datetime.now()) + " --- " + job['label'] + "Log range " + checkpoint.isoformat() + "Z to " + catch_up_start_time_utc.isoformat() + "Z is older than " + str(HTTP_LOG_RETENTION // 86400) + " days and can no longer be pulled from Cloudflare API.")
+        fail_logger.error(job['label'] + "Log range " + checkpoint.isoformat() + "Z to " + catch_up_start_time_utc.isoformat() + "Z [" + job['log_type'] + "] (Older than the retention of Cloudflare API)")
+
+    #the chunks are as long as backfill_chunk, but must be one of the lengths which are aligned within the hour
+    chunk_length = max(n for n in ADAPTIVE_WINDOW_LENGTHS if n <= backfill_chunk)
+    folder_time = current_time - (log_start_time_utc - catch_up_start_time_utc)
+    windows = split_aligned_windows(job, folder_time, catch_up_start_time_utc, log_start_time_utc, chunk_length)[0]
+    for window in windows:
+        track_window(job, window[1], get_window_end(job, window[2]))
+    return windows
+
+'''
+This method will be run as a separate thread for each job which has a log range to catch up (see get_catch_up_windows()).
+Same as backfill(), up to backfill_parallelism chunks will be pulled concurrently, while the logpull windows of the current time carry on. Failed chunks will be retried from the queue.
+The progress is displayed after each chunk is done, and the time spent is recorded in the metrics. No more chunks will be started once the user initiates program exit.
+As the chunks which have not been pulled stay in flight, the checkpoint will not move past them, and they will be pulled again after the program restarts.
+'''
+def catch_up_job(job, windows):
+    labels = get_metrics_labels(job)
+    remaining_windows = deque(windows)
+    remaining_seconds = sum((get_window_end(job, w[2]) - w[1]).total_seconds() for w in windows)
+    total_windows = len(windows)
+    done_windows = 0
+    metrics.set("cf_logs_downloader_catch_up_remaining_seconds", labels, remaining_seconds)
+
+    logger.info(str(datetime.now()) + " --- " + job['label'] + "Catching up log range " + windows[0][1].isoformat() + "Z to " + get_window_end(job, windows[-1][2]).isoformat() + "Z missed while the program was not running: " + str(total_windows) + " chunk(s) to pull, " + str(backfill_parallelism) + " at a time.")
+
+    initial_time = time.time()
+    futures = {}
+    with ThreadPoolExecutor(max_workers=backfill_parallelism) as executor:
+        while remaining_windows or futures:
+            while remaining_windows and len(futures) < backfill_parallelism and is_exit is False:
+                window = remaining_windows.popleft()
+                futures[executor.submit(logs_thread, job, *window)] = window
+            if not futures:
+                break
+
+            done_future = next(as_completed(futures))
+            window = futures.pop(done_future)
+            try:
+                done_future.result()
+            except Exception as e:
+                logger.error(str(datetime.now()) + " --- " + job['label'] + "Catch-up chunk " + window[1].isoformat() + "Z to " + window[2].isoformat() + "Z failed unexpectedly. Exception message: " + str(e))
+            done_windows += 1
+            remaining_seconds -= (get_window_end(job, window[2]) - window[1]).total_seconds()
+            metrics.set("cf_logs_downloader_catch_up_remaining_seconds", labels, remaining_seconds)
+            metrics.set("cf_logs_downloader_catch_up_seconds", labels, time.time() - initial_time)
+            logger.info(str(datetime.now()) + " --- " + job['label'] + "Catch-up progress: " + str(done_windows) + " of " + str(total_windows) + " chunk(s) done (" + str(round(done_windows * 100 / total_windows, 1)) + "%).")
+
+    if remaining_windows:
+        logger.info(str(datetime.now()) + " --- " + job['label'] + "Catch-up stopped with " + str(len(remaining_windows)) + " chunk(s) left. They will be pulled after the program restarts.")
+    else:
+        logger.info(str(datetime.now()) + " --- " + job['label'] + "Catch-up finished. " + str(total_windows) + " chunk(s) pulled in " + str(round(time.time() - initial_time, 1)) + " seconds.")
+
+'''
+This method returns the log ranges (log start time, log end time) of the logfiles in a log destination, by looking up the log destination instead of the manifest.
+Only the date folders around the log range (and the log destination itself, e.g. for logfiles which are not organized into date and time folders) are listed.
+The log ranges of a compacted logfile are the windows in its index (see compact_logfiles()).
+'''
+def scan_logfile_ranges(d, log_start_time_utc, log_end_time_utc, utc_offset):
+    logfile_name_pattern = get_logfile_name_pattern(d)
+    first_date = str((log_start_time_utc + utc_offset - timedelta(days=1)).date())
+    last_date = str((log_end_time_utc + utc_offset + timedelta(days=1)).date())
+    if d.get('s3'):
+        return scan_s3_logfile_ranges(d, logfile_name_pattern, first_date, last_date)
+    folders = [d.get('path')]
+    try:
+        with os.scandir(d.get('path')) as entries:
+            date_folders = [e.path for e in entries if e.is_dir() and first_date <= e.name <= last_date]
+        #logfiles compacted by day are in the date folder itself
+        folders.extend(date_folders)
+        for date_folder in date_folders:
+            with os.scandir(date_folder) as entries:
+                folders.extend(e.path for e in entries if e.is_dir())
+    except FileNotFoundError:
+        return []
+
+    ranges = []
+    for folder in folders:
+        with os.scandir(folder) as entries:
+            for e in entries:
+                matched = logfile_name_pattern.match(e.name)
+                if matched:
+                    windows = read_compaction_index(e.path)
+                    if windows is None:
+                        ranges.append((matched.group(1), matched.group(2)))
+                    else:
+                        ranges.extend((w['log_start_time'], w['log_end_time']) for w in windows)
+    return sorted(ranges)
+
+'''
+This method returns the log ranges of the logfiles in an S3 log destination, same as scan_logfile_ranges(). The objects are listed under the key prefix itself (without the date and hour "folders"),
+and under the date "folders" between first_date and last_date.
+'''
+def scan_s3_logfile_ranges(d, logfile_name_pattern, first_date, last_date):
+    key_prefix = split_s3_path(d.get('path'))[1]
+    key_prefix = key_prefix + "/" if key_prefix else ""
+    prefixes = [(key_prefix, "/")]
+    date = datetime.strptime(first_date, "%Y-%m-%d")
+    while str(date.date()) <= last_date:
+        prefixes.append((key_prefix + str(date.date()) + "/", None))
+        date += timedelta(days=1)
+
+    ranges = []
+    for prefix, delimiter in prefixes:
+        for logfile_path, size in iter_s3_objects(d, prefix, delimiter):
+            matched = logfile_name_pattern.match(logfile_path.rsplit("/", 1)[-1])
+            if matched:
+                ranges.append((matched.group(1), matched.group(2)))
+    return sorted(ranges)
+
+'''
+This method looks for the log ranges between log_start_time_utc and log_end_time_utc (exclusive) which are missing (gaps) or written more than once (overlaps) in a log destination of a job.
+The log ranges of the logfiles are taken from the manifest (see Manifest.get_ranges()) if enabled, otherwise from the log destination (see scan_logfile_ranges()),
+then swept in order of the log start time. It returns a list of (gap | overlap, start time, end time), where the end time is exclusive.
+'''
+def find_gaps(job, d, log_start_time_utc, log_end_time_utc, utc_offset):
+    if manifest is not None:
+        ranges = manifest.get_ranges(job, d.get('name'), log_start_time_utc.isoformat() + 'Z', log_end_time_utc.isoformat() + 'Z')
+    else:
+        ranges = scan_logfile_ranges(d, log_start_time_utc, log_end_time_utc, utc_offset)
+
+    #the end time of Cloudflare Access and Audit log ranges is inclusive, see get_next_window()
+    end_offset = timedelta(seconds=0 if job['log_type'] == "http" else 1)
+    results = []
+    covered_until = log_start_time_utc
+    for range_start, range_end in ranges:
+        #fromisoformat() is much faster than strptime(), which matters with months of short log ranges
+        range_start = datetime.fromisoformat(range_start[:-1])
+        range_end = datetime.fromisoformat(range_end[:-1]) + end_offset
+        if range_end <= log_start_time_utc or range_start >= log_end_time_utc:
+            continue
+        if range_start > covered_until:
+            results.append(("gap", covered_until, range_start))
+        elif range_start < covered_until:
+            overlap = ("overlap", max(range_start, log_start_time_utc), min(range_end, covered_until))
+            #adjacent overlaps (e.g. a logfile overlapping a few shorter logfiles) are reported as one
+            if results and results[-1][0] == "overlap" and results[-1][2] == overlap[1]:
+                results[-1] = ("overlap", results[-1][1], overlap[2])
+            else:
+                results.append(overlap)
+        covered_until = max(covered_until, range_end)
+    if covered_until < log_end_time_utc:
+        results.append(("gap", covered_until, log_end_time_utc))
+    return results
+
+'''
+This method is invoked if the user specifies --find-gaps. The gaps and overlaps of each log destination of each job are displayed as JSON, together with a summary.
+If --fill-gaps is specified, each gap is split into chunks of backfill_chunk seconds aligned within the hour (see split_aligned_windows()), and pulled only for the log destinations which miss it.
+queue - the chunks are added to the queue of the job, and retried by queue_thread() of the program.
+backfill - the chunks are pulled right away, backfill_parallelism chunks at a time. Failed chunks are added to the queue.
+It returns the exit code: 1 if there are gaps or overlaps which have not been filled (or failed to be pulled), otherwise 0.
+'''
+def run_find_gaps():
+    log_start_time_utc, log_end_time_utc = find_gaps_range
+    #the date and hour folders are in local time, see the main loop
+    utc_offset = timedelta(minutes=round((datetime.now() - datetime.utcnow()).total_seconds() / 60))
+    report = []
+    unresolved = False
+    fill_windows = []
+    for job in jobs:
+        #the gaps of all the log destinations of the job, and the log destinations which miss each of them
+        gap_dests = {}
+        for d in job['log_dest']:
+            #the records sent to stream log destinations are only known from the manifest
+            if d.get('stream') and manifest is None:
+                logger.warning(str(datetime.now()) + " --- " + job['label'] + "Log destination " + d.get('name') + ": The log ranges sent to stream log destinations are only recorded in the manifest, which is disabled. Skipping.")
+                continue
+            results = find_gaps(job, d, log_start_time_utc, log_end_time_utc, utc_offset)
+            gaps = [r for r in results if r[0] == "gap"]
+            overlaps = [r for r in results if r[0] == "overlap"]
+            report.append({'job': job['name'] or "default", 'log_type': job['log_type'], 'dest': d.get('name'), 'gaps': len(gaps), 'gap_seconds': sum((r[2] - r[1]).total_seconds() for r in gaps), 'overlaps': len(overlaps), 'overlap_seconds': sum((r[2] - r[1]).total_seconds() for r in overlaps),
+                'results': [{'type': r[0], 'log_start_time_utc': r[1].isoformat() + 'Z', 'log_end_time_utc': r[2].isoformat() + 'Z'} for r in results]})
+            for r in gaps:
+                gap_dests.setdefault((r[1], r[2]), []).append(d.get('name'))
+            unresolved = unresolved or bool(overlaps) or (bool(gaps) and fill_gaps_mode is None)
+            logger.info(str(datetime.now()) + " --- " + job['label'] + "Log destination " + d.get('name') + ": " + str(len(gaps)) + " gap(s) and " + str(len(overlaps)) + " overlap(s) between " + log_start_time_utc.isoformat() + "Z and " + log_end_time_utc.isoformat() + "Z.")
+
+        chunk_length = max(n for n in ADAPTIVE_WINDOW_LENGTHS if n <= backfill_chunk)
+        for (gap_start_time, gap_end_time), dest_names in sorted(gap_dests.items()):
+            #only the log destinations which miss the gap are written, unless all of them miss it
+            dest_job = get_dest_job(job, dest_names if len(dest_names) < len(job['log_dest']) else None)
+            for window in split_aligned_windows(job, gap_start_time + utc_offset, gap_start_time, gap_end_time, chunk_length)[0]:
+                fill_windows.append((dest_job, window))
+
+    print(json.dumps(report, indent=2))
+
+    if fill_gaps_mode == "queue":
+        for dest_job, window in fill_windows:
+            enqueue_failed(dest_job, window[0], window[1], window[2], 'Gap found in archive')
+        logger.info(str(datetime.now()) + " --- " + str(len(fill_windows)) + " chunk(s) added to the queue. They will be pulled by the program within " + str(QUEUE_RESCAN_INTERVAL) + " seconds if it is running, or once it is started.")
+    elif fill_gaps_mode == "backfill" and fill_windows:
+        for job in jobs:
+            verify_credential(job)
+        logger.info(str(datetime.now()) + " --- Pulling " + str(len(fill_windows)) + " chunk(s) of gaps, " + str(backfill_parallelism) + " at a time.")
+        remaining_windows = deque(fill_windows)
+        futures = {}
+        pulled = 0
+        with ThreadPoolExecutor(max_workers=backfill_parallelism) as executor:
+            while remaining_windows or futures:
+                #keep at most backfill_parallelism chunks in flight, so that nothing more will be started once the user initiates program exit
+                while remaining_windows and len(futures) < backfill_parallelism and is_exit is False:
+                    dest_job, window = remaining_windows.popleft()
+                    futures[executor.submit(logs_thread, dest_job, *window)] = (dest_job, window)
+                if not futures:
+                    break
+                done_future = next(as_completed(futures))
+                dest_job, window = futures.pop(done_future)
+                try:
+                    null, status = done_future.result()
+                except Exception as e:
+                    logger.error(str(datetime.now()) + " --- " + dest_job['label'] + "Gap chunk " + window[1].isoformat() + "Z to " + window[2].isoformat() + "Z failed unexpectedly. Exception message: " + str(e))
+                    status = False
+                pulled += 1 if status is True else 0
+        logger.info(str(datetime.now()) + " --- " + str(pulled) + " of " + str(len(fill_windows)) + " chunk(s) of gaps pulled." + (" The failed chunks have been added to the queue." if pulled < len(fill_windows) - len(remaining_windows) else ""))
+        unresolved = unresolved or pulled < len(fill_windows)
+
+    return 1 if unresolved else 0
+
+'''
+This method returns the windows of a compacted logfile (see compact_logfiles()) from the index next to it, as a list of dictionaries with log_start_time, log_end_time, offset and length.
+None is returned if the logfile has not been compacted.
+'''
+def read_compaction_index(logfile_path):
+    try:
+        with open(str(logfile_path) + COMPACTION_INDEX_SUFFIX, "r") as f:
+            return json.load(f)['windows']
+    except FileNotFoundError:
+        return None
+
+'''
+This method finishes or discards the compaction which has been interrupted in a folder (e.g. the program has been killed), see compact_logfiles().
+The index is written before the compacted logfile, and the compaction is committed once the index is in place. The compacted logfile is then put in place as well, otherwise both are removed.
+'''
+def recover_compaction(folder):
+    with os.scandir(folder) as entries:
+        names = set(e.name for e in entries if e.name.endswith(COMPACTION_TEMP_SUFFIX))
+    for name in names:
+        if name.endswith(COMPACTION_INDEX_SUFFIX + COMPACTION_TEMP_SUFFIX):
+            continue
+        logfile_name = name[:-len(COMPACTION_TEMP_SUFFIX)]
+        if logfile_name + COMPACTION_INDEX_SUFFIX + COMPACTION_TEMP_SUFFIX in names:
+            os.remove(os.path.join(folder, name))
         else:
-            log_dest_per_thread_final.append({'name': p.get('name'), 'path': logfile_path, 'no_gzip': p.get('no_gzip')})
+            os.replace(os.path.join(folder, name), os.path.join(folder, logfile_name))
+    for name in names:
+        if name.endswith(COMPACTION_INDEX_SUFFIX + COMPACTION_TEMP_SUFFIX):
+            os.remove(os.path.join(folder, name))
+
+'''
+This method returns the logfiles of a log destination in a folder, as a list of (path, log start time, log end time). The interrupted compaction in the folder is recovered first.
+'''
+def list_logfiles(folder, logfile_name_pattern):
+    recover_compaction(folder)
+    logfiles = []
+    with os.scandir(folder) as entries:
+        for e in entries:
+            matched = logfile_name_pattern.match(e.name)
+            if matched and e.is_file():
+                logfiles.append((e.path, matched.group(1), matched.group(2)))
+    return logfiles
+
+'''
+This method returns the groups of logfiles of a log destination to be merged by compact_logfiles(), for each hour or day (period) which is over, as a list of (folder of the compacted logfile, logfiles).
+Logfiles organized into date and time folders are grouped by the hour folder (hour) or date folder together with its hour folders (day). The folders are in local time, see the main loop.
+Logfiles in the log destination itself (one-time operation, or no_organize) are grouped by the hour or day of their log start time, in UTC.
+'''
+def get_compaction_groups(d, period):
+    logfile_name_pattern = get_logfile_name_pattern(d)
+    period_length = timedelta(hours=1) if period == "hour" else timedelta(days=1)
+    closed_time_utc = datetime.utcnow() - timedelta(seconds=COMPACTION_GRACE)
+    closed_time = datetime.now() - timedelta(seconds=COMPACTION_GRACE)
+
+    try:
+        root_logfiles = list_logfiles(d.get('path'), logfile_name_pattern)
+    except FileNotFoundError:
+        return []
+    root_groups = {}
+    for logfile in root_logfiles:
+        period_start = datetime.strptime(logfile[1][:13], "%Y-%m-%dT%H") if period == "hour" else datetime.strptime(logfile[1][:10], "%Y-%m-%d")
+        if period_start + period_length <= closed_time_utc:
+            root_groups.setdefault(period_start, []).append(logfile)
+    groups = [(d.get('path'), root_groups[period_start]) for period_start in sorted(root_groups)]
+
+    date_folders = []
+    with os.scandir(d.get('path')) as entries:
+        for e in entries:
+            try:
+                date_folders.append((e.path, datetime.strptime(e.name, "%Y-%m-%d")))
+            except ValueError:
+                continue
+    for date_folder, date in sorted(date_folders):
+        if period == "day" and date + period_length > closed_time:
+            continue
+        #the hour folders are named after the hour, e.g. 000, 900 and 2300
+        with os.scandir(date_folder) as entries:
+            hour_folders = sorted((date + timedelta(hours=int(e.name[:-2])), e.path) for e in entries if e.is_dir() and re.fullmatch(r"\d{1,2}00", e.name) and int(e.name[:-2]) < 24)
+        if period == "hour":
+            groups.extend((hour_folder, list_logfiles(hour_folder, logfile_name_pattern)) for hour, hour_folder in hour_folders if hour + period_length <= closed_time)
+        else:
+            logfiles = list_logfiles(date_folder, logfile_name_pattern)
+            for hour, hour_folder in hour_folders:
+                logfiles.extend(list_logfiles(hour_folder, logfile_name_pattern))
+            groups.append((date_folder, logfiles))
+    return groups
+
+'''
+This method merges a group of logfiles of a log destination (see get_compaction_groups()) into one compacted logfile in the folder, named after the log range from the first to the last window.
+The windows are concatenated in order of the log start time without being recompressed, as gzip members, zstd frames and NDJSON lines can be concatenated as they are.
+The log range, offset and length of each window are kept in the index next to the compacted logfile, so that each window can still be found and read on its own.
+Compacted logfiles are merged again with the windows written later. The logfiles which have been merged already (e.g. by an interrupted compaction) are only removed.
+The compacted logfile is committed atomically (see recover_compaction()), before the manifest is updated and the logfiles which have been merged are removed.
+It returns the number of logfiles removed, and the path of the compacted logfile (None if there's nothing to merge).
+'''
+def compact_logfiles(job, d, folder, logfiles):
+    #the windows of each logfile. A compacted logfile is made of the windows in its index.
+    inputs = []
+    for logfile_path, log_start_time, log_end_time in logfiles:
+        windows = read_compaction_index(logfile_path)
+        if windows is None:
+            inputs.append((logfile_path, [{'log_start_time': log_start_time, 'log_end_time': log_end_time, 'offset': 0, 'length': os.path.getsize(logfile_path)}], False))
+        else:
+            inputs.append((logfile_path, windows, True))
+
+    #each window belongs to the compacted logfile with the most windows which contains it. The logfiles whose windows all belong to other compacted logfiles have been merged already.
+    owners = {}
+    for logfile_path, windows, compacted in sorted(inputs, key=lambda i: len(i[1]), reverse=True):
+        if compacted:
+            for w in windows:
+                owners.setdefault((w['log_start_time'], w['log_end_time']), logfile_path)
+    merged = [i for i in inputs if all(owners.get((w['log_start_time'], w['log_end_time']), i[0]) != i[0] for w in i[1])]
+    remaining = [i for i in inputs if i not in merged]
+
+    compacted_path = None
+    if len(remaining) > 1:
+        #the windows in order of the log start time, each of them only once
+        segments = {}
+        for logfile_path, windows, compacted in remaining:
+            for w in windows:
+                segments.setdefault((w['log_start_time'], w['log_end_time']), (logfile_path, w))
+        segments = [segments[key] for key in sorted(segments)]
+        compacted_path = os.path.join(folder, d.get('prefix') + "_" + segments[0][1]['log_start_time'] + "~" + max(w['log_end_time'] for null, w in segments) + get_logfile_extension(d))
+        if os.path.exists(compacted_path) and compacted_path not in [i[0] for i in remaining]:
+            raise Exception("Logfile " + compacted_path + " already exists")
+
+        index = []
+        offset = 0
+        for logfile_path, w in segments:
+            index.append({'log_start_time': w['log_start_time'], 'log_end_time': w['log_end_time'], 'offset': offset, 'length': w['length']})
+            offset += w['length']
+
+        index_temp_path = compacted_path + COMPACTION_INDEX_SUFFIX + COMPACTION_TEMP_SUFFIX
+        logfile_temp_path = compacted_path + COMPACTION_TEMP_SUFFIX
+        try:
+            with open(index_temp_path, "w") as f:
+                json.dump({'log_type': job['log_type'], 'windows': index}, f)
+                f.flush()
+                os.fsync(f.fileno())
+            with open(logfile_temp_path, "wb") as f:
+                for logfile_path, w in segments:
+                    with open(logfile_path, "rb") as logfile:
+                        logfile.seek(w['offset'])
+                        length = w['length']
+                        while length > 0:
+                            data = logfile.read(min(chunk_size, length))
+                            if not data:
+                                raise Exception("Logfile " + logfile_path + " is shorter than expected")
+                            f.write(data)
+                            length -= len(data)
+                f.flush()
+                os.fsync(f.fileno())
+        except BaseException:
+            for temp_path in (logfile_temp_path, index_temp_path):
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+            raise
+        #the compaction is committed once the index is in place
+        os.replace(index_temp_path, compacted_path + COMPACTION_INDEX_SUFFIX)
+        os.replace(logfile_temp_path, compacted_path)
+
+        inputs.append((compacted_path, index, True))
+        owners.update({(w['log_start_time'], w['log_end_time']): compacted_path for w in index})
+        merged.extend(remaining)
+
+    if not merged:
+        return 0, None
+
+    #the manifest keeps the path of the logfile of each window, together with where the window is now
+    if manifest is not None:
+        owner_paths = set(owners.values())
+        for logfile_path, windows, compacted in inputs:
+            if logfile_path in owner_paths:
+                manifest.set_compacted(job, d.get('name'), logfile_path, windows)
+
+    removed = 0
+    for logfile_path, windows, compacted in merged:
+        if logfile_path == compacted_path:
+            continue
+        #the logfile is removed before its index, so that it's never taken as a window on its own
+        os.remove(logfile_path)
+        if compacted:
+            os.remove(logfile_path + COMPACTION_INDEX_SUFFIX)
+        removed += 1
+    return removed, compacted_path
+
+'''
+This method is invoked if the user specifies --compact. The logfiles of each hour or day (compact_period) which is over are merged into one logfile per log destination (see compact_logfiles()).
+Parquet files cannot be concatenated, so the log destinations with Parquet format are skipped, as well as S3 log destinations.
+It returns the exit code: 1 if the logfiles of any hour or day could not be compacted, otherwise 0.
+'''
+def run_compaction():
+    failed = False
+    compacted_logfiles = 0
+    removed_logfiles = 0
+    for job in jobs:
+        for d in job['log_dest']:
+            if d.get('parquet'):
+                logger.warning(str(datetime.now()) + " --- " + job['label'] + "Log destination " + d.get('name') + ": Parquet files cannot be concatenated. Skipping.")
+                continue
+            if d.get('s3'):
+                logger.warning(str(datetime.now()) + " --- " + job['label'] + "Log destination " + d.get('name') + ": Logfiles in S3 are not compacted. Skipping.")
+                continue
+            if d.get('stream'):
+                continue
+            for folder, logfiles in get_compaction_groups(d, compact_period):
+                try:
+                    removed, compacted_path = compact_logfiles(job, d, folder, logfiles)
+                except Exception as e:
+                    logger.error(str(datetime.now()) + " --- " + job['label'] + "Log destination " + d.get('name') + ": Unable to compact the logfiles in " + folder + ": " + str(e) + ".")
+                    failed = True
+                    continue
+                if compacted_path is not None:
+                    compacted_logfiles += 1
+                    logger.info(str(datetime.now()) + " --- " + job['label'] + "Log destination " + d.get('name') + ": " + str(removed) + " logfile(s) compacted into " + compacted_path + ".")
+                removed_logfiles += removed
+                #the hour folders are left empty once the day has been compacted
+                if compact_period == "day" and folder != d.get('path'):
+                    with os.scandir(folder) as entries:
+                        hour_folders = [e.path for e in entries if e.is_dir()]
+                    for hour_folder in hour_folders:
+                        try:
+                            os.rmdir(hour_folder)
+                        except OSError:
+                            pass
+
+    logger.info(str(datetime.now()) + " --- " + str(removed_logfiles) + " logfile(s) compacted into " + str(compacted_logfiles) + " logfile(s).")
+    return 1 if failed else 0
+
+'''
+This method returns the number of seconds to wait before retrying a failed logpull task after the given number of failed attempts.
+The delay grows exponentially (retry_backoff_base, doubled for every failed attempt, up to retry_backoff_max) with random jitter, so that a large number of failed tasks will not be retried at the same time.
+Tasks which have not been attempted before (attempts=0, e.g. spilled by the scheduler) can be picked up immediately.
+'''
+def get_retry_backoff(attempts):
+    if attempts <= 0:
+        return 0
+    backoff = min(retry_backoff_max, retry_backoff_base * (2 ** (attempts - 1)))
+    #"equal jitter": wait for at least half of the backoff, plus a random portion of the other half
+    return backoff / 2 + random.uniform(0, backoff / 2)
+
+'''
+This method puts a failed logpull task into the queue of the job, so that it will be retried by queue_thread() later.
+The number of failed attempts is stored together with the task, and the next attempt is delayed (see get_retry_backoff()). As the delay is stored in the queue, it still applies after the program restarts.
+'''
+def enqueue_failed(job, current_time, log_start_time_utc, log_end_time_utc, reason, attempts=0):
+    backoff = get_retry_backoff(attempts)
+    item = {'folder_time': current_time, 'log_start_time_utc': log_start_time_utc, 'log_end_time_utc': log_end_time_utc, 'log_type': job['log_type'], 'reason': reason, 'attempts': attempts, 'next_attempt_utc': datetime.utcnow() + timedelta(seconds=backoff)}
+    #the task only applies to some of the log destinations (see get_dest_job())
+    if job.get('dest_names'):
+        item['dest_names'] = job['dest_names']
+    with queue_lock:
+        item_id = job['queue'].put(item)
+        with thread_lock:
+            heapq.heappush(job['due_heap'], (item['next_attempt_utc'], item_id, item))
+    settle_window(job, log_start_time_utc, get_window_end(job, log_end_time_utc))
+
+'''
+This method puts the original log ranges of a coalesced logpull task back into the queue separately, after the coalesced logpull task failed.
+The number of failed attempts of each log range is increased by one.
+'''
+def enqueue_failed_windows(job, windows, reason):
+    for w in windows:
+        enqueue_failed(job, w.get('folder_time'), w.get('log_start_time_utc'), w.get('log_end_time_utc'), reason, w.get('attempts', 0) + 1)
+
+'''
+This method checks whether the logs of coalesced log ranges can be written back to the logfile of each original log range.
+This is only done for Cloudflare Access and Audit logs, which are selected by the timestamp of the records (TIMESTAMP_FIELDS). HTTP logs are selected by the time Cloudflare received them, which is not in the records, so they are always written to one combined logfile covering all the coalesced log ranges.
+'''
+def is_coalesce_split(job):
+    return coalesce_output == "split" and job['log_type'] != "http"
+
+'''
+This method groups the tasks in the queue of a job (sorted by log_start_time_utc) whose log ranges are adjacent or overlapping, so that each group can be pulled from Cloudflare API with one request.
+Each group covers at most 1 hour (the limit of Cloudflare Logpull API) and coalesce_max_windows log ranges.
+If the logs will be written to one combined logfile, a group will not cross the date and hour folder of its first log range.
+'''
+def coalesce_queue_items(job, items):
+    groups = []
+    for i in items:
+        data = i['data']
+        if groups:
+            group = groups[-1]
+            first = group[0]['data']
+            group_end_time = max(g['data'].get('log_end_time_utc') for g in group)
+            #Cloudflare Access and Audit log ranges are 1 second apart, see the main loop
+            adjacent = data.get('log_start_time_utc') <= group_end_time + (timedelta(seconds=0) if job['log_type'] == "http" else timedelta(seconds=1))
+            within_limit = max(data.get('log_end_time_utc'), group_end_time) - first.get('log_start_time_utc') <= timedelta(seconds=3600) and len(group) < coalesce_max_windows
+            same_folder = is_coalesce_split(job) is True or one_time is True or (first.get('folder_time').date() == data.get('folder_time').date() and first.get('folder_time').hour == data.get('folder_time').hour)
+            if data.get('log_type') == first.get('log_type') and data.get('dest_names') == first.get('dest_names') and adjacent and within_limit and same_folder:
+                group.append(i)
+                continue
+        groups.append([i])
+    return groups
+
+'''
+This method returns the total number of tasks in the queues of all the jobs.
+'''
+def get_queue_size():
+    return sum(job['queue'].size for job in jobs)
+
+'''
+This method returns the estimated number of seconds to clear all the tasks in the queue, based on how fast the tasks have been retried recently.
+None will be returned if it's not known yet.
+'''
+def get_queue_eta():
+    if queue_drain_rate <= 0:
+        return None
+    return get_queue_size() / queue_drain_rate
+
+'''
+This method returns a copy of the job which only writes to some of the log destinations (dest_names), e.g. to fill a gap found in one log destination only (see fill_gaps()),
+so that the other log destinations will not get a logfile overlapping with their own logfiles. Failed tasks of the copy keep dest_names in the queue (see enqueue_failed()).
+If dest_names is not given, the job itself is returned.
+'''
+def get_dest_job(job, dest_names):
+    if not dest_names:
+        return job
+    return dict(job, log_dest=[d for d in job['log_dest'] if d.get('name') in dest_names], dest_names=list(dest_names))
+
+'''
+This method retries one task from the queue, and it will be run by the workers of queue_thread().
+'''
+def retry_queue_item(job, item):
+    logger.info(str(datetime.now()) + " --- " + job['label'] + "Retrying log range " + item.get('log_start_time_utc').isoformat() + "Z to " + item.get('log_end_time_utc').isoformat() + "Z from queue due to " + item.get('reason') + " (attempt " + str(item.get('attempts', 0) + 1) + ")... (currently " + str(job['queue'].size) + " item(s) left in the queue)")
+    null, status = logs_thread(get_dest_job(job, item.get('dest_names')), item.get('folder_time'), item.get('log_start_time_utc'), item.get('log_end_time_utc'), retry=True, attempts=item.get('attempts', 0))
+    return status
+
+'''
+This method retries a group of tasks from the queue with one request to Cloudflare API, and it will be run by the workers of queue_thread().
+'''
+def retry_queue_group(job, items):
+    log_start_time_utc = min(i.get('log_start_time_utc') for i in items)
+    log_end_time_utc = max(i.get('log_end_time_utc') for i in items)
+    logger.info(str(datetime.now()) + " --- " + job['label'] + "Retrying log range " + log_start_time_utc.isoformat() + "Z to " + log_end_time_utc.isoformat() + "Z from queue, coalesced from " + str(len(items)) + " log ranges... (currently " + str(job['queue'].size) + " item(s) left in the queue)")
+    null, status = logs_thread(get_dest_job(job, items[0].get('dest_names')), items[0].get('folder_time'), log_start_time_utc, log_end_time_utc, retry=True, attempts=max(i.get('attempts', 0) for i in items), windows=items)
+    return status
+
+'''
+This method will be run as a separate thread
+Its main responsibility is to pick up new tasks from the queues of all the jobs and perform the logpull tasks again.
+Up to queue_concurrency tasks are retried at the same time. Only the tasks which are due (see enqueue_failed()) will be picked up, either the oldest log range first or the newest log range first (queue_order).
+The due tasks are found from the heap of each job (see get_due_heap()), and only those are read from the queue. The tasks stay inside the queue until they are picked up, so they will not be lost if the program stops.
+The tasks put into the queues by another process are added to the heaps every QUEUE_RESCAN_INTERVAL seconds (see merge_due_heap()).
+'''
+def queue_thread():
+    global num_of_running_thread, is_exit, event, queue_drain_rate
+
+    #ensure that this process is also counted as one running thread, useful to perform task cleanup while stopping the process
+    with thread_lock:
+        num_of_running_thread += 1
+
+    #the tasks being retried, and when the drain rate was last updated
+    in_flight = {}
+    last_completed_time = time.time()
+    last_eta_log_time = 0
+    last_rescan_time = time.time()
+
+    #wait for 5 seconds before starting the process below, doesn't make sense to check the queue immediately after running the tool
+    event.wait(5)
 
-    #check if the python list is empty. Empty list means the particular logpull operation can be skipped because the log file already exists in all destinations.
-    if not log_dest_per_thread_final:
-        logger.warning(str(datetime.now()) + " --- Log range " + log_start_time_rfc3339 + " to " + log_end_time_rfc3339 + ": Logfile exists in all paths. Skipping.")
-        return check_if_exited(), True
+    executor = ThreadPoolExecutor(max_workers=queue_concurrency)
 
-    if log_type == "http":
+    #keep below process in a loop until it's terminated by the user
+    while True:
+        try:
+            #check if the user wants to stop the logpull process, if yes then wait for the tasks being retried to finish
+            if is_exit is True:
+                executor.shutdown(wait=True)
+                return check_if_exited(logpull_task=False)
+
+            #pick up the tasks put into the queues by another process, while the program is running
+            if time.time() - last_rescan_time >= QUEUE_RESCAN_INTERVAL:
+                for job in jobs:
+                    merged = merge_due_heap(job)
+                    if merged > 0:
+                        logger.info(str(datetime.now()) + " --- " + job['label'] + str(merged) + " item(s) added to the queue by another process will be retried.")
+                last_rescan_time = time.time()
+
+            wait_seconds = 5
+            if len(in_flight) < queue_concurrency and get_queue_size() > 0:
+                #look for the tasks which are due in the heap of each job, without taking them out of the queue yet
+                now = datetime.utcnow()
+                due_groups = []
+                not_due = []
+                due_entries = {}
+                for job in jobs:
+                    with thread_lock:
+                        entries = []
+                        while job['due_heap'] and job['due_heap'][0][0] <= now:
+                            entries.append(heapq.heappop(job['due_heap']))
+                        if job['due_heap']:
+                            not_due.append(job['due_heap'][0][0])
+                    if not entries:
+                        continue
+                    due_entries[job['name']] = entries
+                    due_items = [{'id': e[1], 'data': e[2]} for e in entries]
+
+                    if queue_coalesce is True:
+                        #coalesce the tasks whose log ranges are adjacent or overlapping. Tasks of different jobs are never coalesced.
+                        due_groups.extend((job, g) for g in coalesce_queue_items(job, sorted(due_items, key=sort_json_by_log_start_time_utc)))
+                    else:
+                        due_groups.extend((job, [i]) for i in due_items)
+
+                #retry either the oldest log range first or the newest log range first, regardless of which job it belongs to
+                due_groups.sort(key=lambda g: g[1][0]['data']['log_start_time_utc'], reverse=(queue_order == "newest"))
+
+                for job, group in due_groups[:queue_concurrency - len(in_flight)]:
+                    #take the tasks out of the queue only when they are about to be retried. Tasks which are no longer in the queue (e.g. cleared by the user) are skipped.
+                    group_items = []
+                    for i in group:
+                        try:
+                            group_items.append(job['queue'].get(block=False, id=i['id']))
+                        except persistqueue.Empty:
+                            pass
+                    group_ids = set(i['id'] for i in group)
+                    due_entries[job['name']] = [e for e in due_entries[job['name']] if e[1] not in group_ids]
+                    if len(group_items) == 1:
+                        in_flight[executor.submit(retry_queue_item, job, group_items[0])] = group_items
+                    elif len(group_items) > 1:
+                        in_flight[executor.submit(retry_queue_group, job, group_items)] = group_items
+
+                #the due tasks which are not retried yet go back to the heap, to be picked up when there are free workers
+                for job in jobs:
+                    with thread_lock:
+                        for e in due_entries.get(job['name'], []):
+                            heapq.heappush(job['due_heap'], e)
+
+                #if nothing is due yet, sleep until the earliest task is due
+                if not due_groups and not_due:
+                    wait_seconds = min(5, max((min(not_due) - now).total_seconds(), 0.1))
+
+            if in_flight:
+                #wait for any of the tasks being retried to finish
+                done, null = futures_wait(list(in_flight), timeout=min(wait_seconds, 1), return_when=FIRST_COMPLETED)
+                for future in done:
+                    in_flight.pop(future)
+                    #update the drain rate (tasks per second), smoothed across the recent tasks
+                    now_time = time.time()
+                    rate = 1 / max(now_time - last_completed_time, 0.001)
+                    queue_drain_rate = rate if queue_drain_rate <= 0 else queue_drain_rate * 0.9 + rate * 0.1
+                    last_completed_time = now_time
+            else:
+                event.wait(wait_seconds)
+                last_completed_time = time.time()
+
+            #display the estimated time to clear the queue every minute, if there's anything left inside the queue
+            eta = get_queue_eta()
+            if eta is not None and get_queue_size() > 0 and time.time() - last_eta_log_time >= 60:
+                logger.info(str(datetime.now()) + " --- " + str(get_queue_size()) + " item(s) left in the queue, retrying " + str(round(queue_drain_rate, 2)) + " item(s) per second. Estimated time to clear the queue: " + str(timedelta(seconds=int(eta))) + ".")
+                last_eta_log_time = time.time()
+        except Exception as e:
+            logger.critical(str(datetime.now()) + " --- Queue thread failed unexpectedly. Exception message: " + str(e))
+            event.wait(5)
+            continue
+
+'''
+This method prepares the destinations of the logs of a logpull task, excluding the destinations where the logfile already exists.
+If the log ranges are coalesced and the logs will be written back to the logfile of each original log range, the destinations of each original log range are returned as well (see write_logs_split()).
+The time spent is recorded as stats['prepare'] (see new_window_stats()).
+'''
+def get_logpull_dest(job, stats, current_time, log_start_time_utc, log_end_time_utc, windows=None):
+    started = time.monotonic()
+    log_dest_per_thread_final = []
+    window_log_dest_list = []
+
+    if windows and is_coalesce_split(job) is True:
+        #the logs will be written back to the logfile of each original log range instead
+        for w in windows:
+            window_log_dest = get_log_dest_per_window(job, w.get('folder_time'), w.get('log_start_time_utc').isoformat() + 'Z', w.get('log_end_time_utc').isoformat() + 'Z')
+            if window_log_dest:
+                window_log_dest_list.append((w.get('log_start_time_utc'), w.get('log_end_time_utc'), window_log_dest))
+                log_dest_per_thread_final.extend(window_log_dest)
+    else:
+        log_dest_per_thread_final = get_log_dest_per_window(job, current_time, log_start_time_utc.isoformat() + 'Z', log_end_time_utc.isoformat() + 'Z')
+
+    stats['prepare'] = time.monotonic() - started
+    return log_dest_per_thread_final, window_log_dest_list
+
+'''
+This method prepares the URL and headers of the request to Cloudflare API, to pull the logs of a log range.
+For Cloudflare Access and Audit logs, the page number is not included in the URL.
+'''
+def get_logpull_request(job, log_start_time_rfc3339, log_end_time_rfc3339):
+    if job['log_type'] == "http":
         #specify the URL for the Cloudflare API endpoint, with parameters such as Zone ID, the start time and end time of the logs to pull, timestamp format, sample rate and the fields to be included in the logs
-        url = "https://api.cloudflare.com/client/v4/zones/" + zone_id + "/logs/received?start=" + log_start_time_rfc3339 + "&end=" + log_end_time_rfc3339 + "&timestamps="+ timestamp_format +"&sample=" + sample_rate + "&fields=" + final_fields
+        url = api_url + "/zones/" + job['zone_id'] + "/logs/received?start=" + log_start_time_rfc3339 + "&end=" + log_end_time_rfc3339 + "&timestamps="+ timestamp_format +"&sample=" + job['sample_rate'] + "&fields=" + job['final_fields']
 
         #specify headers for the content type and API token. Only accept gzip as response.
-        headers = {"Authorization": "Bearer " + api_token, "Content-Type": "application/json", "Accept-Encoding": "gzip", 'User-Agent': 'cf-logs-downloader (https://github.com/erictung1999/cf-logs-downloader)'}
+        headers = {"Authorization": "Bearer " + job['api_token'], "Content-Type": "application/json", "Accept-Encoding": "gzip", 'User-Agent': 'cf-logs-downloader (https://github.com/erictung1999/cf-logs-downloader)'}
         
-        logger.info(str(datetime.now()) + " --- Log range " + log_start_time_rfc3339 + " to " + log_end_time_rfc3339 + ": Requesting HTTP logs from Cloudflare...")
-    elif log_type == 'access':
+        logger.info(str(datetime.now()) + " --- " + job['label'] + "Log range " + log_start_time_rfc3339 + " to " + log_end_time_rfc3339 + ": Requesting HTTP logs from Cloudflare...")
+    elif job['log_type'] == 'access':
         #specify the URL for the Cloudflare API endpoint, with parameters such as Account ID and the start time and end time of the logs to pull
-        url = "https://api.cloudflare.com/client/v4/accounts/" + account_id + "/access/logs/access_requests?since=" + log_start_time_rfc3339 + "&until=" + log_end_time_rfc3339 + "&limit=1000"
+        url = api_url + "/accounts/" + job['account_id'] + "/access/logs/access_requests?since=" + log_start_time_rfc3339 + "&until=" + log_end_time_rfc3339 + "&direction=asc&per_page=" + str(page_size)
 
         #specify headers for the content type and API token. 
-        headers = {"Authorization": "Bearer " + api_token, "Content-Type": "application/json", 'User-Agent': 'cf-logs-downloader (https://github.com/erictung1999/cf-logs-downloader)'}
+        headers = {"Authorization": "Bearer " + job['api_token'], "Content-Type": "application/json", 'User-Agent': 'cf-logs-downloader (https://github.com/erictung1999/cf-logs-downloader)'}
         
-        logger.info(str(datetime.now()) + " --- Log range " + log_start_time_rfc3339 + " to " + log_end_time_rfc3339 + ": Requesting Cloudflare Access logs from Cloudflare...")
-    elif log_type == 'audit':
+        logger.info(str(datetime.now()) + " --- " + job['label'] + "Log range " + log_start_time_rfc3339 + " to " + log_end_time_rfc3339 + ": Requesting Cloudflare Access logs from Cloudflare...")
+    elif job['log_type'] == 'audit':
         #specify the URL for the Cloudflare API endpoint, with parameters such as Account ID and the start time and end time of the logs to pull
-        if hide_user_logs is True:
-            url = "https://api.cloudflare.com/client/v4/accounts/" + account_id + "/audit_logs?since=" + log_start_time_rfc3339 + "&before=" + log_end_time_rfc3339 + "&limit=1000&hide_user_logs=true"
+        if job['hide_user_logs'] is True:
+            url = api_url + "/accounts/" + job['account_id'] + "/audit_logs?since=" + log_start_time_rfc3339 + "&before=" + log_end_time_rfc3339 + "&direction=asc&per_page=" + str(page_size) + "&hide_user_logs=true"
         else:
-            url = "https://api.cloudflare.com/client/v4/accounts/" + account_id + "/audit_logs?since=" + log_start_time_rfc3339 + "&before=" + log_end_time_rfc3339 + "&limit=1000&hide_user_logs=false"
+            url = api_url + "/accounts/" + job['account_id'] + "/audit_logs?since=" + log_start_time_rfc3339 + "&before=" + log_end_time_rfc3339 + "&direction=asc&per_page=" + str(page_size) + "&hide_user_logs=false"
         
         #specify headers for the content type and API token. 
-        headers = {"Authorization": "Bearer " + api_token, "Content-Type": "application/json", 'User-Agent': 'cf-logs-downloader (https://github.com/erictung1999/cf-logs-downloader)'}
+        headers = {"Authorization": "Bearer " + job['api_token'], "Content-Type": "application/json", 'User-Agent': 'cf-logs-downloader (https://github.com/erictung1999/cf-logs-downloader)'}
         
-        logger.info(str(datetime.now()) + " --- Log range " + log_start_time_rfc3339 + " to " + log_end_time_rfc3339 + ": Requesting Cloudflare Audit logs from Cloudflare...")
+        logger.info(str(datetime.now()) + " --- " + job['label'] + "Log range " + log_start_time_rfc3339 + " to " + log_end_time_rfc3339 + ": Requesting Cloudflare Audit logs from Cloudflare...")
+
+    return url, headers
+
+'''
+This method checks the error returned by Cloudflare API (any HTTP response code other than 200) and writes it to the activity log.
+It returns the error code and message given by Cloudflare (if any), and whether the failed task should not be added to the queue because retrying will never succeed
+(for example, requesting bot management fields from a zone which does not have bot management enabled).
+'''
+def get_logpull_error(job, log_start_time_rfc3339, log_end_time_rfc3339, status_code, text):
+    cf_status_code = 0
+    cf_err_msg = ""
+    skip_add_queue = False
+
+    logger.debug(str(datetime.now()) + " --- Output from Cloudflare API:\n" + text) #the raw response will be logged only if the user enables debugging
+    try:
+        #load the JSON object to better access the content of it
+        response = json.loads(text)
+    except:
+        #something weird happened if the response is not a JSON object, thus print out the error dump
+        logger.error(str(datetime.now()) + " --- " + job['label'] + "Log range " + log_start_time_rfc3339 + " to " + log_end_time_rfc3339 + ": Unknown error occured while pulling logs with error code " + str(status_code) + ". Error dump: " + text + ". ")
+        return cf_status_code, cf_err_msg, skip_add_queue
+
+    #to check whether "success" key exists in JSON object, if yes, check whether the value is False, and print out the error message
+    if "success" in response and response["success"] is False:
+        bot_management_error = response["errors"][0]["code"] == 1010 and ('BotScore' in job['fields'] or 'BotScoreSrc' in job['fields'])
+        logger.error(str(datetime.now()) + " --- " + job['label'] + "Log range " + log_start_time_rfc3339 + " to " + log_end_time_rfc3339 + ": Failed to request logs from Cloudflare with error code " + str(response["errors"][0]["code"]) + ": " + response["errors"][0]["message"] + ". " + ("Consider removing BotScore and BotScoreSrc fields if your zone does not have Bot Management enabled." if bot_management_error else ""))
+        cf_status_code = response["errors"][0]["code"]
+        cf_err_msg = response["errors"][0]["message"]
+        skip_add_queue = bot_management_error
+    else:
+        #something weird happened if it is not False. If the request has been successfully done, it should not return this kind of error, instead the raw logs should be returned with HTTP response code 200.
+        #other type of error may occur as well, which may not return a JSON object with "success" key.
+        logger.error(str(datetime.now()) + " --- " + job['label'] + "Log range " + log_start_time_rfc3339 + " to " + log_end_time_rfc3339 + ": Unknown error occured while pulling logs with error code " + str(status_code) + ". Error dump: " + text + ". ")
+
+    return cf_status_code, cf_err_msg, skip_add_queue
+
+'''
+This method handles a logpull task which failed, either while requesting the logs or while writing the logs.
+The failed task will be added to the queue of the job (unless skip_add_queue is True or the user instructs the program to do logpull for only one time), otherwise the failure will be written to fail.log.
+'''
+def handle_logpull_failure(job, stats, current_time, log_start_time_utc, log_end_time_utc, attempts, windows, reason, skip_add_queue=False):
+    record_window(job, stats, "failed", reason)
+    if one_time is True:
+        return
+    if skip_add_queue is True:
+        fail_logger.error(job['label'] + "Log range " + log_start_time_utc.isoformat() + "Z to " + log_end_time_utc.isoformat() + "Z [" + job['log_type'] + "] (" + reason + ")")
+        settle_window(job, log_start_time_utc, get_window_end(job, log_end_time_utc))
+    elif windows:
+        #coalesced log ranges are added back separately, so they can be coalesced again later.
+        enqueue_failed_windows(job, windows, reason)
+    elif adaptive_window is True and (log_end_time_utc - log_start_time_utc).total_seconds() + (0 if job['log_type'] == "http" else 1) > job['window']:
+        #the window is longer than the current window length (e.g. it has been shrunk because of this window), so it is split into windows of the current window length,
+        #and each of them is retried on its own
+        for w in split_aligned_windows(job, current_time, log_start_time_utc, get_window_end(job, log_end_time_utc), job['window'])[0]:
+            enqueue_failed(job, w[0], w[1], w[2], reason, attempts + 1)
+    else:
+        enqueue_failed(job, current_time, log_start_time_utc, log_end_time_utc, reason, attempts + 1)
+
+'''
+This method handles a logpull task which has been written to all the log destinations successfully, by writing the result to the activity log and succ.log.
+'''
+def handle_logpull_success(job, stats, log_start_time_rfc3339, log_end_time_rfc3339, log_dest_per_thread_final, windows=None):
+    add_to_manifest(job, stats.get('logfiles'))
+    record_window(job, stats, "pulled", log_end_time_utc=parse_log_timestamp(log_end_time_rfc3339))
+    #count the bytes written to each log destination, as recorded while writing the logfiles, so the logfiles do not have to be checked in local storage again
+    for name, written in stats.get('bytes_written', {}).items():
+        metrics.inc("cf_logs_downloader_bytes_written_total", dict(get_metrics_labels(job), dest=name), written)
+    for each_log_dest in log_dest_per_thread_final:
+        #successful of write logs
+        logger.info(str(datetime.now()) + " --- " + job['label'] + "Log range " + log_start_time_rfc3339 + " to " + log_end_time_rfc3339 + ": Logs " + get_codec_description(each_log_dest) + " (" + each_log_dest.get('name') + ") " + ("sent to " if each_log_dest.get('stream') else "saved as ") + str(each_log_dest.get('path')) + ". ")
+
+    #only write success log if the operation is not one-time
+    if one_time is False:
+        succ_logger.info(job['label'] + "Log range " + log_start_time_rfc3339 + " to " + log_end_time_rfc3339 + " [" + job['log_type'] + "] (" + ", ".join(sorted(set(d.get('name') for d in log_dest_per_thread_final))) + ")" + (" (coalesced from " + str(len(windows)) + " log ranges)" if windows else ""))
+
+'''
+This method returns the reason of a failed write, which is recorded in the queue together with the failed task.
+failed_dest_name is None if the download failed (see write_logs_stream()).
+'''
+def get_write_failure_reason(job, log_start_time_rfc3339, log_end_time_rfc3339, e, failed_dest_name):
+    if failed_dest_name is None:
+        #the connection was interrupted (or one of the pages failed) while downloading the logs, nothing has been written to the local storage
+        logger.error(str(datetime.now()) + " --- " + job['label'] + "Log range " + log_start_time_rfc3339 + " to " + log_end_time_rfc3339 + ": Failed to download logs from Cloudflare: " + str(e))
+        return 'Logpull error (' + str(e) + ')'
+    #unsuccessful of write logs
+    logger.error(str(datetime.now()) + " --- " + job['label'] + "Log range " + log_start_time_rfc3339 + " to " + log_end_time_rfc3339 + ": Failed to save logs to log destination (" + failed_dest_name + "): " + str(e))
+    return 'Write log error (' + failed_dest_name + ')'
+
+'''
+This method will handle the overall log processing tasks and it will run as a separate thread.
+Based on the interval setting configured by the user, this method will only handle logs for a specific time slot.
+'''
+def logs_thread(job, current_time, log_start_time_utc, log_end_time_utc, retry=False, attempts=0, windows=None):
+    
+    global num_of_running_thread, logger, retry_attempt, one_time
+
+    log_type = job['log_type']
+    
+    #add one to the variable to indicate number of running threads. useful to determine whether to exit the program gracefully
+    with thread_lock:
+        num_of_running_thread += 1
+    metrics.inc("cf_logs_downloader_logpull_in_flight", {}, 1)
+
+    #specify the number of attempts to retry in the event of error
+    #Note! Setting 0 prevents retrying logpull tasks as defined in below code. The process will be replaced by queue_thread() instead.
+    retry_attempt = 0
+    
+    #a variable to check whether the request to Cloudflare API is successful.
+    request_success = False
+
+    #a variable to check whether we should skip adding failed items to the queue (based on situation)
+    skip_add_queue = False
+
+    status_code = 0
+    cf_status_code = 0
+    cf_err_msg = ""
+    #the exception of the request if it could not be performed (e.g. connection error), reported instead of the status code
+    request_error = None
+    
+    #get the log start time and log end time in RFC3339 format, so Cloudflare API will understand it and pull the appropriate logs for us
+    log_start_time_rfc3339 = log_start_time_utc.isoformat() + 'Z'
+    log_end_time_rfc3339 = log_end_time_utc.isoformat() + 'Z'
+
+    #the timings and statistics of this window, written to windows.log once the window is done
+    stats = new_window_stats(log_start_time_utc, log_end_time_utc, retry, attempts, windows)
+
+    #prepare the destinations of the logs, excluding the destinations where the logfile already exists.
+    #window_log_dest_list is the list of destinations of each original log range, if the log ranges are coalesced.
+    log_dest_per_thread_final, window_log_dest_list = get_logpull_dest(job, stats, current_time, log_start_time_utc, log_end_time_utc, windows)
+
+    #check if the python list is empty. Empty list means the particular logpull operation can be skipped because the log file already exists in all destinations.
+    if not log_dest_per_thread_final:
+        logger.warning(str(datetime.now()) + " --- " + job['label'] + "Log range " + log_start_time_rfc3339 + " to " + log_end_time_rfc3339 + ": Logfile exists in all paths. Skipping.")
+        record_window(job, stats, "skipped")
+        return check_if_exited(), True
+
+    url, headers = get_logpull_request(job, log_start_time_rfc3339, log_end_time_rfc3339)
+    stats['requested'] = time.monotonic()
 
     for i in range(retry_attempt+1):
         #make a GET request to the Cloudflare API
         try:
-            r = requests.get(url, headers=headers, stream=True if log_type == "http" else False)
+            r = http_get(url if log_type == "http" else url + "&page=1", headers=headers, stream=True if log_type == "http" else False, priority=PRIORITY_RETRY if retry is True else PRIORITY_SCHEDULED, timing=stats)
             r.encoding = 'utf-8'
         except Exception as e:
-            logger.critical(str(datetime.now()) + " --- Log range " + log_start_time_rfc3339 + " to " + log_end_time_rfc3339 + ": Unable to perform API request to Cloudflare: " + str(e) + ". " + (("Retrying " + str(i+1) + " of " + str(retry_attempt) + "...") if i < (retry_attempt) else ""))
+            logger.critical(str(datetime.now()) + " --- " + job['label'] + "Log range " + log_start_time_rfc3339 + " to " + log_end_time_rfc3339 + ": Unable to perform API request to Cloudflare: " + str(e) + ". " + (("Retrying " + str(i+1) + " of " + str(retry_attempt) + "...") if i < (retry_attempt) else ""))
+            request_error = e
             time.sleep(3)
             continue
+        request_error = None
         
         #check whether the HTTP response code is 200, if yes then logpull success and exit the loop
         status_code = r.status_code
@@ -874,162 +4472,574 @@ def logs_thread(current_time, log_start_time_utc, log_end_time_utc):
             break
         else:
             #if HTTP response code is not 200, means something happened
-            logger.debug(str(datetime.now()) + " --- Output from Cloudflare API:\n" + r.text) #the raw response will be logged only if the user enables debugging
-            try:
-                #load the JSON object to better access the content of it
-                response = json.loads(r.text)
-            except:
-                #something weird happened if the response is not a JSON object, thus print out the error dump
-                logger.error(str(datetime.now()) + " --- Log range " + log_start_time_rfc3339 + " to " + log_end_time_rfc3339 + ": Unknown error occured while pulling logs with error code " + str(r.status_code) + ". Error dump: " + r.text + ". " + (("Retrying " + str(i+1) + " of " + str(retry_attempt) + "...") if i < (retry_attempt) else ""))
-                time.sleep(3)
-                continue
-
-            #to check whether "success" key exists in JSON object, if yes, check whether the value is False, and print out the error message
-            if "success" in response:
-                if response["success"] is False:
-                    logger.error(str(datetime.now()) + " --- Log range " + log_start_time_rfc3339 + " to " + log_end_time_rfc3339 + ": Failed to request logs from Cloudflare with error code " + str(response["errors"][0]["code"]) + ": " + response["errors"][0]["message"] + ". " + ("Consider removing BotScore and BotScoreSrc fields if your zone does not have Bot Management enabled." if response["errors"][0]["code"] == 1010 and ('BotScore' in fields or 'BotScoreSrc' in fields) else ("Retrying " + str(i+1) + " of " + str(retry_attempt) + "...") if i < (retry_attempt) else ""))
-                    cf_status_code = response["errors"][0]["code"]
-                    cf_err_msg = response["errors"][0]["message"]
-                    if response["errors"][0]["code"] == 1010 and ('BotScore' in fields or 'BotScoreSrc' in fields):
-                        skip_add_queue = True
-                        break
-                    time.sleep(3)
-                    continue
-                else:
-                    #something weird happened if it is not False. If the request has been successfully done, it should not return this kind of error, instead the raw logs should be returned with HTTP response code 200.
-                    logger.error(str(datetime.now()) + " --- Log range " + log_start_time_rfc3339 + " to " + log_end_time_rfc3339 + ": Unknown error occured while pulling logs with error code " + str(r.status_code) + ". Error dump: " + r.text + ". " + (("Retrying " + str(i+1) + " of " + str(retry_attempt) + "...") if i < (retry_attempt) else ""))
-                    time.sleep(3)
-                    continue
-            else:
-                #other type of error may occur, which may not return a JSON object.
-                logger.error(str(datetime.now()) + " --- Log range " + log_start_time_rfc3339 + " to " + log_end_time_rfc3339 + ": Unknown error occured while pulling logs with error code " + str(r.status_code) + ". Error dump: " + r.text + ". " + (("Retrying " + str(i+1) + " of " + str(retry_attempt) + "...") if i < (retry_attempt) else ""))
-                time.sleep(3)
-                continue
+            cf_status_code, cf_err_msg, skip_add_queue = get_logpull_error(job, log_start_time_rfc3339, log_end_time_rfc3339, r.status_code, r.text)
+            if skip_add_queue is True:
+                break
+            time.sleep(3)
+            continue
             
     #check whether the logpull process from Cloudflare API has been successfully completed, if yes then proceed with next steps
-    if request_success is False and one_time is False:
-        #check if there's a need to add failed tasks to queue, if no, just add it to the log
-        if skip_add_queue is True:
-            fail_logger.error("Log range " + log_start_time_rfc3339 + " to " + log_end_time_rfc3339 + " [" + log_type + "] (Logpull error - HTTP " + str(status_code) + (", Cloudflare " + str(cf_status_code) + " - " + cf_err_msg if cf_status_code != 0 else "") + ")")
-        else:
-            queue.put({'folder_time': current_time, 'log_start_time_utc': log_start_time_utc, 'log_end_time_utc': log_end_time_utc, 'log_type': log_type, 'reason': 'Logpull error (HTTP ' + str(status_code) + (", Cloudflare " + str(cf_status_code) + " - " + cf_err_msg if cf_status_code != 0 else "") + ')'})
+    if request_success is False:
+        #add failed tasks to queue, or just add it to the log if there's no need to retry
+        handle_logpull_failure(job, stats, current_time, log_start_time_utc, log_end_time_utc, attempts, windows, 'Logpull error (' + str(request_error) + ')' if request_error is not None else 'Logpull error (HTTP ' + str(status_code) + (", Cloudflare " + str(cf_status_code) + " - " + cf_err_msg if cf_status_code != 0 else "") + ')', skip_add_queue)
         return check_if_exited(), False
 
-    i = 0
-
     if log_type == "http":
-        #get the raw response (gzipped content) and save it into a variable.
-        gzip_resp = r.raw.read()
-    elif log_type == 'access':
-        json_resp = r.json()
-        if (len(json_resp["result"]) <= 0):
-            logger.warning(str(datetime.now()) + " --- Log range " + log_start_time_rfc3339 + " to " + log_end_time_rfc3339 + ": No Access logs during this time range. Will not write file to local storage. Skipping...")
-            succ_logger.info("Log range " + log_start_time_rfc3339 + " to " + log_end_time_rfc3339 + " [" + log_type + "] (No Access logs to write)")
-            return check_if_exited(), True
-        json_string_resp = [json.dumps(record) for record in json_resp["result"]]
-    elif log_type == 'audit':
+        #do not read the whole raw response (gzipped content) into memory. Instead, stream it chunk by chunk into every log destination.
+        chunks = iter_counted_chunks(job, r.raw.stream(chunk_size, decode_content=False), stats)
+        compressed = True
+    elif log_type == 'access' or log_type == 'audit':
         json_resp = r.json()
         if (len(json_resp["result"]) <= 0):
-            logger.warning(str(datetime.now()) + " --- Log range " + log_start_time_rfc3339 + " to " + log_end_time_rfc3339 + ": No Audit logs during this time range. Will not write file to local storage. Skipping...")
-            succ_logger.info("Log range " + log_start_time_rfc3339 + " to " + log_end_time_rfc3339 + " [" + log_type + "] (No Audit logs to write)")
+            logger.warning(str(datetime.now()) + " --- " + job['label'] + "Log range " + log_start_time_rfc3339 + " to " + log_end_time_rfc3339 + ": No " + ("Access" if log_type == 'access' else "Audit") + " logs during this time range. Will not write file to local storage. Skipping...")
+            succ_logger.info(job['label'] + "Log range " + log_start_time_rfc3339 + " to " + log_end_time_rfc3339 + " [" + log_type + "] (No " + ("Access" if log_type == 'access' else "Audit") + " logs to write)")
+            add_to_manifest(job, [dict(d, path=None, bytes=0, records=0) for d in log_dest_per_thread_final])
+            record_window(job, stats, "pulled", log_end_time_utc=log_end_time_utc)
             return check_if_exited(), True
-        json_string_resp = [json.dumps(record) for record in json_resp["result"]]
-    
+        #the first page has been received. The rest of the pages (if any) will be requested while the logs are being written, and each record will be written as one line of JSON.
+        chunks = iter_counted_chunks(job, iter_ndjson_pages(url, headers, json_resp, PRIORITY_RETRY if retry is True else PRIORITY_SCHEDULED), stats)
+        compressed = False
+
     #Proceed to save the logs
-    logger.info(str(datetime.now()) + " --- Log range " + log_start_time_rfc3339 + " to " + log_end_time_rfc3339 + ": Logs requested. Saving logs...")
+    logger.info(str(datetime.now()) + " --- " + job['label'] + "Log range " + log_start_time_rfc3339 + " to " + log_end_time_rfc3339 + ": Logs requested. Streaming logs to " + str(len(log_dest_per_thread_final)) + " destination(s)...")
 
-    #iterate through list of objects - log destination configuration
-    for each_log_dest in log_dest_per_thread_final:
-        i += 1
-        logger.info(str(datetime.now()) + " --- Log range " + log_start_time_rfc3339 + " to " + log_end_time_rfc3339 + ": Writing logs " + str(i) + " of " + str(len(log_dest_per_thread_final)) + " (" + each_log_dest.get('name') + ") to " + str(each_log_dest.get('path')) + " ...")
+    #write logs to all the destinations as specified by the user, with the option for gzip
+    if window_log_dest_list:
+        result, e, failed_dest_name = write_logs_split(job, window_log_dest_list, chunks, compressed, stats)
+    else:
+        result, e, failed_dest_name = write_logs_stream(log_dest_per_thread_final, chunks, compressed, stats)
+    if result is True:
+        handle_logpull_success(job, stats, log_start_time_rfc3339, log_end_time_rfc3339, log_dest_per_thread_final, windows)
+    else:
+        r.close()
+        handle_logpull_failure(job, stats, current_time, log_start_time_utc, log_end_time_utc, attempts, windows, get_write_failure_reason(job, log_start_time_rfc3339, log_end_time_rfc3339, e, failed_dest_name))
+        return check_if_exited(), False
+
+    #invoke this method to check whether the user triggers program exit sequence
+    return check_if_exited(), True
+
+'''
+This method performs a GET request with the HTTP session of the asyncio engine. All requests made by the asyncio engine should go through this method.
+Same as http_get(), each request will take a token from the rate limiter first, but without blocking the event loop. The response body is not read yet.
+'''
+async def http_get_async(url, headers, priority=PRIORITY_SCHEDULED, timing=None):
+    await rate_limiter.acquire_async(priority)
+    sent_time = time.monotonic()
+    if timing is not None:
+        timing['sent'] = sent_time
+    r = await async_session.get(url, headers=headers)
+    if timing is not None:
+        timing['first_byte'] = time.monotonic()
+    rate_limiter.update(r.status, r.headers)
+    metrics.observe("cf_logs_downloader_time_to_first_byte_seconds", {}, time.monotonic() - sent_time)
+    return r
+
+'''
+This method passes the chunks of the logs received by the asyncio engine through while counting the bytes downloaded in the metrics, same as iter_counted_chunks().
+'''
+async def iter_counted_chunks_async(job, chunks, timing):
+    labels = get_metrics_labels(job)
+    try:
+        async for chunk in chunks:
+            metrics.inc("cf_logs_downloader_bytes_downloaded_total", labels, len(chunk))
+            yield chunk
+        metrics.observe("cf_logs_downloader_request_duration_seconds", labels, time.monotonic() - timing.get('sent', time.monotonic()))
+    finally:
+        #stop requesting the rest of the pages (see iter_log_pages_async()) if the logs are not written until the end
+        await close_async_iterator(chunks)
+
+'''
+This method closes an asynchronous generator which has not been read until the end, so that the requests it has started are cancelled right away instead of when it's garbage collected.
+'''
+async def close_async_iterator(iterator):
+    if hasattr(iterator, "aclose"):
+        await iterator.aclose()
+
+'''
+This method is the asyncio version of fetch_log_page(), used by the asyncio engine to request the rest of the pages of Cloudflare Access or Audit logs.
+'''
+async def fetch_log_page_async(url, headers, priority=PRIORITY_SCHEDULED):
+    r = await http_get_async(url, headers=headers, priority=priority)
+    try:
+        if r.status == 200:
+            return await r.json(content_type=None)
+        text = await r.text(encoding='utf-8', errors='replace')
+    finally:
+        r.release()
+    raise get_log_page_error(r.status, text)
+
+'''
+This method is the asyncio version of iter_log_pages(). The pages are requested by the event loop, up to page_concurrency pages at the same time, and yielded in order.
+'''
+async def iter_log_pages_async(url, headers, first_page, priority=PRIORITY_SCHEDULED):
+    yield first_page["result"]
+
+    result_info = first_page.get("result_info") or {}
+
+    if result_info.get("cursor"):
+        #cursor based pagination, the next page can only be known after the current page is received
+        cursor = result_info.get("cursor")
+        while cursor:
+            page = await fetch_log_page_async(url + "&cursor=" + str(cursor), headers, priority)
+            if len(page["result"]) <= 0:
+                break
+            yield page["result"]
+            cursor = (page.get("result_info") or {}).get("cursor")
+    elif result_info.get("total_count") is not None:
+        #the total number of records is known, thus the total number of pages as well
+        per_page = result_info.get("per_page") or page_size
+        total_pages = -(-int(result_info.get("total_count")) // int(per_page))
+        next_page = 2
+        futures = deque()
+        #keep at most page_concurrency pages in flight, so the memory usage is bounded no matter how many pages are there
+        while next_page <= total_pages and len(futures) < page_concurrency:
+            futures.append(asyncio.ensure_future(fetch_log_page_async(url + "&page=" + str(next_page), headers, priority)))
+            next_page += 1
+        try:
+            while futures:
+                page = await futures.popleft()
+                if next_page <= total_pages:
+                    futures.append(asyncio.ensure_future(fetch_log_page_async(url + "&page=" + str(next_page), headers, priority)))
+                    next_page += 1
+                yield page["result"]
+        finally:
+            #if something goes wrong, do not request the rest of the pages
+            for future in futures:
+                future.cancel()
+    else:
+        #no pagination info, keep requesting the next page until the logs within the time range are exhausted
+        page_number = 1
+        records = first_page["result"]
+        while len(records) >= page_size:
+            page_number += 1
+            records = (await fetch_log_page_async(url + "&page=" + str(page_number), headers, priority))["result"]
+            if len(records) <= 0:
+                break
+            yield records
+
+'''
+This method is the asyncio version of iter_ndjson_pages().
+'''
+async def iter_ndjson_pages_async(url, headers, first_page, priority=PRIORITY_SCHEDULED):
+    pages = iter_log_pages_async(url, headers, first_page, priority)
+    try:
+        async for records in pages:
+            yield b"".join(record_dumps(record) + b"\n" for record in records)
+    finally:
+        await close_async_iterator(pages)
+
+'''
+This method writes the chunks of the logs received by the asyncio engine with a LogWriter, and returns the same values as write_logs_stream().
+The chunks are read by the event loop, and only writing each chunk is handed over to a thread of write_executor, so a thread is not held while the logs are being downloaded.
+'''
+async def write_logs_async(writer, chunks):
+    loop = asyncio.get_running_loop()
+    failure = await loop.run_in_executor(write_executor, writer.open)
+    if failure is not None:
+        return failure
+
+    chunks = chunks.__aiter__()
+    try:
+        while True:
+            #read the next chunk from the response body. Any error here is caused by the download, not by the local storage.
+            started = time.perf_counter()
+            try:
+                chunk = await chunks.__anext__()
+            except StopAsyncIteration:
+                break
+            except Exception as e:
+                return False, e, None
+            finally:
+                writer.stats['download'] = writer.stats.get('download', 0) + time.perf_counter() - started
+
+            failure = await loop.run_in_executor(write_executor, writer.write, chunk)
+            if failure is not None:
+                return failure
+    finally:
+        await close_async_iterator(chunks)
+
+    return await loop.run_in_executor(write_executor, writer.finish)
+
+'''
+This method is the asyncio version of logs_thread(), used by the asyncio engine to handle the logs of a specific time slot.
+It goes through the same steps as logs_thread(): checking whether the logfile already exists, requesting the logs from Cloudflare API, checking the error, writing the logs and adding the task to the queue if it failed.
+While waiting for Cloudflare API, it only costs a coroutine instead of a thread. All the pages of Cloudflare Access and Audit logs are requested by the event loop as well.
+Writing each chunk of the logs (see write_logs_async()) and the work after the logpull (the manifest, windows.log, the checkpoint and the queue) are handed over to the threads of write_executor, as the local storage does not support asyncio.
+'''
+async def logs_task(job, current_time, log_start_time_utc, log_end_time_utc):
+    global num_of_running_thread
+
+    loop = asyncio.get_running_loop()
+    log_type = job['log_type']
+    log_start_time_rfc3339 = log_start_time_utc.isoformat() + 'Z'
+    log_end_time_rfc3339 = log_end_time_utc.isoformat() + 'Z'
+
+    stats = new_window_stats(log_start_time_utc, log_end_time_utc)
+
+    #preparing the destinations creates the folders, so it is done by the executor as well
+    log_dest_per_thread_final, null = await loop.run_in_executor(write_executor, get_logpull_dest, job, stats, current_time, log_start_time_utc, log_end_time_utc)
+    if not log_dest_per_thread_final:
+        logger.warning(str(datetime.now()) + " --- " + job['label'] + "Log range " + log_start_time_rfc3339 + " to " + log_end_time_rfc3339 + ": Logfile exists in all paths. Skipping.")
+        await loop.run_in_executor(write_executor, record_window, job, stats, "skipped")
+        return True
+
+    url, headers = get_logpull_request(job, log_start_time_rfc3339, log_end_time_rfc3339)
+    stats['requested'] = time.monotonic()
+
+    try:
+        r = await http_get_async(url if log_type == "http" else url + "&page=1", headers=headers, timing=stats)
+    except Exception as e:
+        logger.critical(str(datetime.now()) + " --- " + job['label'] + "Log range " + log_start_time_rfc3339 + " to " + log_end_time_rfc3339 + ": Unable to perform API request to Cloudflare: " + str(e) + ". ")
+        await loop.run_in_executor(write_executor, handle_logpull_failure, job, stats, current_time, log_start_time_utc, log_end_time_utc, 0, None, 'Logpull error (' + str(e) + ')')
+        return False
+
+    try:
+        if r.status != 200:
+            cf_status_code, cf_err_msg, skip_add_queue = get_logpull_error(job, log_start_time_rfc3339, log_end_time_rfc3339, r.status, await r.text(encoding='utf-8', errors='replace'))
+            await loop.run_in_executor(write_executor, handle_logpull_failure, job, stats, current_time, log_start_time_utc, log_end_time_utc, 0, None, 'Logpull error (HTTP ' + str(r.status) + (", Cloudflare " + str(cf_status_code) + " - " + cf_err_msg if cf_status_code != 0 else "") + ')', skip_add_queue)
+            return False
 
-        #write logs to the destination as specified by the user, with the option for gzip
         if log_type == "http":
-            result, e = write_logs(each_log_dest.get('path'), gzip_resp, each_log_dest.get('no_gzip'))
-        elif log_type == "access" or log_type == "audit":
-            result, e = write_logs(each_log_dest.get('path'), '\n'.join(json_string_resp) + '\n', each_log_dest.get('no_gzip'))
-        if result is True:
-            #successful of write logs
-            logger.info(str(datetime.now()) + " --- Log range " + log_start_time_rfc3339 + " to " + log_end_time_rfc3339 + ": Logs " + ("without gzip compression" if each_log_dest.get('no_gzip') is True else "compressed with gzip") + " (" + each_log_dest.get('name') + ") saved as " + str(each_log_dest.get('path')) + ". ")
+            #the body is not decompressed by the session, so it is streamed chunk by chunk as gzip into every log destination
+            chunks = iter_counted_chunks_async(job, r.content.iter_chunked(chunk_size), stats)
+            compressed = True
         else:
-            #unsuccessful of write logs
-            logger.error(str(datetime.now()) + " --- Log range " + log_start_time_rfc3339 + " to " + log_end_time_rfc3339 + ": Failed to save logs to local storage (" + each_log_dest.get('name') + "): " + str(e))
-            #add failed tasks to queue
-            if one_time is False:
-                queue.put({'folder_time': current_time, 'log_start_time_utc': log_start_time_utc, 'log_end_time_utc': log_end_time_utc, 'log_type': log_type, 'reason': 'Write log error (' + each_log_dest.get('name') + ')'})
-            return check_if_exited(), False
+            json_resp = await r.json(content_type=None)
+            if (len(json_resp["result"]) <= 0):
+                logger.warning(str(datetime.now()) + " --- " + job['label'] + "Log range " + log_start_time_rfc3339 + " to " + log_end_time_rfc3339 + ": No " + ("Access" if log_type == 'access' else "Audit") + " logs during this time range. Will not write file to local storage. Skipping...")
+                succ_logger.info(job['label'] + "Log range " + log_start_time_rfc3339 + " to " + log_end_time_rfc3339 + " [" + log_type + "] (No " + ("Access" if log_type == 'access' else "Audit") + " logs to write)")
+                await loop.run_in_executor(write_executor, add_to_manifest, job, [dict(d, path=None, bytes=0, records=0) for d in log_dest_per_thread_final])
+                await loop.run_in_executor(write_executor, record_window, job, stats, "pulled", None, log_end_time_utc)
+                return True
+            chunks = iter_counted_chunks_async(job, iter_ndjson_pages_async(url, headers, json_resp), stats)
+            compressed = False
 
-    #only write success log if the operation is not one-time
-    if one_time is False:
-        succ_logger.info("Log range " + log_start_time_rfc3339 + " to " + log_end_time_rfc3339 + " [" + log_type + "] (" + each_log_dest.get('name') + ")")
+        logger.info(str(datetime.now()) + " --- " + job['label'] + "Log range " + log_start_time_rfc3339 + " to " + log_end_time_rfc3339 + ": Logs requested. Streaming logs to " + str(len(log_dest_per_thread_final)) + " destination(s)...")
 
-    #invoke this method to check whether the user triggers program exit sequence
-    return check_if_exited(), True
+        writer = LogWriter(log_dest_per_thread_final, compressed, stats)
+        try:
+            result, e, failed_dest_name = await write_logs_async(writer, chunks)
+        finally:
+            #close the temporary files and they will automatically deleted
+            await loop.run_in_executor(write_executor, writer.close)
+        if result is True:
+            await loop.run_in_executor(write_executor, handle_logpull_success, job, stats, log_start_time_rfc3339, log_end_time_rfc3339, log_dest_per_thread_final)
+            return True
+        await loop.run_in_executor(write_executor, handle_logpull_failure, job, stats, current_time, log_start_time_utc, log_end_time_utc, 0, None, get_write_failure_reason(job, log_start_time_rfc3339, log_end_time_rfc3339, e, failed_dest_name))
+        return False
+    finally:
+        r.release()
+
+'''
+This method runs logs_task() once a slot of async_concurrency is available, and keeps track of the number of logpull tasks in flight.
+If the user initiates program exit before the slot is available, the log range will be put into the queue instead.
+'''
+async def run_logs_task(job, current_time, log_start_time_utc, log_end_time_utc, semaphore):
+    global num_of_running_thread
+
+    async with semaphore:
+        if is_exit is True:
+            await asyncio.get_running_loop().run_in_executor(write_executor, enqueue_failed, job, current_time, log_start_time_utc, log_end_time_utc, 'Program exited before logpull')
+            return False
+        with thread_lock:
+            num_of_running_thread += 1
+        metrics.inc("cf_logs_downloader_logpull_in_flight", {}, 1)
+        try:
+            return await logs_task(job, current_time, log_start_time_utc, log_end_time_utc)
+        except Exception as e:
+            logger.critical(str(datetime.now()) + " --- Logpull task failed unexpectedly. Exception message: " + str(e))
+            return False
+        finally:
+            with thread_lock:
+                num_of_running_thread -= 1
+            metrics.inc("cf_logs_downloader_logpull_in_flight", {}, -1)
+
+'''
+This method will be called by the event loop of the asyncio engine if the process receives SIGINT or SIGTERM signal from the system.
+Same as graceful_terminate(), no more logpull tasks will be started, but the logpull tasks in flight will be finished before the program exits.
+'''
+def graceful_terminate_async(signum):
+    global is_exit
+
+    is_exit = True
+    event.set()
+    print("", file=sys.stderr if is_stdout_streamed() else sys.stdout)
+    logger.info(str(datetime.now()) + " --- " + signal.Signals(signum).name + " detected. Initiating program exit. Finishing up log download tasks...")
+
+'''
+This method is the main loop of the asyncio engine, which replaces the workers and the main loop of the threading engine.
+Each logpull window becomes a coroutine as soon as it's due, and up to async_concurrency of them are pulled at the same time. The queue is still handled by queue_thread().
+schedule and job_windows are prepared by the main loop, see below.
+'''
+async def async_main(schedule, job_windows):
+    global async_session, write_executor
+
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, graceful_terminate_async, signum)
+
+    #the session does not decompress the response body, so HTTP logs can be written as gzip as they are
+    async_session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=pool_size), auto_decompress=False, timeout=aiohttp.ClientTimeout(total=None, sock_connect=ASYNC_CONNECT_TIMEOUT, sock_read=ASYNC_READ_TIMEOUT), trace_configs=[get_async_trace_config()])
+    write_executor = ThreadPoolExecutor(max_workers=workers)
+    semaphore = asyncio.Semaphore(async_concurrency)
+    tasks = set()
+
+    try:
+        while is_exit is False:
+            #wait for the job which is due next
+            next_run_time, i = heapq.heappop(schedule)
+            await asyncio.sleep(max(next_run_time - time.time(), 0))
+            if is_exit is True:
+                break
+            job = jobs[i]
+            current_time, log_start_time_utc = job_windows[i]
+            log_end_time_utc, next_log_start_time_utc = get_next_window(job, log_start_time_utc)
+
+            if adaptive_window is True:
+                windows = take_adaptive_windows(job, current_time, log_start_time_utc, next_log_start_time_utc)
+            else:
+                windows = [(current_time, log_start_time_utc, log_end_time_utc)]
+            for window in windows:
+                track_window(job, window[1], get_window_end(job, window[2]))
+                task = asyncio.ensure_future(run_logs_task(job, *window, semaphore))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+
+            job_windows[i] = [current_time + timedelta(seconds=job['interval']), next_log_start_time_utc]
+            heapq.heappush(schedule, (next_run_time + job['interval'], i))
+
+        #the log ranges waiting to be pulled by adaptive window sizing are put into the queue, so they are not lost
+        enqueue_pending_windows()
+
+        #wait for the logpull tasks in flight to finish. Those which have not started yet will be put into the queue by run_logs_task().
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+    finally:
+        await async_session.close()
+        write_executor.shutdown(wait=True)
+
+    logger.info(str(datetime.now()) + " --- Program exited gracefully.")
+
+'''
+This method calculates the end time of the logpull window which starts at log_start_time_utc, based on the interval of the job, and the start time of the next window.
+'''
+def get_next_window(job, log_start_time_utc):
+    if job['log_type'] == "http":
+        log_end_time_utc = log_start_time_utc + timedelta(seconds=job['interval'])
+        #the next window starts right after this window ends
+        return log_end_time_utc, log_end_time_utc
+    else:
+        #as Cloudflare Access & Audit log request API does not automatically exclude 1 second from end time like what Cloudflare Logpull API does,
+        #we must manually subtract 1 second so that subsequent log requests will not overlap with the time, and add 1 second back to the start time of the next window
+        log_end_time_utc = log_start_time_utc + timedelta(seconds=job['interval']-1)
+        return log_end_time_utc, log_end_time_utc + timedelta(seconds=1)
+
+'''
+This method returns the end time of a log range as used by the HTTP logs (exclusive), from the end time of a logpull window of the job.
+The end time of Cloudflare Access & Audit logs windows is inclusive, thus 1 second is added back (see get_next_window()).
+'''
+def get_window_end(job, log_end_time_utc):
+    return log_end_time_utc if job['log_type'] == "http" else log_end_time_utc + timedelta(seconds=1)
+
+'''
+This method returns the window length allowed by adaptive window sizing (ADAPTIVE_WINDOW_LENGTHS) which is the longest, but not longer than the given number of seconds,
+between adaptive_min_window and adaptive_max_window.
+'''
+def get_adaptive_window_length(seconds):
+    lengths = [n for n in ADAPTIVE_WINDOW_LENGTHS if adaptive_min_window <= n <= adaptive_max_window]
+    return max([n for n in lengths if n <= seconds] or [lengths[0]])
+
+'''
+This method splits the log range from log_start_time_utc to log_end_time_utc (exclusive) into logpull windows of window_length seconds, which is one of ADAPTIVE_WINDOW_LENGTHS.
+Each window starts and ends at a multiple of window_length seconds within the hour of its folder (current_time), so the windows never cross the date and hour folders, and the name of the logfiles are predictable.
+The first and the last window may be shorter. If complete_only is True, the last window will not be included if it is shorter, as the rest of it is not due yet.
+It returns the list of (current_time, log_start_time_utc, log_end_time_utc) of each window, with the end time following the log type (see get_next_window()),
+and the folder time and start time of the log range which is not included.
+'''
+def split_aligned_windows(job, current_time, log_start_time_utc, log_end_time_utc, window_length, complete_only=False):
+    windows = []
+    while log_start_time_utc < log_end_time_utc:
+        #the number of seconds until the next multiple of window_length within the hour
+        length = window_length - (current_time.minute * 60 + current_time.second) % window_length
+        if log_start_time_utc + timedelta(seconds=length) > log_end_time_utc:
+            if complete_only is True:
+                break
+            length = int((log_end_time_utc - log_start_time_utc).total_seconds())
+        windows.append((current_time, log_start_time_utc, log_start_time_utc + timedelta(seconds=length - (0 if job['log_type'] == "http" else 1))))
+        current_time += timedelta(seconds=length)
+        log_start_time_utc += timedelta(seconds=length)
+    return windows, current_time, log_start_time_utc
+
+'''
+This method is used by the scheduler if adaptive window sizing is enabled. Instead of pulling the log range of each interval as one window,
+the log range (log_start_time_utc to log_available_time_utc, exclusive) is added to the log range waiting to be pulled for the job,
+and the windows of the current window length which are complete are taken out. Longer windows wait for a few intervals, while shorter windows are pulled a few at a time.
+'''
+def take_adaptive_windows(job, current_time, log_start_time_utc, log_available_time_utc):
+    if job['pending_window'] is None:
+        job['pending_window'] = [current_time, log_start_time_utc]
+    windows, pending_time, pending_start_time_utc = split_aligned_windows(job, job['pending_window'][0], job['pending_window'][1], log_available_time_utc, job['window'], complete_only=True)
+    job['pending_window'] = [pending_time, pending_start_time_utc, log_available_time_utc]
+    return windows
+
+'''
+This method puts the log range of each job which is waiting to be pulled by adaptive window sizing (see take_adaptive_windows()) into the queue, when the program exits.
+'''
+def enqueue_pending_windows():
+    for job in jobs:
+        if job.get('pending_window') and len(job['pending_window']) == 3:
+            current_time, log_start_time_utc, log_available_time_utc = job['pending_window']
+            job['pending_window'] = None
+            for w in split_aligned_windows(job, current_time, log_start_time_utc, log_available_time_utc, job['window'])[0]:
+                enqueue_failed(job, w[0], w[1], w[2], 'Program exited before logpull')
+
+'''
+This method adjusts the window length of a job after a logpull window, if adaptive window sizing is enabled.
+Based on the bytes downloaded and the time taken for each second of logs, the window length is shrunk right away if the window went over adaptive_target_bytes or adaptive_target_seconds,
+or doubled (up to adaptive_max_window) if a window twice as long would still stay within both targets. Failed windows can only shrink the window length (e.g. timed out while downloading).
+'''
+def update_adaptive_window(job, stats, result):
+    if adaptive_window is False or one_time is True or 'sent' not in stats:
+        return
+
+    window_seconds = (get_window_end(job, stats['log_end_time_utc']) - stats['log_start_time_utc']).total_seconds()
+    elapsed = time.monotonic() - stats['sent']
+    downloaded = stats.get('bytes_downloaded') or 0
+    #the longest window which would stay within both targets, assuming the same amount of logs per second
+    ideal_seconds = window_seconds * min(adaptive_target_bytes / max(downloaded, 1), adaptive_target_seconds / max(elapsed, 0.001))
+
+    with thread_lock:
+        current = job['window']
+        if ideal_seconds < window_seconds:
+            new = min(current, get_adaptive_window_length(ideal_seconds))
+        elif result == "pulled" and window_seconds >= current and ideal_seconds >= current * 2:
+            new = get_adaptive_window_length(current * 2)
+        else:
+            new = current
+        job['window'] = new
+
+    if new != current:
+        logger.info(str(datetime.now()) + " --- " + job['label'] + "Adaptive window: " + str(current) + " -> " + str(new) + " seconds (" + str(round(downloaded / 1048576, 2)) + " MB in " + str(round(elapsed, 2)) + " seconds for a log range of " + str(int(window_seconds)) + " seconds).")
+    metrics.set("cf_logs_downloader_window_seconds", get_metrics_labels(job), new)
 
         
+        
 ####################################################################################################       
         
-#register signals with a method. the method will be triggered if the user sends a signal to the program (SIGINT and SIGTERM)        
-signal.signal(signal.SIGINT, graceful_terminate)
-signal.signal(signal.SIGTERM, graceful_terminate)
+#the program is only run when it's executed, not when it's imported (e.g. by the tests)
+if __name__ == "__main__":
+    #register signals with a method. the method will be triggered if the user sends a signal to the program (SIGINT and SIGTERM)        
+    signal.signal(signal.SIGINT, graceful_terminate)
+    signal.signal(signal.SIGTERM, graceful_terminate)
 
-#This is where the real execution of the program begins. First it will initialize the parameters supplied by the user
-initialize_arg()
+    #This is where the real execution of the program begins. First it will initialize the parameters supplied by the user
+    initialize_arg()
 
-#After the above execution, it will verify the Zone ID and API Token given by the user whether they are valid
-verify_credential()
+    #create the HTTP session shared by all logpull processes
+    initialize_session()
 
-#if both Zone ID and API Token are valid, the logpull tasks will begin.
-logger.info(str(datetime.now()) + " --- Cloudflare logs download tasks started. Log type: " + log_type)
+    #create the metrics, and start the metrics endpoint if specified by the user
+    initialize_metrics()
 
-#if the user instructs the program to do logpull for only one time, the program will not do the logpull jobs repeatedly
-if one_time is True:
-    threading.Thread(target=logs_thread, args=(None, start_time_static, end_time_static)).start()
-else:
-    #first get the current system time, both local and UTC time.
-    #the purpose of getting UTC time is to facilitate the calculation of the start and end time to pull the logs from Cloudflare API
-    #the purpose of getting local time is to generate a directory structure to store logs, separated by the date and time
-    current_time_utc = datetime.utcnow()
-    current_time = datetime.now()
+    #open the manifest of the logfiles which have been written
+    initialize_manifest()
 
-    #calculate how many seconds to go back from current time to pull the logs. 
-    if log_type == "http":
-        #mininum 60 seconds difference to accommodate Cloudflare logs delay, and also add at least 60 seconds or more, based on interval
-        logs_from = 60.0 + (((interval-1) // 60 * 60) + 60)
-    elif log_type == "access" or log_type == "audit":
-        #add at least 60 seconds or more, based on interval
-        logs_from = 0.0 + (((interval-1) // 60 * 60) + 60)
+    #if the user instructs the program to look for gaps in the archive, display the gaps (and fill them if specified), then exit
+    if find_gaps_range is not None:
+        sys.exit(run_find_gaps())
 
-    #calculate the start time to pull the logs from Cloudflare API
-    log_start_time_utc = current_time_utc.replace(second=0, microsecond=0) - timedelta(seconds=logs_from)
-    current_time = current_time.replace(second=0, microsecond=0) - timedelta(seconds=logs_from)
+    #if the user instructs the program to compact the logfiles, merge the logfiles of each hour or day which is over, then exit
+    if compact_period is not None:
+        sys.exit(run_compaction())
 
-    #this is useful when we need to repeat the execution of a code block after a certain interval, in an accurate way
-    #below code will explain the usage of this in detail
-    initial_time = time.time()
+    #After the above execution, it will verify the Zone ID and API Token of each job given by the user whether they are valid
+    for job in jobs:
+        verify_credential(job)
+
+    #if both Zone ID and API Token are valid, the logpull tasks will begin.
+    if jobs[0]['name'] is None:
+        logger.info(str(datetime.now()) + " --- Cloudflare logs download tasks started. Log type: " + log_type)
+    else:
+        logger.info(str(datetime.now()) + " --- Cloudflare logs download tasks started. Jobs: " + ", ".join(job['name'] + " (" + job['log_type'] + ")" for job in jobs))
+        #the items in the queue of the single job are not moved into the queue of any job, as it's not known which job they belong to
+        if queue.size > 0:
+            logger.warning(str(datetime.now()) + " --- " + str(queue.size) + " item(s) left in the queue from before 'jobs' was configured. These items will not be retried.")
 
-    #create a new thread to handle failed tasks inside queue
-    threading.Thread(target=queue_thread).start()
+    #if the user instructs the program to do logpull for only one time, the program will not do the logpull jobs repeatedly
+    if one_time is True:
+        #pull the logs of each job one after another, then report failure if any of the jobs failed
+        backfill_status = [backfill(job, start_time_static, end_time_static) for job in jobs]
+        if False in backfill_status:
+            sys.exit(1)
+    else:
+        #first get the current system time, both local and UTC time.
+        #the purpose of getting UTC time is to facilitate the calculation of the start and end time to pull the logs from Cloudflare API
+        #the purpose of getting local time is to generate a directory structure to store logs, separated by the date and time
+        current_time_utc = datetime.utcnow()
+        current_time_local = datetime.now()
 
-    #force the program to run indefinitely, unless the user stops it with Ctrl+C
-    while True:        
-        #calculate the end time to pull the logs from Cloudflare API, based on the interval value given by the user
-        if log_type == "http":
-            log_end_time_utc = log_start_time_utc + timedelta(seconds=interval)
-        elif log_type == 'access' or log_type == "audit":
-            #as Cloudflare Access & Audit log request API does not automatically exclude 1 second from end time like what Cloudflare Logpull API does,
-            #we must manually subtract 1 second so that subsequent log requests will not overlap with the time
-            log_end_time_utc = log_start_time_utc + timedelta(seconds=interval-1)
+        #this is useful when we need to repeat the execution of a code block after a certain interval, in an accurate way
+        #below code will explain the usage of this in detail
+        initial_time = time.time()
 
-        #create a new thread to handle the logs processing. the target method is logs() and 3 parameters are supplied to this method
-        threading.Thread(target=logs_thread, args=(current_time, log_start_time_utc, log_end_time_utc)).start()
+        #the schedule of all the jobs, ordered by the time of the next logpull: (time of the next logpull, job index).
+        #the first logpull of each job is staggered across the interval, so that the requests of many jobs will not be sent to Cloudflare API at the same time.
+        schedule = []
+        job_windows = []
+        catch_up_jobs = []
+        for i, job in enumerate(jobs):
+            #calculate the start time to pull the logs from Cloudflare API. If the program restarted shortly, continue from the checkpoint of the job, once the logs after the checkpoint are old enough to be pulled
+            checkpoint = read_checkpoint(job)
+            job['checkpoint'] = checkpoint
+            current_time, log_start_time_utc, delay = get_first_window(job, checkpoint, current_time_utc, current_time_local)
 
-        #assigning start and end time to the next iteration
-        if log_type == "http":
-            log_start_time_utc = log_end_time_utc
-        elif log_type == 'access' or log_type == "audit":
-            #adding 1 second back to the next iteration of start time, as previously 1 second deduction has been made
-            log_start_time_utc = log_end_time_utc + timedelta(seconds=1)
-        current_time = current_time + timedelta(seconds=interval)
+            job_windows.append([current_time, log_start_time_utc])
+            heapq.heappush(schedule, (initial_time + delay + job['interval'] * i / len(jobs), i))
+
+            #if the program was not running for a while, pull the log range missed since the checkpoint of the job as well
+            catch_up_windows = get_catch_up_windows(job, checkpoint, current_time, log_start_time_utc, current_time_utc)
+            if catch_up_windows:
+                catch_up_jobs.append((job, catch_up_windows))
+
+        #create a new thread to handle failed tasks inside queue
+        threading.Thread(target=queue_thread).start()
+
+        #create a new thread for each job to pull the log range missed while the program was not running
+        for job, catch_up_windows in catch_up_jobs:
+            threading.Thread(target=catch_up_job, args=(job, catch_up_windows)).start()
+
+        #the asyncio engine runs the logpull tasks as coroutines in an event loop instead of the workers below
+        if engine == "asyncio":
+            asyncio.run(async_main(schedule, job_windows))
+            sys.exit(0)
+
+        #create a fixed number of workers to handle the logs processing, so the number of threads stays the same no matter how slow Cloudflare API is
+        for i in range(workers):
+            threading.Thread(target=window_worker).start()
+
+        #force the program to run indefinitely, unless the user stops it with Ctrl+C
+        while True:
+            #wait for the job which is due next
+            next_run_time, i = heapq.heappop(schedule)
+            time.sleep(max(next_run_time - time.time(), 0))
+            job = jobs[i]
+            current_time, log_start_time_utc = job_windows[i]
+
+            #calculate the end time to pull the logs from Cloudflare API based on the interval value given by the user, and the start time of the next iteration
+            log_end_time_utc, next_log_start_time_utc = get_next_window(job, log_start_time_utc)
+
+            #hand over the logs processing to the workers. the target method is logs_thread() and 4 parameters are supplied to this method
+            #with adaptive window sizing, the log range is pulled in windows of the current window length instead, once they are complete
+            if adaptive_window is True:
+                for window in take_adaptive_windows(job, current_time, log_start_time_utc, next_log_start_time_utc):
+                    track_window(job, window[1], get_window_end(job, window[2]))
+                    submit_window(job, *window)
+            else:
+                track_window(job, log_start_time_utc, next_log_start_time_utc)
+                submit_window(job, current_time, log_start_time_utc, log_end_time_utc)
+
+            #assigning start and end time to the next iteration
+            job_windows[i] = [current_time + timedelta(seconds=job['interval']), next_log_start_time_utc]
 
-        time.sleep(interval - ((time.time() - initial_time) % interval))
+            #the next logpull of the job is exactly one interval later, so the schedule will not drift no matter how long submit_window() takes
+            heapq.heappush(schedule, (next_run_time + job['interval'], i))
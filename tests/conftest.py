@@ -0,0 +1,7 @@
+import os
+import sys
+import tempfile
+
+#the activity log, the queue and the other state files are created when the program is imported, so keep them away from /var/log/cf_logs_downloader/
+os.environ.setdefault("CF_LOGS_DOWNLOADER_STATE_DIR", tempfile.mkdtemp(prefix="cf_logs_downloader_tests_"))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
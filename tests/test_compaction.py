@@ -0,0 +1,111 @@
+import os
+
+import pytest
+
+import cf_logs_downloader as cfld
+
+
+DEST = {'name': "local", 'prefix': "cf", 'no_gzip': True}
+WINDOWS = [("2021-04-01T12:00:00Z", "2021-04-01T12:01:00Z"), ("2021-04-01T12:01:00Z", "2021-04-01T12:02:00Z"), ("2021-04-01T12:02:00Z", "2021-04-01T12:03:00Z")]
+
+
+def write_logfiles(folder, windows=WINDOWS):
+    logfiles = []
+    for log_start_time, log_end_time in windows:
+        logfile_path = os.path.join(str(folder), "cf_" + log_start_time + "~" + log_end_time + ".json")
+        with open(logfile_path, "wb") as f:
+            f.write(('{"start":"' + log_start_time + '"}\n').encode())
+        logfiles.append((logfile_path, log_start_time, log_end_time))
+    return logfiles
+
+
+@pytest.fixture(autouse=True)
+def no_manifest(monkeypatch):
+    monkeypatch.setattr(cfld, "manifest", None)
+
+
+def test_compact_logfiles_merges_windows_in_order(tmp_path):
+    logfiles = write_logfiles(tmp_path)
+    removed, compacted_path = cfld.compact_logfiles({'log_type': "http"}, DEST, str(tmp_path), list(reversed(logfiles)))
+
+    assert removed == 3
+    assert os.path.basename(compacted_path) == "cf_2021-04-01T12:00:00Z~2021-04-01T12:03:00Z.json"
+    assert sorted(os.listdir(str(tmp_path))) == sorted([os.path.basename(compacted_path), os.path.basename(compacted_path) + cfld.COMPACTION_INDEX_SUFFIX])
+    with open(compacted_path, "rb") as f:
+        data = f.read()
+    index = cfld.read_compaction_index(compacted_path)
+    assert [(w['log_start_time'], w['log_end_time']) for w in index] == WINDOWS
+    #each window can still be read on its own
+    for w, (log_start_time, log_end_time) in zip(index, WINDOWS):
+        assert data[w['offset']:w['offset'] + w['length']] == ('{"start":"' + log_start_time + '"}\n').encode()
+
+
+def test_compact_logfiles_replaces_index_before_data(tmp_path, monkeypatch):
+    logfiles = write_logfiles(tmp_path)
+    replaced = []
+    replace = os.replace
+
+    def record_replace(src, dst):
+        replaced.append(dst)
+        replace(src, dst)
+
+    monkeypatch.setattr(cfld.os, "replace", record_replace)
+    null, compacted_path = cfld.compact_logfiles({'log_type': "http"}, DEST, str(tmp_path), logfiles)
+    #the compaction is committed once the index is in place, see recover_compaction()
+    assert replaced == [compacted_path + cfld.COMPACTION_INDEX_SUFFIX, compacted_path]
+
+
+def test_compact_logfiles_removes_temporary_files_on_failure(tmp_path, monkeypatch):
+    logfiles = write_logfiles(tmp_path)
+    fsync = os.fsync
+    synced = []
+
+    #the index has been written, but writing the compacted logfile fails
+    def failing_fsync(fd):
+        synced.append(fd)
+        if len(synced) == 2:
+            raise OSError("No space left on device")
+        fsync(fd)
+
+    monkeypatch.setattr(cfld.os, "fsync", failing_fsync)
+    with pytest.raises(OSError):
+        cfld.compact_logfiles({'log_type': "http"}, DEST, str(tmp_path), logfiles)
+
+    assert sorted(os.listdir(str(tmp_path))) == sorted(os.path.basename(l[0]) for l in logfiles)
+
+
+def test_compact_logfiles_merges_compacted_logfile_again(tmp_path):
+    logfiles = write_logfiles(tmp_path, WINDOWS[:2])
+    null, compacted_path = cfld.compact_logfiles({'log_type': "http"}, DEST, str(tmp_path), logfiles)
+    logfiles = [(compacted_path, WINDOWS[0][0], WINDOWS[1][1])] + write_logfiles(tmp_path, WINDOWS[2:])
+    removed, compacted_path = cfld.compact_logfiles({'log_type': "http"}, DEST, str(tmp_path), logfiles)
+
+    assert removed == 2
+    assert [(w['log_start_time'], w['log_end_time']) for w in cfld.read_compaction_index(compacted_path)] == WINDOWS
+    assert len(os.listdir(str(tmp_path))) == 2
+
+
+def test_recover_compaction_discards_uncommitted_compaction(tmp_path):
+    logfiles = write_logfiles(tmp_path)
+    compacted_path = os.path.join(str(tmp_path), "cf_2021-04-01T12:00:00Z~2021-04-01T12:03:00Z.json")
+    #interrupted before the index was put in place
+    for temp_path in (compacted_path + cfld.COMPACTION_TEMP_SUFFIX, compacted_path + cfld.COMPACTION_INDEX_SUFFIX + cfld.COMPACTION_TEMP_SUFFIX):
+        with open(temp_path, "w") as f:
+            f.write("partial")
+    cfld.recover_compaction(str(tmp_path))
+
+    assert sorted(os.listdir(str(tmp_path))) == sorted(os.path.basename(l[0]) for l in logfiles)
+
+
+def test_recover_compaction_finishes_committed_compaction(tmp_path):
+    compacted_path = os.path.join(str(tmp_path), "cf_2021-04-01T12:00:00Z~2021-04-01T12:03:00Z.json")
+    #interrupted after the index was put in place, but before the compacted logfile
+    with open(compacted_path + cfld.COMPACTION_INDEX_SUFFIX, "w") as f:
+        f.write('{"windows": []}')
+    with open(compacted_path + cfld.COMPACTION_TEMP_SUFFIX, "w") as f:
+        f.write("compacted")
+    cfld.recover_compaction(str(tmp_path))
+
+    assert sorted(os.listdir(str(tmp_path))) == sorted([os.path.basename(compacted_path), os.path.basename(compacted_path) + cfld.COMPACTION_INDEX_SUFFIX])
+    with open(compacted_path, "r") as f:
+        assert f.read() == "compacted"
@@ -0,0 +1,146 @@
+import gzip
+import random
+
+import pytest
+
+import cf_logs_downloader as cfld
+
+
+def make_records(count):
+    rng = random.Random(count)
+    return b"".join(('{"RayID":"' + "%016x" % rng.getrandbits(64) + '","EdgeResponseStatus":' + str(rng.choice([200, 304, 404, 503])) + '}\n').encode() for i in range(count))
+
+
+def encode(encoder, data, size=65536):
+    return b"".join(b"".join(encoder.compress(data[offset:offset + size])) for offset in range(0, len(data), size)) + encoder.flush()
+
+
+def test_parallel_gzip_round_trip(monkeypatch):
+    monkeypatch.setattr(cfld, "compression_pool_size", 3)
+    monkeypatch.setattr(cfld, "compression_executor", None)
+    data = make_records(100000)
+    encoder = cfld.ParallelGzipStream(6, 3)
+    compressed = encode(encoder, data)
+
+    #one gzip member for each block, which are read back as one gzip file
+    assert encoder.members == -(-len(data) // cfld.PARALLEL_GZIP_BLOCK_SIZE)
+    assert gzip.decompress(compressed) == data
+    assert cfld.compression_executor._max_workers == 3
+
+
+def test_parallel_gzip_without_data_writes_empty_member():
+    assert gzip.decompress(encode(cfld.ParallelGzipStream(6, 2), b"")) == b""
+
+
+def test_parallel_gzip_close_drops_blocks_left(monkeypatch):
+    monkeypatch.setattr(cfld, "compression_executor", None)
+    encoder = cfld.ParallelGzipStream(6, 2)
+    list(encoder.compress(make_records(100000)))
+    cfld.close_encoder(cfld.TranscodeStream(encoder))
+    assert not encoder.futures and not encoder.buffer
+
+
+@pytest.mark.skipif(cfld.zstandard is None, reason="requires zstandard")
+@pytest.mark.parametrize("threads, long", [(1, 0), (2, 27)])
+def test_zstd_round_trip(threads, long):
+    data = make_records(20000)
+    compressed = encode(cfld.ZstdStream(3, threads, long), data)
+    assert cfld.zstandard.ZstdDecompressor().decompressobj().decompress(compressed) == data
+
+
+def test_transcode_gzip_to_gzip_counts_records():
+    data = make_records(20000)
+    encoder = cfld.TranscodeStream(cfld.GzipStream(1))
+    assert gzip.decompress(encode(encoder, gzip.compress(data), 4096)) == data
+    assert encoder.records == 20000
+
+
+def test_transcode_without_encoder_inflates():
+    data = make_records(1000)
+    encoder = cfld.TranscodeStream()
+    assert encode(encoder, gzip.compress(data), 100) == data
+    assert encoder.records == 1000
+
+
+@pytest.mark.skipif(cfld.zstandard is None, reason="requires zstandard")
+def test_transcode_gzip_to_zstd():
+    data = make_records(20000)
+    compressed = encode(cfld.TranscodeStream(cfld.ZstdStream(3)), gzip.compress(data))
+    assert cfld.zstandard.ZstdDecompressor().decompressobj().decompress(compressed) == data
+
+
+def make_parquet(fields, **options):
+    job = {'label': "", 'log_type': "http", 'fields': fields, 'log_dest': [dict({'name': "parquet", 'format': "parquet"}, **options)]}
+    cfld.initialize_parquet(job)
+    return job['log_dest'][0]['parquet']
+
+
+@pytest.mark.skipif(cfld.pyarrow is None, reason="requires pyarrow")
+def test_parquet_writes_row_groups(monkeypatch):
+    monkeypatch.setattr(cfld, "PARQUET_BATCH_SIZE", 100)
+    parquet = make_parquet(["RayID", "EdgeResponseStatus"], parquet_row_group_size=250)
+    records = make_records(1000)
+    data = encode(cfld.ParquetStream(parquet, {'name': "zstd", 'level': None}, "parquet"), records + b"not json\n", 4096)
+
+    parquet_file = cfld.pyarrow.parquet.ParquetFile(cfld.pyarrow.BufferReader(data))
+    assert [parquet_file.metadata.row_group(i).num_rows for i in range(parquet_file.num_row_groups)] == [250, 250, 250, 250]
+    table = parquet_file.read()
+    assert table.schema.field("EdgeResponseStatus").type == cfld.pyarrow.int64()
+    assert table.to_pylist() == [cfld.json.loads(line) for line in records.splitlines()]
+
+
+@pytest.mark.skipif(cfld.pyarrow is None, reason="requires pyarrow")
+def test_to_arrow_array_falls_back_for_values_of_another_type():
+    #values which do not fit an int64 column are written as null, and values of string columns which are not strings as JSON text
+    assert cfld.to_arrow_array([200, "n/a", None, 404], cfld.pyarrow.int64()).to_pylist() == [200, None, None, 404]
+    assert cfld.to_arrow_array(["a", {"b": 1}, 2], cfld.pyarrow.string()).to_pylist() == ["a", '{"b": 1}', "2"]
+    assert cfld.to_arrow_array(["2021-04-01T12:00:00Z", "yesterday"], cfld.pyarrow.timestamp("ns", tz="UTC")).to_pylist()[1] is None
+
+
+def make_pipeline(**options):
+    d = dict({'name': "processed"}, **options)
+    cfld.initialize_pipeline(d)
+    return d['pipeline']
+
+
+def test_record_stream_filters_records():
+    encoder = cfld.RecordStream(make_pipeline(filter=["EdgeResponseStatus >= 400", 'ClientCountry in ["us", "ca"]']), name="processed")
+    data = b'{"EdgeResponseStatus":404,"ClientCountry":"us"}\n{"EdgeResponseStatus":200,"ClientCountry":"us"}\n{"EdgeResponseStatus":503,"ClientCountry":"de"}\nnot json\n{"EdgeResponseStatus":500,"ClientCountry":"ca"}'
+    #the records which are kept are written as they are
+    assert encode(encoder, data, 7) == b'{"EdgeResponseStatus":404,"ClientCountry":"us"}\n{"EdgeResponseStatus":500,"ClientCountry":"ca"}\n'
+    assert (encoder.records, encoder.invalid) == (2, 1)
+
+
+def test_record_stream_drops_fields():
+    encoder = cfld.RecordStream(make_pipeline(**{'fields.drop': ["ClientIP", "actor.email"]}))
+    data = b'{"ClientIP":"192.0.2.1","RayID":"a"}\n{"actor":{"email":"a@example.com","id":1}}\n'
+    assert encode(encoder, data) == b'{"RayID":"a"}\n{"actor":{"id":1}}\n'
+
+
+def test_record_stream_redacts_fields_with_hmac():
+    encoder = cfld.RecordStream(make_pipeline(**{'fields.redact': ["ClientIP"], 'redact_key': "secret"}))
+    data = b'{"ClientIP":"192.0.2.1"}\n{"ClientIP":"192.0.2.1"}\n{"ClientIP":null}\n'
+    digest = cfld.hmac.new(b"secret", b"192.0.2.1", cfld.hashlib.sha256).hexdigest()
+    #the same values are redacted into the same digest, so they can still be correlated
+    assert [cfld.json.loads(line) for line in encode(encoder, data).splitlines()] == [{"ClientIP": digest}, {"ClientIP": digest}, {"ClientIP": None}]
+
+
+def test_record_stream_redacts_fields_without_key():
+    encoder = cfld.RecordStream(make_pipeline(**{'fields.redact': ["ClientIP"]}), cfld.GzipStream(1))
+    assert cfld.json.loads(gzip.decompress(encode(encoder, b'{"ClientIP":"192.0.2.1"}\n'))) == {"ClientIP": cfld.REDACTED_VALUE}
+
+
+def test_gunzip_multi_member_input():
+    members = [make_records(count) for count in (3000, 1, 5000)]
+    data = b"".join(gzip.compress(member) for member in members)
+    decompressor = cfld.GunzipStream(1000)
+    #the members are split across chunks anywhere, including in the middle of a gzip header
+    chunks = [piece for offset in range(0, len(data), 777) for piece in decompressor.decompress(data[offset:offset + 777])]
+
+    assert all(len(chunk) <= 1000 for chunk in chunks)
+    assert b"".join(chunks) + decompressor.flush() == b"".join(members)
+
+
+def test_gunzip_chunks_of_buffer():
+    data = make_records(2000)
+    assert b"".join(cfld.gunzip_chunks(cfld.iter_buffer(gzip.compress(data) + gzip.compress(data), 4096))) == data + data
@@ -0,0 +1,44 @@
+from datetime import datetime, timedelta
+
+import cf_logs_downloader as cfld
+
+
+def find_gaps(monkeypatch, log_type, ranges, log_start_time_utc, log_end_time_utc):
+    monkeypatch.setattr(cfld, "manifest", None)
+    monkeypatch.setattr(cfld, "scan_logfile_ranges", lambda d, log_start_time_utc, log_end_time_utc, utc_offset: sorted(ranges))
+    return cfld.find_gaps({'log_type': log_type}, {'name': "local"}, log_start_time_utc, log_end_time_utc, timedelta(0))
+
+
+def test_find_gaps_without_gaps(monkeypatch):
+    ranges = [("2021-04-01T12:00:00Z", "2021-04-01T12:01:00Z"), ("2021-04-01T12:01:00Z", "2021-04-01T12:02:00Z")]
+    assert find_gaps(monkeypatch, "http", ranges, datetime(2021, 4, 1, 12, 0, 0), datetime(2021, 4, 1, 12, 2, 0)) == []
+
+
+def test_find_gaps_reports_gaps_and_overlaps(monkeypatch):
+    ranges = [
+        ("2021-04-01T12:00:30Z", "2021-04-01T12:01:00Z"),
+        ("2021-04-01T12:02:00Z", "2021-04-01T12:04:00Z"),
+        #overlapping the logfile above
+        ("2021-04-01T12:03:00Z", "2021-04-01T12:03:30Z"),
+        ("2021-04-01T12:03:30Z", "2021-04-01T12:04:00Z"),
+    ]
+    results = find_gaps(monkeypatch, "http", ranges, datetime(2021, 4, 1, 12, 0, 0), datetime(2021, 4, 1, 12, 5, 0))
+    assert results == [
+        ("gap", datetime(2021, 4, 1, 12, 0, 0), datetime(2021, 4, 1, 12, 0, 30)),
+        ("gap", datetime(2021, 4, 1, 12, 1, 0), datetime(2021, 4, 1, 12, 2, 0)),
+        #adjacent overlaps are reported as one
+        ("overlap", datetime(2021, 4, 1, 12, 3, 0), datetime(2021, 4, 1, 12, 4, 0)),
+        ("gap", datetime(2021, 4, 1, 12, 4, 0), datetime(2021, 4, 1, 12, 5, 0)),
+    ]
+
+
+def test_find_gaps_with_inclusive_end_time(monkeypatch):
+    #Cloudflare Access and Audit log ranges are 1 second apart
+    ranges = [("2021-04-01T12:00:00Z", "2021-04-01T12:00:59Z"), ("2021-04-01T12:01:00Z", "2021-04-01T12:01:59Z"), ("2021-04-01T12:03:00Z", "2021-04-01T12:03:59Z")]
+    results = find_gaps(monkeypatch, "access", ranges, datetime(2021, 4, 1, 12, 0, 0), datetime(2021, 4, 1, 12, 4, 0))
+    assert results == [("gap", datetime(2021, 4, 1, 12, 2, 0), datetime(2021, 4, 1, 12, 3, 0))]
+
+
+def test_find_gaps_ignores_ranges_outside(monkeypatch):
+    ranges = [("2021-04-01T11:00:00Z", "2021-04-01T12:00:00Z"), ("2021-04-01T12:00:00Z", "2021-04-01T12:01:00Z"), ("2021-04-01T12:01:00Z", "2021-04-01T13:00:00Z")]
+    assert find_gaps(monkeypatch, "http", ranges, datetime(2021, 4, 1, 12, 0, 0), datetime(2021, 4, 1, 12, 1, 0)) == []
@@ -0,0 +1,77 @@
+import errno
+import gzip
+import os
+
+import pytest
+
+import cf_logs_downloader as cfld
+
+
+DATA = b'{"RayID":"a"}\n{"RayID":"b"}\n'
+
+
+@pytest.fixture(autouse=True)
+def no_manifest(monkeypatch):
+    monkeypatch.setattr(cfld, "manifest", None)
+
+
+def make_dest(folder, name, **options):
+    os.makedirs(str(folder), exist_ok=True)
+    return dict({'name': name, 'path': os.path.join(str(folder), "cf_2021-04-01T12:00:00Z~2021-04-01T12:01:00Z.json"), 'prefix': "cf", 'no_gzip': True}, **options)
+
+
+def test_log_destinations_with_same_encoding_share_logfile(tmp_path):
+    log_dest_list = [make_dest(tmp_path / "a", "a"), make_dest(tmp_path / "b", "b")]
+    stats = {}
+    assert cfld.write_logs_stream(log_dest_list, iter([DATA]), compressed=False, stats=stats) == (True, True, None)
+
+    #the logfile is written once, and hard linked from both log destinations
+    first, second = (os.stat(d['path']) for d in log_dest_list)
+    assert (first.st_ino, first.st_nlink) == (second.st_ino, 2)
+    with open(log_dest_list[1]['path'], "rb") as f:
+        assert f.read() == DATA
+    assert [(l['name'], l['bytes'], l['records']) for l in stats['logfiles']] == [("a", len(DATA), 2), ("b", len(DATA), 2)]
+    #only the logfiles are left, the temporary file is gone
+    assert os.listdir(str(tmp_path / "a")) == [os.path.basename(log_dest_list[0]['path'])]
+
+
+def test_log_destination_on_another_file_system_gets_copy(tmp_path, monkeypatch):
+    log_dest_list = [make_dest(tmp_path / "a", "a"), make_dest(tmp_path / "b", "b")]
+    link = os.link
+
+    def cross_device_link(src, dst):
+        if dst.startswith(str(tmp_path / "b")) and os.path.dirname(src) != os.path.dirname(dst):
+            raise OSError(errno.EXDEV, "Invalid cross-device link")
+        link(src, dst)
+
+    monkeypatch.setattr(cfld.os, "link", cross_device_link)
+    assert cfld.write_logs_stream(log_dest_list, iter([DATA]), compressed=False) == (True, True, None)
+
+    first, second = (os.stat(d['path']) for d in log_dest_list)
+    assert first.st_ino != second.st_ino
+    assert (first.st_nlink, second.st_nlink) == (1, 1)
+    with open(log_dest_list[1]['path'], "rb") as f:
+        assert f.read() == DATA
+    assert os.listdir(str(tmp_path / "b")) == [os.path.basename(log_dest_list[1]['path'])]
+
+
+def test_log_destinations_with_different_encoding_get_own_logfiles(tmp_path):
+    log_dest_list = [make_dest(tmp_path / "a", "a"), make_dest(tmp_path / "b", "b", no_gzip=False)]
+    log_dest_list[1]['path'] += ".gz"
+    assert cfld.write_logs_stream(log_dest_list, iter([DATA]), compressed=False) == (True, True, None)
+
+    assert os.stat(log_dest_list[0]['path']).st_nlink == 1
+    with open(log_dest_list[1]['path'], "rb") as f:
+        assert gzip.decompress(f.read()) == DATA
+
+
+def test_failed_logfile_is_not_committed(tmp_path):
+    log_dest_list = [make_dest(tmp_path / "a", "a"), make_dest(tmp_path / "b", "b")]
+    #the logfile of the second log destination exists already
+    with open(log_dest_list[1]['path'], "wb") as f:
+        f.write(b"old")
+    result, e, failed_dest_name = cfld.write_logs_stream(log_dest_list, iter([DATA]), compressed=False)
+
+    assert (result, failed_dest_name) == (False, "b")
+    assert isinstance(e, FileExistsError)
+    assert os.listdir(str(tmp_path / "b")) == [os.path.basename(log_dest_list[1]['path'])]
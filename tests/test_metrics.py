@@ -0,0 +1,49 @@
+import http.server
+import threading
+
+import pytest
+
+import cf_logs_downloader as cfld
+
+
+class KeepAliveHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"{}")
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), KeepAliveHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield "http://127.0.0.1:" + str(server.server_address[1])
+    server.shutdown()
+    server.server_close()
+
+
+def get_metric(name):
+    return cfld.metrics.get(name, {})
+
+
+def test_api_connections_are_counted_by_pool(server, monkeypatch):
+    monkeypatch.setattr(cfld, "metrics", cfld.Metrics())
+    monkeypatch.setattr(cfld, "jobs", [])
+    cfld.initialize_session()
+    for i in range(3):
+        assert cfld.session.get(server + "/").status_code == 200
+    cfld.collect_metrics()
+    assert (get_metric("cf_logs_downloader_api_requests_total"), get_metric("cf_logs_downloader_api_connections_opened_total"), get_metric("cf_logs_downloader_api_connections_reused_total")) == (3, 1, 2)
+
+    #the kept alive connection has been closed, so the next request opens a new one
+    cfld.session.close()
+    cfld.initialize_session()
+    cfld.session.get(server + "/")
+    cfld.collect_metrics()
+    assert (get_metric("cf_logs_downloader_api_requests_total"), get_metric("cf_logs_downloader_api_connections_opened_total"), get_metric("cf_logs_downloader_api_connections_reused_total")) == (4, 2, 2)
@@ -0,0 +1,70 @@
+from datetime import datetime, timedelta
+
+import persistqueue
+import pytest
+
+import cf_logs_downloader as cfld
+
+
+@pytest.fixture
+def backoff(monkeypatch):
+    monkeypatch.setattr(cfld, "retry_backoff_base", 3)
+    monkeypatch.setattr(cfld, "retry_backoff_max", 3600)
+
+
+def test_retry_backoff_first_attempt_is_immediate(backoff):
+    assert cfld.get_retry_backoff(0) == 0
+
+
+@pytest.mark.parametrize("attempts, delay", [(1, 3), (2, 6), (3, 12), (5, 48), (11, 3072), (12, 3600), (30, 3600)])
+def test_retry_backoff_doubles_up_to_the_maximum(backoff, monkeypatch, attempts, delay):
+    #the jitter is between none and half of the delay
+    monkeypatch.setattr(cfld.random, "uniform", lambda a, b: a)
+    assert cfld.get_retry_backoff(attempts) == delay / 2
+    monkeypatch.setattr(cfld.random, "uniform", lambda a, b: b)
+    assert cfld.get_retry_backoff(attempts) == delay
+
+
+def test_retry_backoff_jitter_stays_within_bounds(backoff):
+    delays = [cfld.get_retry_backoff(4) for i in range(200)]
+    assert all(12 <= delay <= 24 for delay in delays)
+    assert len(set(delays)) > 1
+
+
+def test_enqueue_failed_is_due_after_backoff(tmp_path, backoff, monkeypatch):
+    monkeypatch.setattr(cfld.random, "uniform", lambda a, b: b)
+    job_queue = persistqueue.SQLiteQueue(str(tmp_path) + "/", auto_commit=True, multithreading=True)
+    job = {'log_type': "http", 'queue': job_queue, 'due_heap': cfld.get_due_heap(job_queue), 'windows_in_flight': {}, 'scheduled_until': None, 'checkpoint': None}
+    log_start_time_utc = datetime(2021, 4, 1, 12, 0, 0)
+    before = datetime.utcnow()
+    cfld.enqueue_failed(job, log_start_time_utc, log_start_time_utc, log_start_time_utc + timedelta(minutes=1), "HTTP 500", attempts=2)
+    cfld.enqueue_failed(job, log_start_time_utc, log_start_time_utc + timedelta(minutes=1), log_start_time_utc + timedelta(minutes=2), "Scheduler backlog")
+
+    #the task which has not been attempted before is due first
+    assert [entry[2]['reason'] for entry in sorted(job['due_heap'])] == ["Scheduler backlog", "HTTP 500"]
+    due, item_id, item = max(job['due_heap'])
+    assert before + timedelta(seconds=6) <= due <= datetime.utcnow() + timedelta(seconds=6)
+    assert item['attempts'] == 2
+    #the heap is the same as the one loaded from the queue after a restart
+    assert sorted(cfld.get_due_heap(job_queue)) == sorted(job['due_heap'])
+    assert job_queue.get(block=False, id=item_id)['reason'] == "HTTP 500"
+
+
+def test_merge_due_heap_adds_tasks_put_by_another_process(tmp_path, backoff):
+    job_queue = persistqueue.SQLiteQueue(str(tmp_path) + "/", auto_commit=True, multithreading=True)
+    job = {'log_type': "http", 'queue': job_queue, 'due_heap': cfld.get_due_heap(job_queue), 'windows_in_flight': {}, 'scheduled_until': None, 'checkpoint': None}
+    log_start_time_utc = datetime(2021, 4, 1, 12, 0, 0)
+    cfld.enqueue_failed(job, log_start_time_utc, log_start_time_utc, log_start_time_utc + timedelta(minutes=1), "HTTP 500")
+    #e.g. --find-gaps with --fill-gaps queue, while the program is running
+    other_queue = persistqueue.SQLiteQueue(str(tmp_path) + "/", auto_commit=True, multithreading=True)
+    other_job = dict(job, queue=other_queue, due_heap=[])
+    cfld.enqueue_failed(other_job, log_start_time_utc, log_start_time_utc + timedelta(minutes=1), log_start_time_utc + timedelta(minutes=2), "Gap found in archive")
+    cfld.enqueue_failed(job, log_start_time_utc, log_start_time_utc + timedelta(minutes=2), log_start_time_utc + timedelta(minutes=3), "HTTP 500")
+    assert job_queue.size == 2
+
+    assert cfld.merge_due_heap(job) == 1
+    assert sorted(entry[2]['reason'] for entry in job['due_heap']) == ["Gap found in archive", "HTTP 500", "HTTP 500"]
+    assert job_queue.size == 3
+    #the tasks already in the heap are not added again
+    assert cfld.merge_due_heap(job) == 0
+    assert len(job['due_heap']) == 3
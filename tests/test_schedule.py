@@ -0,0 +1,49 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import cf_logs_downloader as cfld
+
+
+@pytest.mark.parametrize("log_type", ["access", "audit", "http"])
+@pytest.mark.parametrize("restart_after", [5, 30, 55])
+def test_first_window_after_fast_restart_keeps_lag(log_type, restart_after):
+    job = {'log_type': log_type, 'interval': 60}
+    #the previous run scheduled the window which ends at the checkpoint at 12:01:00 (the current time of its last logpull)
+    previous_time_utc = datetime(2021, 4, 1, 12, 1, 0)
+    null, checkpoint, null = cfld.get_first_window(job, None, previous_time_utc, previous_time_utc)
+    checkpoint += timedelta(seconds=job['interval'])
+
+    current_time_utc = previous_time_utc + timedelta(seconds=restart_after)
+    fresh_time, fresh_start, fresh_delay = cfld.get_first_window(job, None, current_time_utc, current_time_utc)
+    current_time, log_start_time_utc, delay = cfld.get_first_window(job, checkpoint, current_time_utc, current_time_utc)
+
+    assert fresh_delay == 0
+    assert log_start_time_utc == checkpoint
+    assert current_time == checkpoint
+    #the first window is requested as long after its start time as without the restart
+    assert (current_time_utc + timedelta(seconds=delay)) - log_start_time_utc == current_time_utc - fresh_start
+    #the end time of the window is never later than the current time when it's requested, minus one minute for HTTP logs
+    requested_at = current_time_utc + timedelta(seconds=delay)
+    log_end_time_utc = log_start_time_utc + timedelta(seconds=job['interval'])
+    assert log_end_time_utc <= requested_at - timedelta(seconds=60 if log_type == "http" else 0)
+
+
+def test_first_window_without_checkpoint():
+    job = {'log_type': "http", 'interval': 60}
+    current_time_utc = datetime(2021, 4, 1, 12, 1, 30)
+    current_time_local = current_time_utc + timedelta(hours=8)
+    current_time, log_start_time_utc, delay = cfld.get_first_window(job, None, current_time_utc, current_time_local)
+    assert log_start_time_utc == datetime(2021, 4, 1, 11, 59, 0)
+    assert current_time == datetime(2021, 4, 1, 19, 59, 0)
+    assert delay == 0
+
+
+def test_first_window_checkpoint_behind_is_caught_up_instead():
+    job = {'log_type': "access", 'interval': 60}
+    current_time_utc = datetime(2021, 4, 1, 12, 1, 30)
+    checkpoint = datetime(2021, 4, 1, 11, 0, 0)
+    null, log_start_time_utc, delay = cfld.get_first_window(job, checkpoint, current_time_utc, current_time_utc)
+    #the log range between the checkpoint and the start time is pulled by catch_up_job() instead
+    assert log_start_time_utc == datetime(2021, 4, 1, 12, 0, 0)
+    assert delay == 0
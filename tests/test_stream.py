@@ -0,0 +1,199 @@
+import argparse
+import os
+import socket
+import threading
+import time
+from datetime import datetime
+
+import persistqueue
+import pytest
+
+import cf_logs_downloader as cfld
+
+
+class Collector:
+    '''
+    A collector listening on a Unix domain socket, which keeps the bytes received over each connection.
+    '''
+    def __init__(self, path):
+        self.path = path
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server.bind(path)
+        self.server.listen(8)
+        self.received = []
+        self.conn = None
+        self.reading = threading.Event()
+        self.reading.set()
+        self.lock = threading.Lock()
+        threading.Thread(target=self.serve, daemon=True).start()
+
+    def serve(self):
+        while True:
+            try:
+                conn, null = self.server.accept()
+            except OSError:
+                return
+            with self.lock:
+                self.conn = conn
+                self.received.append(b"")
+                index = len(self.received) - 1
+            while True:
+                self.reading.wait()
+                try:
+                    data = conn.recv(65536)
+                except OSError:
+                    break
+                if not data:
+                    break
+                with self.lock:
+                    self.received[index] += data
+
+    #wait until the given number of bytes have been received over all the connections
+    def wait_for(self, length, timeout=5):
+        deadline = time.monotonic() + timeout
+        while sum(len(r) for r in self.received) < length:
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+
+    #close the current connection, as if the collector restarted
+    def drop(self):
+        with self.lock:
+            self.conn.shutdown(socket.SHUT_RDWR)
+            self.conn.close()
+
+    def close(self):
+        self.server.close()
+
+
+@pytest.fixture
+def collector(tmp_path):
+    collector = Collector(os.path.join(str(tmp_path), "collector.sock"))
+    yield collector
+    collector.close()
+
+
+def make_dest(path, **options):
+    d = dict({'name': "collector", 'path': "unix://" + path, 'prefix': "cf"}, **options)
+    cfld.initialize_compression(d, argparse.Namespace(no_gzip=False))
+    cfld.initialize_pipeline(d)
+    cfld.initialize_s3(d)
+    cfld.initialize_stream(d)
+    return d
+
+
+def test_stream_rejects_parquet_format(tmp_path):
+    with pytest.raises(SystemExit):
+        make_dest(os.path.join(str(tmp_path), "collector.sock"), format="parquet")
+
+
+def test_stream_rejects_compression(tmp_path):
+    with pytest.raises(SystemExit):
+        make_dest(os.path.join(str(tmp_path), "collector.sock"), compression="zstd")
+
+
+def test_stream_writer_sends_whole_lines(collector):
+    writer = cfld.StreamWriter(cfld.StreamSink(make_dest(collector.path)['stream']))
+    writer.write(b'{"a":1}\n{"b"')
+    collector.wait_for(8)
+    writer.write(b':2}')
+    #the incomplete record is kept until the rest of it arrives
+    time.sleep(0.1)
+    assert collector.received == [b'{"a":1}\n']
+    writer.commit()
+    assert collector.received == [b'{"a":1}\n{"b":2}\n']
+
+
+def test_stream_commit_waits_until_collector_received(collector, monkeypatch):
+    monkeypatch.setattr(cfld, "stream_timeout", 5)
+    writer = cfld.StreamWriter(cfld.StreamSink(make_dest(collector.path)['stream']))
+    #the collector accepts the connection, but does not read anything yet
+    collector.reading.clear()
+    writer.write(b'{"a":1}\n{"b":2}\n')
+    errors = []
+    committing = threading.Thread(target=lambda: errors.append(None) if writer.commit() is None else None)
+    committing.start()
+    #the records are still in the send buffer of the socket (TIOCOUTQ), so the logpull window is not done yet
+    committing.join(0.3)
+    assert committing.is_alive()
+    collector.reading.set()
+    committing.join(5)
+    assert not committing.is_alive()
+    assert errors == [None]
+
+
+def test_stream_commit_fails_if_collector_never_receives(collector, monkeypatch):
+    monkeypatch.setattr(cfld, "stream_timeout", 0.3)
+    writer = cfld.StreamWriter(cfld.StreamSink(make_dest(collector.path)['stream']))
+    #the collector accepts the connection, but does not read anything yet
+    collector.reading.clear()
+    writer.write(b'{"a":1}\n{"b":2}\n')
+    with pytest.raises(cfld.StreamLostError):
+        writer.commit()
+    collector.reading.set()
+
+
+def test_stream_reconnects_for_first_batch_of_window(collector, monkeypatch):
+    monkeypatch.setattr(cfld, "stream_reconnect_attempts", 3)
+    sink = cfld.StreamSink(make_dest(collector.path)['stream'])
+    first = cfld.StreamWriter(sink)
+    first.write(b'{"a":1}\n')
+    first.commit()
+    collector.drop()
+
+    #nothing of the next logpull window has been sent yet, so it's sent over a new connection
+    second = cfld.StreamWriter(sink)
+    second.write(b'{"b":2}\n')
+    second.commit()
+    assert sink.generation == 2
+    assert collector.received == [b'{"a":1}\n', b'{"b":2}\n']
+
+
+def test_stream_lost_in_the_middle_of_window_fails(collector):
+    sink = cfld.StreamSink(make_dest(collector.path)['stream'])
+    writer = cfld.StreamWriter(sink)
+    writer.write(b'{"a":1}\n')
+    collector.wait_for(8)
+    collector.drop()
+    #the records sent over the lost connection may not have been received, so the logpull window fails
+    with pytest.raises(cfld.StreamLostError):
+        writer.write(b'{"b":2}\n')
+        writer.commit()
+
+
+def test_stream_window_is_added_to_queue_when_delivery_fails(collector, tmp_path, monkeypatch):
+    monkeypatch.setattr(cfld, "one_time", False)
+    monkeypatch.setattr(cfld, "manifest", None)
+    monkeypatch.setattr(cfld, "metrics", cfld.Metrics())
+    d = make_dest(collector.path)
+
+    def chunks():
+        yield b'{"a":1}\n'
+        collector.wait_for(8)
+        collector.drop()
+        yield b'{"b":2}\n'
+
+    result, e, failed_dest_name = cfld.write_logs_stream([d], chunks(), compressed=False)
+    assert result is False
+    assert isinstance(e, cfld.StreamLostError)
+    assert failed_dest_name == "collector"
+
+    job_queue = persistqueue.SQLiteQueue(os.path.join(str(tmp_path), "queue") + "/", auto_commit=True, multithreading=True)
+    job = {'name': None, 'label': "", 'log_type': "access", 'interval': 60, 'queue': job_queue, 'due_heap': [], 'windows_in_flight': {}, 'scheduled_until': None, 'checkpoint': None}
+    log_start_time_utc = datetime(2021, 4, 1, 12, 0, 0)
+    log_end_time_utc = datetime(2021, 4, 1, 12, 0, 59)
+    stats = cfld.new_window_stats(log_start_time_utc, log_end_time_utc)
+    reason = cfld.get_write_failure_reason(job, log_start_time_utc.isoformat() + 'Z', log_end_time_utc.isoformat() + 'Z', e, failed_dest_name)
+    cfld.handle_logpull_failure(job, stats, log_start_time_utc, log_start_time_utc, log_end_time_utc, 0, None, reason)
+
+    assert job_queue.size == 1
+    item = job_queue.get(block=False)
+    assert (item['log_start_time_utc'], item['log_end_time_utc'], item['attempts']) == (log_start_time_utc, log_end_time_utc, 1)
+
+
+def test_exit_message_does_not_break_stdout_stream(tmp_path, monkeypatch, capsys):
+    stdout_dest = {'name': "stdout", 'path': "stdout", 'codec': cfld.get_codec({})}
+    cfld.initialize_stream(stdout_dest)
+    monkeypatch.setattr(cfld, "jobs", [{'log_dest': [make_dest(os.path.join(str(tmp_path), "collector.sock")), stdout_dest]}])
+    monkeypatch.setattr(cfld, "is_exit", False)
+    cfld.graceful_terminate_async(cfld.signal.SIGTERM)
+    assert capsys.readouterr().out == ""
@@ -0,0 +1,51 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import cf_logs_downloader as cfld
+
+
+def test_split_aligned_windows_aligns_to_window_length():
+    job = {'log_type': "http"}
+    current_time = datetime(2021, 4, 1, 20, 0, 50)
+    log_start_time_utc = datetime(2021, 4, 1, 12, 0, 50)
+    windows, next_time, next_start_time_utc = cfld.split_aligned_windows(job, current_time, log_start_time_utc, datetime(2021, 4, 1, 12, 3, 10), 60)
+
+    #the first and the last window are shorter, the others start and end at a multiple of 60 seconds
+    assert [(w[1], w[2]) for w in windows] == [
+        (datetime(2021, 4, 1, 12, 0, 50), datetime(2021, 4, 1, 12, 1, 0)),
+        (datetime(2021, 4, 1, 12, 1, 0), datetime(2021, 4, 1, 12, 2, 0)),
+        (datetime(2021, 4, 1, 12, 2, 0), datetime(2021, 4, 1, 12, 3, 0)),
+        (datetime(2021, 4, 1, 12, 3, 0), datetime(2021, 4, 1, 12, 3, 10)),
+    ]
+    #the folder time follows the log start time
+    assert [w[0] - w[1] for w in windows] == [timedelta(hours=8)] * 4
+    assert next_start_time_utc == datetime(2021, 4, 1, 12, 3, 10)
+    assert next_time == datetime(2021, 4, 1, 20, 3, 10)
+
+
+def test_split_aligned_windows_never_crosses_the_hour():
+    job = {'log_type': "http"}
+    windows = cfld.split_aligned_windows(job, datetime(2021, 4, 1, 11, 50, 0), datetime(2021, 4, 1, 11, 50, 0), datetime(2021, 4, 1, 12, 30, 0), 1800)[0]
+    assert [(w[1], w[2]) for w in windows] == [
+        (datetime(2021, 4, 1, 11, 50, 0), datetime(2021, 4, 1, 12, 0, 0)),
+        (datetime(2021, 4, 1, 12, 0, 0), datetime(2021, 4, 1, 12, 30, 0)),
+    ]
+
+
+@pytest.mark.parametrize("log_type", ["access", "audit"])
+def test_split_aligned_windows_end_time_is_inclusive_for_access_and_audit(log_type):
+    job = {'log_type': log_type}
+    windows = cfld.split_aligned_windows(job, datetime(2021, 4, 1, 12, 0, 0), datetime(2021, 4, 1, 12, 0, 0), datetime(2021, 4, 1, 12, 2, 0), 60)[0]
+    assert [(w[1], w[2]) for w in windows] == [
+        (datetime(2021, 4, 1, 12, 0, 0), datetime(2021, 4, 1, 12, 0, 59)),
+        (datetime(2021, 4, 1, 12, 1, 0), datetime(2021, 4, 1, 12, 1, 59)),
+    ]
+
+
+def test_split_aligned_windows_complete_only_leaves_the_rest():
+    job = {'log_type': "http"}
+    windows, next_time, next_start_time_utc = cfld.split_aligned_windows(job, datetime(2021, 4, 1, 12, 0, 0), datetime(2021, 4, 1, 12, 0, 0), datetime(2021, 4, 1, 12, 2, 30), 60, complete_only=True)
+    assert len(windows) == 2
+    assert next_start_time_utc == datetime(2021, 4, 1, 12, 2, 0)
+    assert next_time == datetime(2021, 4, 1, 12, 2, 0)